@@ -1,12 +1,18 @@
 from django.contrib import admin
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import (
     Category, SubCategory, Brand, Color, Size, Product, ProductVariant, 
     ProductImage, Customer, Address, Order, OrderItem, Cart, CartItem, 
-    Wishlist, WishlistItem, Review, Coupon, Newsletter
+    Wishlist, WishlistItem, Review, Coupon, Newsletter, RelatedProduct,
+    BatchCheckpoint, EventHourly, SalesRollup, Task, Campaign, ProductAlert
 )
+from . import analytics, availability, tasks
 
 
 # Category Admin
@@ -134,6 +140,22 @@ class ProductAdmin(admin.ModelAdmin):
     )
     
     inlines = [ProductVariantInline, ProductImageInline]
+
+    # Kept up to date by ecommerce.availability and ecommerce.popularity; the
+    # values loaded with the form may be stale by the time it is saved
+    maintained_fields = availability.SUMMARY_FIELDS + ('sales_score', 'trend_score')
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        obj.save(update_fields=[
+            field.name for field in obj._meta.concrete_fields
+            if not field.primary_key and not field.generated and field.name not in self.maintained_fields
+        ])
+    
+    @admin.display(description='Current price', ordering='effective_price')
+    def current_price(self, obj):
+        return obj.current_price
     
     def variant_count(self, obj):
         return obj.variants.count()
@@ -348,7 +370,7 @@ class WishlistItemAdmin(admin.ModelAdmin):
 class ReviewAdmin(admin.ModelAdmin):
     list_display = [
         'product', 'customer', 'rating', 'title', 'is_verified_purchase', 
-        'is_approved', 'created_at'
+        'is_approved', 'helpful_count', 'created_at'
     ]
     list_filter = [
         'rating', 'is_verified_purchase', 'is_approved', 'created_at'
@@ -377,10 +399,12 @@ class ReviewAdmin(admin.ModelAdmin):
 @admin.register(Coupon)
 class CouponAdmin(admin.ModelAdmin):
     list_display = [
-        'code', 'discount_type', 'discount_value', 'usage_limit', 
-        'used_count', 'valid_from', 'valid_to', 'is_active'
+        'code', 'discount_type', 'discount_value', 'category', 'brand', 'usage_limit', 
+        'used_count', 'valid_from', 'valid_to', 'is_automatic', 'is_active'
     ]
-    list_filter = ['discount_type', 'is_active', 'valid_from', 'valid_to', 'created_at']
+    list_filter = ['discount_type', 'is_automatic', 'is_active', 'valid_from', 'valid_to', 'created_at']
+    list_select_related = ['category', 'brand']
+    autocomplete_fields = ['category', 'brand']
     search_fields = ['code', 'description']
     readonly_fields = ['used_count', 'created_at']
     date_hierarchy = 'valid_from'
@@ -392,9 +416,12 @@ class CouponAdmin(admin.ModelAdmin):
         ('Discount Settings', {
             'fields': (
                 'discount_type', 'discount_value', 'minimum_order_amount', 
-                'maximum_discount_amount'
+                'maximum_discount_amount', 'tiers', 'is_automatic'
             )
         }),
+        ('Scope', {
+            'fields': ('category', 'brand', 'buy_quantity', 'get_quantity')
+        }),
         ('Usage Limits', {
             'fields': ('usage_limit', 'used_count')
         }),
@@ -418,6 +445,131 @@ class NewsletterAdmin(admin.ModelAdmin):
     list_editable = ['is_active']
 
 
+# Campaign Admin
+@admin.register(Campaign)
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'sent_count', 'failed_count', 'created_at', 'finished_at']
+    list_filter = ['status']
+    search_fields = ['subject']
+    readonly_fields = ['status', 'created_at', 'started_at', 'finished_at']
+    actions = ['send']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            sent_count=Count('recipients', filter=Q(recipients__status='sent')),
+            failed_count=Count('recipients', filter=Q(recipients__status='failed')),
+        )
+
+    def sent_count(self, obj):
+        return obj.sent_count
+    sent_count.short_description = 'Sent'
+    sent_count.admin_order_field = 'sent_count'
+
+    def failed_count(self, obj):
+        return obj.failed_count
+    failed_count.short_description = 'Failed'
+    failed_count.admin_order_field = 'failed_count'
+
+    @admin.action(description='Send selected campaigns (background task)')
+    def send(self, request, queryset):
+        for campaign in queryset.exclude(status='sent'):
+            tasks.send_campaign.delay(campaign.id)
+        self.message_user(request, 'Campaigns queued; run_tasks --queue emails delivers them.')
+
+
+# Product Alert Admin
+@admin.register(ProductAlert)
+class ProductAlertAdmin(admin.ModelAdmin):
+    list_display = ['user', 'kind', 'source', 'variant', 'product', 'created_at', 'notified_at', 'notified_price']
+    list_filter = ['kind', 'source', 'created_at', 'notified_at']
+    search_fields = ['user__username', 'user__email', 'product__name', 'variant__sku']
+    raw_id_fields = ['user', 'variant', 'product']
+    list_select_related = ['user', 'variant', 'product']
+    readonly_fields = ['created_at']
+
+
+# Related Product Admin
+@admin.register(RelatedProduct)
+class RelatedProductAdmin(admin.ModelAdmin):
+    list_display = ['product', 'rank', 'related', 'score']
+    search_fields = ['product__name', 'related__name']
+    raw_id_fields = ['product', 'related']
+
+
+# Batch Checkpoint Admin
+@admin.register(BatchCheckpoint)
+class BatchCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['name', 'position', 'updated_at']
+    readonly_fields = ['updated_at']
+
+
+# Hourly Event Admin
+@admin.register(EventHourly)
+class EventHourlyAdmin(admin.ModelAdmin):
+    list_display = ['hour', 'kind', 'product', 'query', 'count']
+    list_filter = ['kind', 'hour']
+    search_fields = ['product__name', 'query']
+    date_hierarchy = 'hour'
+    raw_id_fields = ['product']
+
+
+# Task Admin
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'queue', 'status', 'priority', 'attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'queue']
+    search_fields = ['name']
+    readonly_fields = ['locked_by', 'started_at', 'finished_at', 'last_error', 'created_at']
+    actions = ['requeue']
+
+    @admin.action(description='Run selected tasks again')
+    def requeue(self, request, queryset):
+        updated = 0
+        for job in queryset.exclude(status='running'):
+            try:
+                with transaction.atomic():
+                    updated += Task.objects.filter(pk=job.pk).update(
+                        status='queued', attempts=0, run_at=timezone.now(), last_error=''
+                    )
+            except IntegrityError:
+                # An identical unique call is already queued
+                pass
+        self.message_user(request, f'{updated} tasks requeued.')
+
+
+# Sales Dashboard: the SalesRollup changelist, read from the rollups only
+@admin.register(SalesRollup)
+class SalesRollupAdmin(admin.ModelAdmin):
+    period_choices = [7, 30, 90, 365]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        if days not in self.period_choices:
+            days = 30
+
+        context = {
+            **self.admin_site.each_context(request),
+            **analytics.report(days),
+            'title': 'Sales dashboard',
+            'opts': self.model._meta,
+            'period_choices': self.period_choices,
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/sales_dashboard.html', context)
+
+
 # Customize admin site headers
 admin.site.site_header = "Ecommerce Administration"
 admin.site.site_title = "Ecommerce Admin"
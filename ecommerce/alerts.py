@@ -0,0 +1,221 @@
+"""
+Back-in-stock and price-drop alerts.
+
+Customers subscribe with a ProductAlert row. Price-drop alerts also go to
+everyone with the product in their wishlist; they are folded in as alert
+rows with source 'wishlist' when a drop happens, with one INSERT ... SELECT,
+so wishlists are never scanned on ordinary saves. Removing the wishlist item
+removes only such an alert, never one the customer subscribed to.
+
+Detection is edge-triggered. pre_save receivers note the stored stock or
+price, and post_save queues a fan_out_alerts job only when a variant's stock
+goes from zero to positive or a product's effective price goes down. Saves
+that change anything else cost one primary-key read and nothing more.
+
+fan_out_alerts splits the subscribers into id ranges of ALERTS['BATCH_SIZE']
+and queues one deliver_alerts job per range. Each batch sends over one mail
+connection, then marks its alerts as notified. Both jobs re-check stock and
+price when they run, so a variant that sold out again or a price that went
+back up sends nothing. Delivery is at least once: a batch that fails after
+sending is retried and may send again.
+
+Stock changed with queryset.update() skips the receivers; call
+stock_arrived() with those variant ids afterwards.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Customer, Product, ProductAlert, ProductVariant, Wishlist, WishlistItem
+
+
+def effective_price(product):
+    """Product.effective_price as stored after this save"""
+    return product.discount_price if product.discount_price is not None else product.base_price
+
+
+def remember_stock(sender, instance, raw=False, **kwargs):
+    """pre_save receiver for ProductVariant"""
+    if raw or instance._state.adding:
+        return
+    instance._old_stock = (
+        ProductVariant.objects.filter(pk=instance.pk).values_list('stock_quantity', flat=True).first()
+    )
+
+
+def stock_changed(sender, instance, created, raw=False, **kwargs):
+    """post_save receiver for ProductVariant: queue alerts when stock arrives"""
+    old_stock = instance.__dict__.pop('_old_stock', None)
+    if raw or created or old_stock is None:
+        return
+    if old_stock <= 0 < instance.stock_quantity:
+        stock_arrived([instance.pk])
+
+
+def remember_price(sender, instance, raw=False, **kwargs):
+    """pre_save receiver for Product"""
+    if raw or instance._state.adding:
+        return
+    instance._old_price = Product.objects.filter(pk=instance.pk).values_list('effective_price', flat=True).first()
+
+
+def price_changed(sender, instance, created, raw=False, **kwargs):
+    """post_save receiver for Product: queue alerts when the price goes down"""
+    old_price = instance.__dict__.pop('_old_price', None)
+    if raw or created or old_price is None:
+        return
+    if effective_price(instance) < old_price:
+        from .tasks import fan_out_alerts
+        fan_out_alerts.delay('price_drop', instance.pk, str(old_price))
+
+
+def stock_arrived(variant_ids):
+    from .tasks import fan_out_alerts
+    for variant_id in variant_ids:
+        fan_out_alerts.delay('back_in_stock', variant_id)
+
+
+def wishlist_item_removed(sender, instance, **kwargs):
+    """post_delete receiver for WishlistItem: stop the price alert it brought in"""
+    ProductAlert.objects.filter(
+        kind='price_drop',
+        source='wishlist',
+        product_id=instance.product_id,
+        user__customer__wishlist__id=instance.wishlist_id,
+    ).delete()
+
+
+def subscribe(user, variant=None, product=None):
+    """
+    Alert ``user`` when ``variant`` is back in stock or ``product`` gets
+    cheaper than it is now. Subscribing again re-arms a fired alert, and
+    makes a wishlist alert the customer's own.
+    """
+    if variant is not None:
+        alert, _ = ProductAlert.objects.update_or_create(
+            user=user, variant=variant,
+            defaults={'kind': 'back_in_stock', 'source': 'customer', 'notified_at': None},
+        )
+    else:
+        alert, _ = ProductAlert.objects.update_or_create(
+            user=user, product=product,
+            defaults={'kind': 'price_drop', 'source': 'customer', 'notified_price': product.current_price},
+        )
+    return alert
+
+
+def include_wishlists(product_id, price):
+    """Add price-drop alerts, armed at ``price``, for wishlist holders without one"""
+    alert = ProductAlert._meta
+    item = WishlistItem._meta
+    wishlist = Wishlist._meta
+    customer = Customer._meta
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {alert.db_table} (kind, source, user_id, product_id, created_at, notified_price) '
+            f'SELECT %s, %s, c.user_id, wi.product_id, %s, %s '
+            f'FROM {item.db_table} wi '
+            f'JOIN {wishlist.db_table} w ON w.id = wi.wishlist_id '
+            f'JOIN {customer.db_table} c ON c.id = w.customer_id '
+            f'WHERE wi.product_id = %s '
+            f'ON CONFLICT (user_id, product_id) WHERE product_id IS NOT NULL DO NOTHING',
+            [
+                'price_drop',
+                'wishlist',
+                connection.ops.adapt_datetimefield_value(timezone.now()),
+                connection.ops.adapt_decimalfield_value(Decimal(price)),
+                product_id,
+            ],
+        )
+        return cursor.rowcount
+
+
+def pending(kind, target_id):
+    """
+    Alerts still owed for the event to customers with an email address, or
+    none if the event no longer holds: the variant is out of stock again, or
+    the price is back up. Returns (alerts, target).
+    """
+    subscribers = ProductAlert.objects.exclude(user__email='').filter(user__is_active=True)
+    if kind == 'back_in_stock':
+        variant = (
+            ProductVariant.objects.select_related('product')
+            .filter(pk=target_id, stock_quantity__gt=0, is_active=True, product__is_active=True)
+            .first()
+        )
+        alerts = subscribers.filter(variant_id=target_id, notified_at__isnull=True)
+        return (alerts, variant) if variant else (ProductAlert.objects.none(), None)
+    product = Product.objects.filter(pk=target_id, is_active=True).first()
+    if product is None:
+        return ProductAlert.objects.none(), None
+    alerts = subscribers.filter(
+        Q(notified_price__isnull=True) | Q(notified_price__gt=product.current_price),
+        product_id=target_id,
+    )
+    return alerts, product
+
+
+def fan_out(kind, target_id, old_price=None, batch_size=None):
+    """Queue deliver_alerts jobs over the event's subscribers; returns how many"""
+    from .tasks import deliver_alerts
+    batch_size = batch_size or settings.ALERTS['BATCH_SIZE']
+    if kind == 'price_drop' and old_price is not None:
+        include_wishlists(target_id, old_price)
+    alerts, target = pending(kind, target_id)
+    if target is None:
+        return 0
+    ids = alerts.order_by('id').values_list('id', flat=True)
+    jobs = 0
+    chunk = []
+    for alert_id in ids.iterator(chunk_size=5000):
+        chunk.append(alert_id)
+        if len(chunk) >= batch_size:
+            deliver_alerts.delay(kind, target_id, chunk[0], chunk[-1])
+            jobs += 1
+            chunk = []
+    if chunk:
+        deliver_alerts.delay(kind, target_id, chunk[0], chunk[-1])
+        jobs += 1
+    return jobs
+
+
+def render(kind, target):
+    product = target.product if kind == 'back_in_stock' else target
+    context = {
+        'kind': kind,
+        'variant': target if kind == 'back_in_stock' else None,
+        'product': product,
+        'url': settings.NEWSLETTER['SITE_URL'] + reverse('product_detail', args=[product.slug]),
+    }
+    subject = f'{product.name} is back in stock' if kind == 'back_in_stock' else f'{product.name} is now cheaper'
+    return subject, render_to_string(f'emails/{kind}.txt', context)
+
+
+def deliver(kind, target_id, first_id, last_id):
+    """Email the pending alerts with ids in [first_id, last_id]; returns how many were sent"""
+    alerts, target = pending(kind, target_id)
+    if target is None:
+        return 0
+    batch = alerts.filter(id__gte=first_id, id__lte=last_id)
+    recipients = dict(batch.values_list('id', 'user__email'))
+    if recipients:
+        subject, body = render(kind, target)
+        from_email = settings.ALERTS['FROM_EMAIL']
+        # One message per address, all over one connection
+        messages = [
+            EmailMessage(subject, body, from_email, [email]) for email in set(recipients.values())
+        ]
+        with get_connection() as mail:
+            mail.send_messages(messages)
+    now = timezone.now()
+    if kind == 'back_in_stock':
+        ProductAlert.objects.filter(id__in=recipients).update(notified_at=now)
+    else:
+        ProductAlert.objects.filter(id__in=recipients).update(notified_at=now, notified_price=target.current_price)
+    return len(recipients)
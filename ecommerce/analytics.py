@@ -0,0 +1,229 @@
+"""
+Sales rollups: orders, units, revenue and discounts per hour and per day,
+overall and by product, category and brand.
+
+Checkout adds each new order with record_order() inside its own
+transaction. Status changes into or out of cancelled/refunded subtract or
+re-add the order through the Order pre_save/post_save receivers connected
+in apps.py. backfill() rebuilds everything from history in id-ordered
+chunks, one short transaction each, while new orders keep arriving.
+Reports read SalesRollup only and never aggregate Order/OrderItem.
+
+Revenue means two things, by dimension:
+
+- 'total' rows hold order revenue: Order.total_amount, after discounts and
+  including tax and shipping, i.e. what customers paid.
+- 'product', 'category' and 'brand' rows hold item sales: the sum of
+  OrderItem.total_price, before order discounts and without tax or
+  shipping. Their ``discounts`` column is the order discount apportioned to
+  them, so item sales minus discounts is their net.
+
+So the dimension rows don't add up to the total, and reports label them
+apart.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .models import BatchCheckpoint, Order, OrderItem, SalesRollup
+
+
+# Orders in these states are not counted as sales
+EXCLUDED_STATUSES = {'cancelled', 'refunded'}
+PERIODS = ('hour', 'day')
+CENT = Decimal('0.01')
+
+BACKFILL_POSITION = 'analytics.backfill'
+BACKFILL_END = 'analytics.backfill_end'
+
+ORDER_FIELDS = ('id', 'created_at', 'subtotal', 'discount_amount', 'total_amount')
+
+
+def bucket_start(moment, period):
+    """Start of the hour or (local) day containing ``moment``"""
+    local = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        local = local.replace(hour=0)
+    return local
+
+
+def order_deltas(orders, sign=1):
+    """
+    Rollup deltas for ``orders`` (dicts of ORDER_FIELDS), keyed by
+    (period, dimension, bucket, key_id) with [label, orders, units,
+    revenue, discounts] values. Revenue is order revenue for the 'total'
+    dimension and item sales for the others (see the module docstring).
+    Order-level discounts are split over the product, category and brand
+    rows in proportion to item totals.
+    """
+    items = defaultdict(list)
+    rows = OrderItem.objects.filter(order_id__in=[order['id'] for order in orders]).values_list(
+        'order_id', 'quantity', 'total_price',
+        'product_variant__product_id', 'product_variant__product__name',
+        'product_variant__product__category_id', 'product_variant__product__category__name',
+        'product_variant__product__brand_id', 'product_variant__product__brand__name',
+    )
+    for order_id, *item in rows:
+        items[order_id].append(item)
+
+    deltas = defaultdict(lambda: ['', 0, 0, Decimal('0'), Decimal('0')])
+    for order in orders:
+        order_items = items[order['id']]
+        share = order['discount_amount'] / order['subtotal'] if order['subtotal'] else Decimal('0')
+        per_key = {}
+        for quantity, total_price, *keys in order_items:
+            product_id, product, category_id, category, brand_id, brand = keys
+            for dimension, key_id, label in (
+                ('product', product_id, product),
+                ('category', category_id, category),
+                ('brand', brand_id, brand),
+            ):
+                entry = per_key.setdefault((dimension, key_id), [label, 1, 0, Decimal('0')])
+                entry[2] += quantity
+                entry[3] += total_price
+
+        per_key['total', 0] = [
+            '', 1, sum(item[0] for item in order_items), order['total_amount'],
+        ]
+        for period in PERIODS:
+            bucket = bucket_start(order['created_at'], period)
+            for (dimension, key_id), (label, count, units, revenue) in per_key.items():
+                if dimension == 'total':
+                    discount = order['discount_amount']
+                else:
+                    discount = (revenue * share).quantize(CENT)
+                delta = deltas[period, dimension, bucket, key_id]
+                delta[0] = label
+                delta[1] += sign * count
+                delta[2] += sign * units
+                delta[3] += sign * revenue
+                delta[4] += sign * discount
+    return deltas
+
+
+def apply_deltas(deltas):
+    """Add deltas to SalesRollup with one upsert batch"""
+    table = SalesRollup._meta.db_table
+    adapt = connection.ops.adapt_datetimefield_value
+    rows = [
+        (period, dimension, adapt(bucket), key_id, label, orders, units, str(revenue), str(discounts))
+        for (period, dimension, bucket, key_id), (label, orders, units, revenue, discounts) in deltas.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (period, dimension, bucket, key_id, label, orders, units, revenue, discounts) '
+            f'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) '
+            f'ON CONFLICT (period, dimension, bucket, key_id) DO UPDATE SET '
+            f'label = excluded.label, '
+            f'orders = {table}.orders + excluded.orders, '
+            f'units = {table}.units + excluded.units, '
+            f'revenue = {table}.revenue + excluded.revenue, '
+            f'discounts = {table}.discounts + excluded.discounts',
+            rows,
+        )
+
+
+def record_order(order, sign=1):
+    """Add (or with sign=-1, remove) one order's contribution"""
+    apply_deltas(order_deltas([{field: getattr(order, field) for field in ORDER_FIELDS}], sign))
+
+
+def backfill_pending(order_id):
+    """True while a running backfill has yet to reach ``order_id``"""
+    positions = dict(
+        BatchCheckpoint.objects.filter(name__in=[BACKFILL_POSITION, BACKFILL_END])
+        .values_list('name', 'position')
+    )
+    if BACKFILL_END not in positions:
+        return False
+    return positions.get(BACKFILL_POSITION, 0) < order_id <= positions[BACKFILL_END]
+
+
+def remember_status(sender, instance, raw=False, **kwargs):
+    """pre_save receiver: note whether the stored order currently counts"""
+    if raw or instance._state.adding:
+        return
+    instance._was_counted = (
+        Order.objects.filter(pk=instance.pk).exclude(status__in=EXCLUDED_STATUSES).exists()
+    )
+
+
+def apply_status_change(sender, instance, created, raw=False, **kwargs):
+    """post_save receiver: move the order in or out of the rollups"""
+    if created or raw or not hasattr(instance, '_was_counted'):
+        return
+    counted = instance.status not in EXCLUDED_STATUSES
+    was_counted = instance.__dict__.pop('_was_counted')
+    if counted != was_counted and not backfill_pending(instance.pk):
+        record_order(instance, 1 if counted else -1)
+
+
+def backfill(chunk_size=1000):
+    """
+    Rebuild SalesRollup from all orders. Yields (position, end) after each
+    chunk. Orders placed meanwhile are recorded live by checkout, since
+    they are newer than ``end``.
+    """
+    with transaction.atomic():
+        end = Order.objects.aggregate(last=Max('id'))['last'] or 0
+        SalesRollup.objects.all().delete()
+        BatchCheckpoint.objects.update_or_create(name=BACKFILL_END, defaults={'position': end})
+        progress, _ = BatchCheckpoint.objects.update_or_create(
+            name=BACKFILL_POSITION, defaults={'position': 0}
+        )
+
+    while progress.position < end:
+        upper = min(progress.position + chunk_size, end)
+        with transaction.atomic():
+            orders = list(
+                Order.objects.filter(id__gt=progress.position, id__lte=upper)
+                .exclude(status__in=EXCLUDED_STATUSES)
+                .values(*ORDER_FIELDS)
+            )
+            apply_deltas(order_deltas(orders))
+            progress.position = upper
+            progress.save()
+        yield upper, end
+
+    BatchCheckpoint.objects.filter(name__in=[BACKFILL_POSITION, BACKFILL_END]).delete()
+
+
+def report(days=30, top=10):
+    """Dashboard figures for the last ``days`` days, from the rollups alone"""
+    now = timezone.now()
+    since = bucket_start(now, 'day') - timedelta(days=days - 1)
+    daily = SalesRollup.objects.filter(period='day', bucket__gte=since)
+    hourly = SalesRollup.objects.filter(
+        period='hour', dimension='total', bucket__gte=bucket_start(now, 'hour') - timedelta(hours=47)
+    )
+
+    totals = daily.filter(dimension='total').aggregate(
+        orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'), discounts=Sum('discounts'),
+    )
+    leaders = {}
+    for dimension in ('category', 'brand', 'product'):
+        leaders[dimension] = list(
+            daily.filter(dimension=dimension)
+            .values('key_id')
+            .annotate(
+                label=Max('label'), orders=Sum('orders'), units=Sum('units'),
+                revenue=Sum('revenue'), discounts=Sum('discounts'),
+            )
+            .order_by('-revenue')[:top]
+        )
+    daily_totals = list(daily.filter(dimension='total').order_by('bucket'))
+    hourly_totals = list(hourly.order_by('bucket'))
+    return {
+        'days': days,
+        'since': since,
+        'totals': totals,
+        'daily': daily_totals,
+        'daily_max': max((row.revenue for row in daily_totals), default=0),
+        'hourly': hourly_totals,
+        'hourly_max': max((row.revenue for row in hourly_totals), default=0),
+        'leaders': leaders,
+    }
@@ -4,3 +4,35 @@ from django.apps import AppConfig
 class EcommerceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ecommerce'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.contrib.auth.signals import user_logged_in
+        from django.db.models.signals import post_delete, post_save, pre_save
+        from . import alerts, analytics, availability, carts, database, promotions, refdata, search, typeahead
+        from .models import (
+            Brand, Category, Color, Coupon, Order, Product, ProductImage, ProductVariant, Size, SubCategory, WishlistItem,
+        )
+
+        connection_created.connect(database.apply_sqlite_pragmas, dispatch_uid='ecommerce.sqlite_pragmas')
+        pre_save.connect(analytics.remember_status, sender=Order, dispatch_uid='ecommerce.order_status')
+        post_save.connect(analytics.apply_status_change, sender=Order, dispatch_uid='ecommerce.order_rollups')
+        user_logged_in.connect(carts.merge_cookie_cart, dispatch_uid='ecommerce.merge_cookie_cart')
+        post_save.connect(promotions.invalidate, sender=Coupon, dispatch_uid='ecommerce.promotions_save')
+        post_delete.connect(promotions.invalidate, sender=Coupon, dispatch_uid='ecommerce.promotions_delete')
+        for model in (Color, Size, Category, SubCategory, Brand, Product):
+            post_save.connect(refdata.invalidate, sender=model, dispatch_uid=f'ecommerce.refdata_save.{model.__name__}')
+            post_delete.connect(refdata.invalidate, sender=model, dispatch_uid=f'ecommerce.refdata_delete.{model.__name__}')
+        post_save.connect(availability.variant_changed, sender=ProductVariant, dispatch_uid='ecommerce.availability_save')
+        post_delete.connect(availability.variant_changed, sender=ProductVariant, dispatch_uid='ecommerce.availability_delete')
+        pre_save.connect(alerts.remember_stock, sender=ProductVariant, dispatch_uid='ecommerce.alerts_old_stock')
+        post_save.connect(alerts.stock_changed, sender=ProductVariant, dispatch_uid='ecommerce.alerts_stock')
+        pre_save.connect(alerts.remember_price, sender=Product, dispatch_uid='ecommerce.alerts_old_price')
+        post_save.connect(alerts.price_changed, sender=Product, dispatch_uid='ecommerce.alerts_price')
+        post_delete.connect(alerts.wishlist_item_removed, sender=WishlistItem, dispatch_uid='ecommerce.alerts_wishlist')
+        for model in (Product, Brand, Category):
+            post_save.connect(typeahead.catalog_changed, sender=model, dispatch_uid=f'ecommerce.typeahead_save.{model.__name__}')
+            post_delete.connect(typeahead.catalog_changed, sender=model, dispatch_uid=f'ecommerce.typeahead_delete.{model.__name__}')
+        for model in (Product, ProductImage, Brand, Category):
+            post_save.connect(search.invalidate, sender=model, dispatch_uid=f'ecommerce.search_save.{model.__name__}')
+            post_delete.connect(search.invalidate, sender=model, dispatch_uid=f'ecommerce.search_delete.{model.__name__}')
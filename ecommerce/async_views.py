@@ -0,0 +1,189 @@
+"""
+Native async versions of the JSON endpoints in views.py.
+
+Each awaits the async ORM instead of holding a worker thread for the whole
+database round-trip. The cart endpoints go through the same carts.py
+backends as the sync views, via their a-prefixed methods. Responses match
+the sync views field for field; the ASGI profile (settings_asgi) routes the
+AJAX URLs here.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.http import require_POST
+from decimal import Decimal
+
+from . import carts, events, promotions
+from .ratelimit import rate_limit
+from .models import ProductVariant
+
+
+@require_POST
+async def add_to_cart(request):
+    """Add product variant to cart"""
+    try:
+        variant_id = request.POST.get('variant_id')
+        quantity = int(request.POST.get('quantity', 1))
+
+        if not variant_id:
+            return JsonResponse({'success': False, 'message': 'Please select size and color'})
+
+        variant = await aget_object_or_404(ProductVariant, id=variant_id, is_active=True)
+
+        # Check stock
+        if variant.stock_quantity < quantity:
+            return JsonResponse({
+                'success': False,
+                'message': f'Only {variant.stock_quantity} items available'
+            })
+
+        # Database cart when signed in, cookie cart otherwise
+        cart = await carts.aget_cart(request)
+        if await cart.aquantity_of(variant.id) + quantity > variant.stock_quantity:
+            return JsonResponse({
+                'success': False,
+                'message': f'Cannot add more than {variant.stock_quantity} items'
+            })
+        await cart.aadd(variant, quantity)
+
+        user = await request.auser()
+        events.record('add_to_cart', product_id=variant.product_id, user=user, session_key=request.session.session_key)
+
+        summary = await cart.asummary()
+        return JsonResponse({
+            'success': True,
+            'message': 'Product added to cart successfully',
+            'cart_count': summary['count']
+        })
+
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': 'An error occurred'})
+
+
+@require_POST
+async def update_cart(request):
+    """Update cart item quantity"""
+    try:
+        item_id = request.POST.get('item_id')
+        quantity = int(request.POST.get('quantity', 1))
+
+        cart = await carts.aget_cart(request)
+        cart_item = await cart.aget_item(item_id)
+
+        if quantity <= 0:
+            await cart.aremove(cart_item)
+            return JsonResponse({'success': True, 'message': 'Item removed from cart'})
+
+        if quantity > cart_item.product_variant.stock_quantity:
+            return JsonResponse({
+                'success': False,
+                'message': f'Only {cart_item.product_variant.stock_quantity} items available'
+            })
+
+        await cart.aset_quantity(cart_item, quantity)
+
+        # Recalculate totals
+        summary = await cart.asummary()
+        subtotal = summary['subtotal']
+        shipping_cost = Decimal('5.00') if subtotal < 50 else Decimal('0.00')
+        total = subtotal + shipping_cost
+
+        return JsonResponse({
+            'success': True,
+            'message': 'Cart updated successfully',
+            'item_total': cart_item.total_price,
+            'subtotal': subtotal,
+            'shipping_cost': shipping_cost,
+            'total': total,
+            'cart_count': summary['count']
+        })
+
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': 'An error occurred'})
+
+
+@require_POST
+async def remove_from_cart(request):
+    """Remove item from cart"""
+    try:
+        item_id = request.POST.get('item_id')
+        cart = await carts.aget_cart(request)
+        await cart.aremove(await cart.aget_item(item_id))
+
+        return JsonResponse({'success': True, 'message': 'Item removed from cart'})
+
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': 'An error occurred'})
+
+
+@login_required
+@rate_limit('apply_coupon')
+async def apply_coupon(request):
+    """Apply coupon code via AJAX"""
+    if request.method == 'POST':
+        coupon_code = request.POST.get('coupon_code', '').strip()
+
+        if not coupon_code:
+            return JsonResponse({'success': False, 'message': 'Please enter a coupon code'})
+
+        # Unknown and expired codes are turned away before any cart work.
+        # Compiling promotions may hit the database, so the engine runs in a thread
+        error = await sync_to_async(promotions.check_code)(coupon_code)
+        if error:
+            return JsonResponse({'success': False, 'message': error})
+
+        cart = await carts.aget_cart(request)
+        items = await cart.aitems()
+        if not items:
+            return JsonResponse({'success': False, 'message': 'Invalid coupon code'})
+
+        evaluation = await sync_to_async(promotions.evaluate)(promotions.cart_lines(items), coupon_code)
+        if evaluation.error:
+            return JsonResponse({'success': False, 'message': evaluation.error})
+
+        # Discounts don't stack; an automatic promotion may beat the code
+        if evaluation.promotion is None or evaluation.promotion.code != coupon_code:
+            return JsonResponse({
+                'success': False,
+                'message': 'Your cart already has a better automatic offer, so this code was not applied',
+            })
+
+        return JsonResponse({
+            'success': True,
+            'message': 'Coupon applied successfully',
+            'discount_amount': evaluation.discount,
+            'coupon_description': evaluation.promotion.description
+        })
+
+    return JsonResponse({'success': False, 'message': 'Invalid request'})
+
+
+async def get_variant_info(request):
+    """Get variant information via AJAX"""
+    color_id = request.GET.get('color_id')
+    size_id = request.GET.get('size_id')
+    product_id = request.GET.get('product_id')
+
+    if not all([color_id, size_id, product_id]):
+        return JsonResponse({'success': False, 'message': 'Missing parameters'})
+
+    try:
+        variant = await ProductVariant.objects.select_related('product').aget(
+            product_id=product_id,
+            color_id=color_id,
+            size_id=size_id,
+            is_active=True
+        )
+
+        return JsonResponse({
+            'success': True,
+            'variant_id': variant.id,
+            'price': variant.final_price,
+            'stock': variant.stock_quantity,
+            'in_stock': variant.is_in_stock,
+            'sku': variant.sku
+        })
+
+    except ProductVariant.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'Variant not available'})
@@ -0,0 +1,97 @@
+"""
+Per-product stock availability: total stock of the active variants, an
+in-stock flag and the sets of size and color ids that have stock, stored on
+Product so listings can show and filter on them without joining
+ProductVariant.
+
+Summaries are refreshed for just the products touched: by the ProductVariant
+post_save/post_delete receivers (admin, scripts using save()), and by
+checkout after it decrements stock with UPDATE. Bulk writes that skip
+signals (bulk_create, queryset.update) should call refresh() with the
+affected product ids; ``manage.py rebuild_availability`` recomputes all.
+
+Id sets are stored as ``|3|7|12|`` rather than integer bitsets (SQLite
+integers are 64-bit and size and color ids are not bounded) and are only
+read for display. Size and color filters don't search them, since a
+``LIKE '%|7|%'`` can't use an index and scans every product. Instead they
+semi-join ProductVariant through the variant_size_stock_idx and
+variant_color_stock_idx partial indexes, which hold (size or color,
+product) for active variants in stock. SQLite keeps those up to date on
+every stock UPDATE, so the filters never lag behind a checkout.
+"""
+from collections import defaultdict
+
+from django.db import connection
+
+from .models import Product, ProductVariant
+
+
+# The Product columns refresh() writes
+SUMMARY_FIELDS = ('stock_total', 'in_stock', 'available_size_ids', 'available_color_ids')
+
+
+def encode_ids(ids):
+    return f'|{"|".join(str(pk) for pk in sorted(ids))}|' if ids else ''
+
+
+def decode_ids(value):
+    return [int(pk) for pk in value.strip('|').split('|') if pk]
+
+
+def refresh(product_ids, chunk_size=500):
+    """Recompute the summaries of ``product_ids``; returns how many were written"""
+    product_ids = sorted(set(product_ids))
+    table = Product._meta.db_table
+    written = 0
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        totals = defaultdict(int)
+        sizes = defaultdict(set)
+        colors = defaultdict(set)
+        variants = ProductVariant.objects.filter(product_id__in=chunk, is_active=True).values_list(
+            'product_id', 'size_id', 'color_id', 'stock_quantity'
+        )
+        for product_id, size_id, color_id, stock in variants:
+            if stock > 0:
+                totals[product_id] += stock
+                sizes[product_id].add(size_id)
+                colors[product_id].add(color_id)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {table} SET stock_total = %s, in_stock = %s, '
+                f'available_size_ids = %s, available_color_ids = %s WHERE id = %s',
+                [
+                    (
+                        totals[product_id],
+                        totals[product_id] > 0,
+                        encode_ids(sizes[product_id]),
+                        encode_ids(colors[product_id]),
+                        product_id,
+                    )
+                    for product_id in chunk
+                ],
+            )
+        written += len(chunk)
+    return written
+
+
+def rebuild():
+    return refresh(Product.objects.values_list('id', flat=True))
+
+
+def variant_changed(sender, instance, raw=False, **kwargs):
+    """post_save/post_delete receiver for ProductVariant"""
+    if not raw:
+        refresh([instance.product_id])
+
+
+def filter_available(products, size_id=None, color_id=None):
+    """Products in stock, optionally in a size and/or color (each on its own)"""
+    products = products.filter(in_stock=True)
+    # Matches the condition of the partial indexes, so SQLite can use them
+    stocked = ProductVariant.objects.filter(is_active=True, stock_quantity__gt=0)
+    if size_id:
+        products = products.filter(id__in=stocked.filter(size_id=size_id).values('product_id'))
+    if color_id:
+        products = products.filter(id__in=stocked.filter(color_id=color_id).values('product_id'))
+    return products
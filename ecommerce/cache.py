@@ -0,0 +1,240 @@
+"""
+Two-tier cache backend: a bounded in-process LRU (L1) in front of a shared
+cache alias (L2, file-based or Redis) that all workers see.
+
+Keys are grouped into namespaces by their first ``:``-separated part
+(``catalog:product:12`` is in ``catalog``). Each namespace has its own
+default timeout, L1 lifetime and L1 byte budget.
+
+Cross-worker invalidation is per key: every set or delete stores a fresh
+random stamp for the key in L2, next to the value. An L1 entry remembers the
+stamp it was read with, and a hit older than POLL_INTERVAL re-reads only the
+stamp and drops the entry on mismatch, so a write never costs other workers
+more than their copy of that one key. The value is written before its stamp
+and read after it, so a racing reader can only pair a new value with an old
+stamp, which costs one extra read, never a stale hit once the stamp has been
+checked. Only readers fill L1: set() drops the writer's own copy, because
+with two writers racing, L2 can end up holding one writer's value under the
+other's stamp. Random tokens rather than counters mean racing writers can't
+cancel each other out on backends without atomic incr, and l1_timeout
+bounds staleness even if a stamp expires before its value.
+"""
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+STAMP_KEY = '_stamp:%s'
+
+# CacheHandler builds one backend instance per thread, but L1 should be
+# shared by the whole process: instances with the same LOCATION share state.
+_l1_state = {}
+_l1_state_lock = threading.Lock()
+
+DEFAULT_NAMESPACE = {
+    'timeout': 300,
+    'l1_timeout': 30,
+    'max_bytes': 4 * 1024 * 1024,
+}
+
+
+class Namespace:
+    """L1 entries and counters for one key namespace"""
+
+    def __init__(self, name, timeout, l1_timeout, max_bytes):
+        self.name = name
+        self.timeout = timeout
+        self.l1_timeout = l1_timeout
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> [expires_at, data, stamp, checked_at]
+        self.bytes = 0
+        self.stats = dict.fromkeys(
+            ('l1_hits', 'l2_hits', 'misses', 'sets', 'deletes', 'evictions',
+             'invalidations', 'l2_get_seconds', 'l2_set_seconds'), 0
+        )
+
+    def drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.bytes -= len(entry[1])
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def store(self, key, data, stamp):
+        self.drop(key)
+        if len(data) > self.max_bytes:
+            return
+        now = time.monotonic()
+        self.entries[key] = [now + self.l1_timeout, data, stamp, now]
+        self.bytes += len(data)
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= len(evicted[1])
+            self.stats['evictions'] += 1
+
+    def lookup(self, key):
+        """The unexpired entry for ``key``, or None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self.drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+
+class TwoTierCache(BaseCache):
+    """
+    CACHES backend. OPTIONS:
+
+    SHARED         alias of the L2 cache (required)
+    POLL_INTERVAL  seconds an L1 hit is trusted before its stamp is re-read (default 1)
+    NAMESPACES     {name: {'timeout', 'l1_timeout', 'max_bytes'}}
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options['SHARED']
+        self.poll_interval = options.get('POLL_INTERVAL', 1.0)
+        self.namespace_config = options.get('NAMESPACES', {})
+        with _l1_state_lock:
+            self.namespaces, self.lock = _l1_state.setdefault(
+                location or self.shared_alias, ({}, threading.Lock())
+            )
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def namespace(self, key):
+        name = key.split(':', 1)[0] if ':' in key else ''
+        if name not in self.namespace_config:
+            name = ''
+        namespace = self.namespaces.get(name)
+        if namespace is None:
+            config = {**DEFAULT_NAMESPACE, **self.namespace_config.get(name, {})}
+            with self.lock:
+                namespace = self.namespaces.setdefault(name, Namespace(name or 'default', **config))
+        return namespace
+
+    def timeout_for(self, namespace, timeout):
+        return namespace.timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def stamp_key(self, key, version):
+        return STAMP_KEY % self.make_key(key, version=version)
+
+    def read_stamp(self, key, version):
+        return self.shared.get(self.stamp_key(key, version))
+
+    def write_stamp(self, key, version, timeout):
+        """Tell other workers their L1 copies of ``key`` are stale; returns the stamp"""
+        stamp = uuid.uuid4().hex
+        self.shared.set(self.stamp_key(key, version), stamp, timeout)
+        return stamp
+
+    def get(self, key, default=None, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        namespace = self.namespace(key)
+        with self.lock:
+            entry = namespace.lookup(l1_key)
+            if entry is not None and time.monotonic() - entry[3] < self.poll_interval:
+                namespace.stats['l1_hits'] += 1
+                return pickle.loads(entry[1])
+
+        start = time.perf_counter()
+        # Outside the lock, so no other cache read in the process waits on L2
+        stamp = self.read_stamp(key, version)
+        if entry is not None:
+            with self.lock:
+                if stamp == entry[2]:
+                    entry[3] = time.monotonic()
+                    namespace.stats['l1_hits'] += 1
+                    return pickle.loads(entry[1])
+                if namespace.entries.get(l1_key) is entry:
+                    namespace.drop(l1_key)
+                namespace.stats['invalidations'] += 1
+
+        sentinel = object()
+        value = self.shared.get(key, sentinel, version=version)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            namespace.stats['l2_get_seconds'] += elapsed
+            if value is sentinel:
+                namespace.stats['misses'] += 1
+                return default
+            namespace.stats['l2_hits'] += 1
+            namespace.store(l1_key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), stamp)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        namespace = self.namespace(key)
+        timeout = self.timeout_for(namespace, timeout)
+        start = time.perf_counter()
+        self.shared.set(key, value, timeout, version=version)
+        self.write_stamp(key, version, timeout)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            namespace.stats['sets'] += 1
+            namespace.stats['l2_set_seconds'] += elapsed
+            # A racing writer's stamp may land after ours; the next get() pairs them
+            namespace.drop(l1_key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        namespace = self.namespace(key)
+        timeout = self.timeout_for(namespace, timeout)
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            # Another worker may still hold a copy from before the key expired
+            self.write_stamp(key, version, timeout)
+            with self.lock:
+                namespace.stats['sets'] += 1
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        namespace = self.namespace(key)
+        return self.shared.touch(key, self.timeout_for(namespace, timeout), version=version)
+
+    def delete(self, key, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        namespace = self.namespace(key)
+        deleted = self.shared.delete(key, version=version)
+        # Only needs to outlive the other workers' L1 copies
+        self.write_stamp(key, version, namespace.l1_timeout)
+        with self.lock:
+            namespace.stats['deletes'] += 1
+            namespace.drop(l1_key)
+        return deleted
+
+    def has_key(self, key, version=None):
+        return self.shared.has_key(key, version=version)
+
+    def clear(self):
+        self.shared.clear()
+        with self.lock:
+            for namespace in self.namespaces.values():
+                namespace.clear()
+
+    def stats(self):
+        """Per-namespace counters for this process"""
+        with self.lock:
+            result = {}
+            for namespace in self.namespaces.values():
+                stats = dict(namespace.stats)
+                lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+                stats['hit_rate'] = round((stats['l1_hits'] + stats['l2_hits']) / lookups, 4) if lookups else None
+                stats['l1_entries'] = len(namespace.entries)
+                stats['l1_bytes'] = namespace.bytes
+                stats['l1_max_bytes'] = namespace.max_bytes
+                result[namespace.name] = stats
+            return {'pid': os.getpid(), 'namespaces': result}
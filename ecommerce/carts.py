@@ -0,0 +1,465 @@
+"""
+Cart backends.
+
+Signed-in shoppers keep the database Cart. Anonymous shoppers get a
+CookieCart: ``variant_id:quantity`` pairs in a signed cookie, so browsing
+and filling a cart writes nothing server-side, not even a session row.
+Both backends expose the same methods, and their lines carry the
+attributes cart.html uses. Variant data is loaded with one query when the
+cart is shown.
+
+At login the cookie cart is merged into the database cart with one upsert
+and the cookie is dropped by CartMiddleware. add_many() (bulk add, reorder)
+writes through the same upsert; both go through check_additions() first,
+which validates stock for every line with one query and caps each merged
+quantity at what the variant has left.
+
+CartMiddleware also sets ``request.cart`` (the backend) and
+``request.customer`` (Customer or None), both lazy and built at most once
+per request; the signed-in backend loads Customer and Cart with one joined
+query. Async views get the same backend from aget_cart() and call its
+a-prefixed methods: the cookie cart's touch no database, the database
+cart's run the sync methods in a thread, so both views share one code path
+for caps, upserts and cache invalidation. summary() (item count, line
+count, subtotal) is cached for CART_SUMMARY_CACHE_SECONDS and dropped on
+every mutation.
+"""
+import hashlib
+from decimal import Decimal
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.http import Http404
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject, cached_property
+
+from .models import Cart, CartItem, Customer, ProductVariant
+
+
+CART_COOKIE = 'cart'
+CART_COOKIE_SALT = 'ecommerce.carts'
+CART_COOKIE_MAX_AGE = 30 * 24 * 60 * 60
+
+LINE_RELATED = ('product_variant__product', 'product_variant__color', 'product_variant__size')
+
+SUMMARY_KEY = 'cart:summary:%s'
+CENT = Decimal('0.01')
+
+
+def unit_price(prefix=''):
+    """SQL for ProductVariant.final_price, relative to ``prefix``"""
+    return ExpressionWrapper(
+        F(f'{prefix}product__effective_price') + F(f'{prefix}price_adjustment'),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def upsert_items(cart_id, quantities, chunk_size=500):
+    """Add ``{variant_id: quantity}`` to a cart, one multi-row upsert per chunk"""
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    table = CartItem._meta.db_table
+    rows = [(cart_id, pk, qty, now, now) for pk, qty in quantities.items()]
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            cursor.execute(
+                f'INSERT INTO {table} (cart_id, product_variant_id, quantity, added_at, updated_at) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(chunk))} '
+                f'ON CONFLICT (cart_id, product_variant_id) DO UPDATE SET '
+                f'quantity = {table}.quantity + excluded.quantity, updated_at = excluded.updated_at',
+                [value for row in chunk for value in row],
+            )
+    cache.delete(SUMMARY_KEY % cart_id)
+
+
+def cached_summary(key, compute):
+    timeout = settings.CART_SUMMARY_CACHE_SECONDS
+    if not timeout:
+        return compute()
+    summary = cache.get(key)
+    if summary is None:
+        summary = compute()
+        cache.set(key, summary, timeout)
+    return summary
+
+
+def empty_summary():
+    return {'count': 0, 'lines': 0, 'subtotal': Decimal('0.00')}
+
+
+class CartLine:
+    """Cookie-cart counterpart of CartItem; ``id`` is the variant id"""
+
+    def __init__(self, product_variant, quantity):
+        self.id = product_variant.id
+        self.product_variant = product_variant
+        self.quantity = quantity
+
+    @property
+    def total_price(self):
+        return self.product_variant.final_price * self.quantity
+
+
+class CookieCart:
+    """Anonymous cart held in a signed cookie"""
+
+    customer = None
+
+    def __init__(self, request):
+        self.lines = self.load(request)
+        self.dirty = False
+
+    @staticmethod
+    def load(request):
+        """{variant_id: quantity} from the cookie; tampered or expired cookies read as empty"""
+        raw = request.get_signed_cookie(
+            CART_COOKIE, default='', salt=CART_COOKIE_SALT, max_age=CART_COOKIE_MAX_AGE
+        )
+        lines = {}
+        for part in raw.split(','):
+            variant_id, sep, quantity = part.partition(':')
+            if sep and variant_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+                lines[int(variant_id)] = int(quantity)
+        return lines
+
+    def quantity_of(self, variant_id):
+        return self.lines.get(int(variant_id), 0)
+
+    async def aquantity_of(self, variant_id):
+        return self.quantity_of(variant_id)
+
+    def quantities(self, variant_ids):
+        return {pk: self.lines[pk] for pk in variant_ids if pk in self.lines}
+
+    def add(self, variant, quantity):
+        self.lines[variant.id] = self.quantity_of(variant.id) + quantity
+        self.dirty = True
+
+    async def aadd(self, variant, quantity):
+        self.add(variant, quantity)
+
+    def add_many(self, quantities):
+        for pk, quantity in quantities.items():
+            self.lines[pk] = self.lines.get(pk, 0) + quantity
+        self.dirty = True
+
+    def line_queryset(self):
+        return ProductVariant.objects.select_related('product', 'color', 'size')
+
+    def get_item(self, item_id):
+        if not str(item_id).isdigit() or int(item_id) not in self.lines:
+            raise Http404('No such cart item')
+        variant = get_object_or_404(self.line_queryset(), id=item_id)
+        return CartLine(variant, self.lines[variant.id])
+
+    async def aget_item(self, item_id):
+        if not str(item_id).isdigit() or int(item_id) not in self.lines:
+            raise Http404('No such cart item')
+        variant = await aget_object_or_404(self.line_queryset(), id=item_id)
+        return CartLine(variant, self.lines[variant.id])
+
+    def set_quantity(self, item, quantity):
+        self.lines[item.id] = item.quantity = quantity
+        self.dirty = True
+
+    async def aset_quantity(self, item, quantity):
+        self.set_quantity(item, quantity)
+
+    def remove(self, item):
+        self.lines.pop(item.id, None)
+        self.dirty = True
+
+    async def aremove(self, item):
+        self.remove(item)
+
+    def build_lines(self, variants):
+        variants = {variant.id: variant for variant in variants}
+        if variants.keys() != self.lines.keys():
+            # Forget variants that were deactivated or deleted since
+            self.lines = {pk: qty for pk, qty in self.lines.items() if pk in variants}
+            self.dirty = True
+        return [CartLine(variants[pk], qty) for pk, qty in self.lines.items()]
+
+    def items(self):
+        if not self.lines:
+            return []
+        return self.build_lines(self.line_queryset().filter(id__in=self.lines, is_active=True))
+
+    async def aitems(self):
+        if not self.lines:
+            return []
+        variants = self.line_queryset().filter(id__in=self.lines, is_active=True)
+        return self.build_lines([variant async for variant in variants])
+
+    @property
+    def total_items(self):
+        return sum(self.lines.values())
+
+    def summary(self):
+        if not self.lines:
+            return empty_summary()
+        # The key changes with the contents, so mutations need no invalidation
+        contents = ','.join(f'{pk}:{qty}' for pk, qty in sorted(self.lines.items()))
+        key = SUMMARY_KEY % ('anon:' + hashlib.sha1(contents.encode()).hexdigest())
+        return cached_summary(key, self.compute_summary)
+
+    async def asummary(self):
+        return await sync_to_async(self.summary)()
+
+    def compute_summary(self):
+        prices = dict(
+            ProductVariant.objects.filter(id__in=self.lines, is_active=True)
+            .values_list('id', unit_price())
+        )
+        return {
+            'count': sum(qty for pk, qty in self.lines.items() if pk in prices),
+            'lines': len(prices),
+            'subtotal': sum((prices[pk] * qty for pk, qty in self.lines.items() if pk in prices), Decimal('0')).quantize(CENT),
+        }
+
+    def clear(self):
+        self.lines = {}
+        self.dirty = True
+
+    def persist(self, response):
+        if not self.dirty:
+            return
+        if self.lines:
+            response.set_signed_cookie(
+                CART_COOKIE,
+                ','.join(f'{pk}:{qty}' for pk, qty in self.lines.items()),
+                salt=CART_COOKIE_SALT,
+                max_age=CART_COOKIE_MAX_AGE,
+                httponly=True,
+                samesite='Lax',
+            )
+        else:
+            response.delete_cookie(CART_COOKIE, samesite='Lax')
+
+
+class DatabaseCart:
+    """Signed-in customer's Cart; Customer and Cart rows are created on first add"""
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def customer(self):
+        """The user's Customer with its Cart joined in, or None"""
+        return Customer.objects.select_related('cart').filter(user=self.user).first()
+
+    @property
+    def cart(self):
+        """The existing Cart, or None"""
+        try:
+            return self.customer.cart if self.customer else None
+        except Cart.DoesNotExist:
+            return None
+
+    def ensure_cart(self):
+        cart = self.cart
+        if cart is None:
+            if self.customer is None:
+                self.customer, created = Customer.objects.get_or_create(user=self.user)
+            cart, created = Cart.objects.get_or_create(customer=self.customer)
+            self.customer.cart = cart
+        return cart
+
+    def item_queryset(self):
+        cart = self.cart
+        return CartItem.objects.filter(cart=cart) if cart else CartItem.objects.none()
+
+    def changed(self):
+        cart = self.cart
+        if cart is not None:
+            cache.delete(SUMMARY_KEY % cart.id)
+
+    def quantity_of(self, variant_id):
+        return self.item_queryset().filter(product_variant_id=variant_id).values_list('quantity', flat=True).first() or 0
+
+    def quantities(self, variant_ids):
+        return dict(
+            self.item_queryset().filter(product_variant_id__in=variant_ids)
+            .values_list('product_variant_id', 'quantity')
+        )
+
+    def add_many(self, quantities):
+        upsert_items(self.ensure_cart().id, quantities)
+
+    def add(self, variant, quantity):
+        cart_item, created = CartItem.objects.get_or_create(
+            cart=self.ensure_cart(),
+            product_variant=variant,
+            defaults={'quantity': quantity}
+        )
+        if not created:
+            cart_item.quantity += quantity
+            cart_item.save()
+        self.changed()
+
+    def get_item(self, item_id):
+        return get_object_or_404(self.item_queryset().select_related(*LINE_RELATED), id=item_id)
+
+    def set_quantity(self, item, quantity):
+        item.quantity = quantity
+        item.save()
+        self.changed()
+
+    def remove(self, item):
+        item.delete()
+        self.changed()
+
+    def clear(self):
+        self.item_queryset().delete()
+        self.changed()
+
+    def items(self):
+        return list(self.item_queryset().select_related(*LINE_RELATED))
+
+    @property
+    def total_items(self):
+        return self.summary()['count']
+
+    def summary(self):
+        cart = self.cart
+        if cart is None:
+            return empty_summary()
+        return cached_summary(SUMMARY_KEY % cart.id, self.compute_summary)
+
+    def compute_summary(self):
+        totals = self.item_queryset().aggregate(
+            count=Sum('quantity'),
+            lines=Count('id'),
+            subtotal=Sum(F('quantity') * unit_price('product_variant__')),
+        )
+        return {
+            'count': totals['count'] or 0,
+            'lines': totals['lines'],
+            'subtotal': (totals['subtotal'] or Decimal('0')).quantize(CENT),
+        }
+
+    # Async views share the sync code path, run in a thread
+    aquantity_of = sync_to_async(quantity_of)
+    aadd = sync_to_async(add)
+    aget_item = sync_to_async(get_item)
+    aset_quantity = sync_to_async(set_quantity)
+    aremove = sync_to_async(remove)
+    aitems = sync_to_async(items)
+    asummary = sync_to_async(summary)
+
+    def persist(self, response):
+        pass
+
+
+def get_cart(request):
+    """The request's cart backend, built once per request"""
+    cart = getattr(request, '_cart', None)
+    if cart is None:
+        cart = DatabaseCart(request.user) if request.user.is_authenticated else CookieCart(request)
+        request._cart = cart
+    return cart
+
+
+async def aget_cart(request):
+    """get_cart() for async views; callers use the backends' a-prefixed methods"""
+    cart = getattr(request, '_cart', None)
+    if cart is None:
+        user = await request.auser()
+        cart = DatabaseCart(user) if user.is_authenticated else CookieCart(request)
+        request._cart = cart
+    return cart
+
+
+def merge_cookie_cart(sender, request, user, **kwargs):
+    """user_logged_in receiver: fold the anonymous cart into the customer's Cart"""
+    if request is None:
+        return
+    lines = CookieCart.load(request)
+    request._cart = None
+    if not lines:
+        return
+    request._clear_cart_cookie = True
+
+    backend = DatabaseCart(user)
+    cart = backend.ensure_cart()
+    # Inactive variants are dropped and quantities capped at stock
+    addable, problems = check_additions(backend, lines)
+    if addable:
+        upsert_items(cart.id, addable)
+
+
+def check_additions(cart, requested):
+    """
+    Stock check for adding ``{variant_id: quantity}`` to ``cart``: one
+    variant query plus one cart lookup. Returns (addable, problems) where
+    ``addable`` maps variant ids to the quantity that fits (capped at stock)
+    and ``problems`` maps variant ids to a message for anything cut short.
+    """
+    stock = dict(
+        ProductVariant.objects.filter(id__in=requested, is_active=True)
+        .values_list('id', 'stock_quantity')
+    )
+    in_cart = cart.quantities(list(stock))
+    addable = {}
+    problems = {}
+    for pk, quantity in requested.items():
+        if pk not in stock:
+            problems[pk] = 'No longer available'
+            continue
+        room = stock[pk] - in_cart.get(pk, 0)
+        if room <= 0:
+            problems[pk] = f'Cannot add more than {stock[pk]} items'
+            continue
+        if quantity > room:
+            problems[pk] = f'Only {room} more available'
+        addable[pk] = min(quantity, room)
+    return addable, problems
+
+
+def get_customer(request):
+    """The signed-in user's Customer (loaded with the cart), or None"""
+    return get_cart(request).customer
+
+
+class CartMiddleware:
+    """
+    Adds lazy ``request.cart`` and ``request.customer`` and writes cookie-cart
+    changes to the response. Place after AuthenticationMiddleware. Async
+    views use aget_cart() instead, since the lazy objects resolve the user
+    synchronously.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.process_request(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        self.process_request(request)
+        return self.process_response(request, await self.get_response(request))
+
+    def process_request(self, request):
+        request.cart = SimpleLazyObject(lambda: get_cart(request))
+        # Falsy, not None, for anonymous users and users without a Customer
+        request.customer = SimpleLazyObject(lambda: get_customer(request))
+
+    def process_response(self, request, response):
+        if getattr(request, '_clear_cart_cookie', False):
+            response.delete_cookie(CART_COOKIE, samesite='Lax')
+        cart = getattr(request, '_cart', None)
+        if cart is not None:
+            cart.persist(response)
+        return response
@@ -0,0 +1,69 @@
+"""
+SQLite tuning: per-connection PRAGMAs, per-purpose transaction lock modes and
+the statistics reported by the ``db_maintenance`` command.
+"""
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """connection_created receiver applying settings.SQLITE_PRAGMAS"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@contextmanager
+def atomic(purpose=None, using=None):
+    """
+    ``transaction.atomic()`` whose outermost BEGIN uses the SQLite lock mode
+    configured for ``purpose`` in settings.SQLITE_TRANSACTION_MODES.
+
+    IMMEDIATE takes the write lock up front, so two checkouts queue on
+    busy_timeout instead of both reading and then failing to upgrade their
+    lock with "database is locked".
+    """
+    using = using or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    mode = settings.SQLITE_TRANSACTION_MODES.get(purpose)
+    if connection.vendor != 'sqlite' or not mode or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # transaction_mode is reset from OPTIONS on connect, so connect first
+    connection.ensure_connection()
+    default_mode = connection.transaction_mode
+    connection.transaction_mode = mode
+    try:
+        block = transaction.atomic(using=using)
+        block.__enter__()
+    finally:
+        connection.transaction_mode = default_mode
+    try:
+        yield
+    except BaseException as exc:
+        if not block.__exit__(type(exc), exc, exc.__traceback__):
+            raise
+    else:
+        block.__exit__(None, None, None)
+
+
+def sqlite_stats(using=None):
+    """Page, freelist and file size figures for a SQLite database"""
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    stats = {}
+    with connection.cursor() as cursor:
+        for pragma in ('page_size', 'page_count', 'freelist_count', 'journal_mode', 'auto_vacuum'):
+            cursor.execute(f'PRAGMA {pragma}')
+            stats[pragma] = cursor.fetchone()[0]
+    path = str(connection.settings_dict['NAME'])
+    stats['file_size'] = os.path.getsize(path) if os.path.exists(path) else 0
+    wal_path = path + '-wal'
+    stats['wal_size'] = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    return stats
@@ -0,0 +1,196 @@
+"""
+Write-behind ingestion of storefront events: product views, searches and
+add-to-cart.
+
+record() only appends a tuple to a bounded in-process deque, so the request
+path never waits on the database. A daemon thread per worker drains the
+buffer every FLUSH_SECONDS, or as soon as BATCH_SIZE events are waiting,
+and writes each batch with one bulk_create plus an upsert of the matching
+EventHourly rows in the same transaction. Product views are also folded
+into popularity's trend_score from there.
+
+When the flusher falls behind, the deque keeps the newest MAX_BUFFERED
+events and the oldest are dropped; stats() reports how many.
+"""
+import atexit
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+from . import popularity
+from .models import Event, EventHourly
+
+
+logger = logging.getLogger(__name__)
+
+QUERY_MAX_LENGTH = Event._meta.get_field('query').max_length
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace so "Red  Shoes" and "red shoes" roll up together"""
+    return re.sub(r'\s+', ' ', query).strip().lower()[:QUERY_MAX_LENGTH]
+
+
+class EventBuffer:
+    """Bounded per-process queue of pending events and its flusher thread"""
+
+    def __init__(self):
+        self.events = None
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        # Approximate: bumped without a lock on the request path
+        self.counters = Counter()
+
+    @property
+    def config(self):
+        return settings.EVENTS
+
+    def add(self, event):
+        self.ensure_flusher()
+        if len(self.events) >= self.events.maxlen:
+            self.counters['dropped'] += 1
+        self.events.append(event)
+        self.counters['recorded'] += 1
+        if len(self.events) >= self.config['BATCH_SIZE']:
+            self.wakeup.set()
+
+    def ensure_flusher(self):
+        pid = os.getpid()
+        if self.pid == pid and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid == pid and self.thread.is_alive():
+                return
+            if self.pid != pid:
+                # Fresh buffer after a fork: the parent still owns its copy
+                self.events = deque(maxlen=self.config['MAX_BUFFERED'])
+                self.pid = pid
+            self.thread = threading.Thread(target=self.run, name='event-flusher', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.config['FLUSH_SECONDS'])
+            self.wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                connections.close_all()
+
+    def take(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.events.popleft())
+            except IndexError:
+                break
+        return batch
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of events written"""
+        if self.events is None:
+            return 0
+        written = 0
+        while batch := self.take(self.config['BATCH_SIZE']):
+            try:
+                write_batch(batch)
+            except Exception:
+                self.counters['failed'] += len(batch)
+                logger.exception('Dropped a batch of %d events', len(batch))
+                continue
+            written += len(batch)
+            self.counters['written'] += len(batch)
+            self.counters['batches'] += 1
+        return written
+
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'buffered': len(self.events) if self.events is not None else 0,
+            'max_buffered': self.config['MAX_BUFFERED'],
+            **self.counters,
+        }
+
+
+def write_batch(batch):
+    """Insert raw events and add them to the hourly rollups"""
+    rows = []
+    hourly = Counter()
+    views = Counter()
+    for kind, product_id, query, user_id, session_key, at in batch:
+        created_at = datetime.fromtimestamp(at, timezone.utc)
+        rows.append(Event(
+            kind=kind,
+            product_id=product_id,
+            query=query,
+            user_id=user_id,
+            session_key=session_key,
+            created_at=created_at,
+        ))
+        hour = created_at.replace(minute=0, second=0, microsecond=0)
+        hourly[kind, hour, product_id, query] += 1
+        if kind == 'view':
+            views[product_id] += 1
+
+    with transaction.atomic():
+        Event.objects.bulk_create(rows)
+        upsert_hourly(hourly)
+        popularity.record_views(views)
+
+
+def upsert_hourly(counts):
+    """Add ``{(kind, hour, product_id, query): count}`` to EventHourly"""
+    table = EventHourly._meta.db_table
+    adapt = connection.ops.adapt_datetimefield_value
+    by_product = []
+    by_query = []
+    for (kind, hour, product_id, query), count in counts.items():
+        row = (kind, adapt(hour), product_id, query, count)
+        (by_product if product_id else by_query).append(row)
+
+    # Conflict targets must match the partial unique constraints on EventHourly
+    targets = [
+        (by_product, 'kind, hour, product_id', 'product_id IS NOT NULL'),
+        (by_query, 'kind, hour, query', 'product_id IS NULL'),
+    ]
+    with connection.cursor() as cursor:
+        for rows, columns, condition in targets:
+            if rows:
+                cursor.executemany(
+                    f'INSERT INTO {table} (kind, hour, product_id, query, count) '
+                    f'VALUES (%s, %s, %s, %s, %s) '
+                    f'ON CONFLICT ({columns}) WHERE {condition} '
+                    f'DO UPDATE SET count = {table}.count + excluded.count',
+                    rows,
+                )
+
+
+buffer = EventBuffer()
+atexit.register(buffer.flush)
+
+
+def record(kind, product_id=None, query='', user=None, session_key=None):
+    """Queue an event; never touches the database"""
+    buffer.add((
+        kind,
+        product_id,
+        query,
+        getattr(user, 'pk', None),
+        session_key or '',
+        time.time(),
+    ))
+
+
+def record_search(query, user=None, session_key=None):
+    query = normalize_query(query)
+    if query:
+        record('search', query=query, user=user, session_key=session_key)
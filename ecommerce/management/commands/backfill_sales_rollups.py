@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce import analytics
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the hourly and daily sales rollups from order history in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Order ids per transaction',
+        )
+
+    def handle(self, *args, **options):
+        end = 0
+        for position, end in analytics.backfill(options['chunk_size']):
+            self.stdout.write(f'  orders up to #{position} of #{end}')
+        self.stdout.write(self.style.SUCCESS(f'Sales rollups rebuilt through order #{end}.'))
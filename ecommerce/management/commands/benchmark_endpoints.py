@@ -0,0 +1,102 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test a running server: requests/sec and latency percentiles at a '
+        'given concurrency. Run it against `gunicorn mkurugenzisite.wsgi` and '
+        '`uvicorn mkurugenzisite.asgi:application` to compare the WSGI and '
+        'ASGI paths.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='e.g. http://127.0.0.1:8000/ajax/variant-info/?color_id=1&size_id=1&product_id=1')
+        parser.add_argument('--concurrency', type=int, default=200, help='Open connections (default: 200)')
+        parser.add_argument('--requests', type=int, default=10000, help='Total requests (default: 10000)')
+        parser.add_argument('--cookie', default='', help='Cookie header, e.g. "sessionid=..."')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Only plain http:// URLs are supported.')
+        latencies, errors, elapsed = asyncio.run(self.run(url, options))
+        if not latencies:
+            raise CommandError(f'All {errors} requests failed.')
+
+        latencies.sort()
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(f'requests     {len(latencies)} ok, {errors} failed')
+        self.stdout.write(f'throughput   {len(latencies) / elapsed:.0f} req/s')
+        self.stdout.write(f'mean         {statistics.fmean(latencies) * 1000:.1f} ms')
+        for p in (0.5, 0.9, 0.99, 0.999):
+            self.stdout.write(f'p{p * 100:<11g} {percentile(p):.1f} ms')
+
+    async def run(self, url, options):
+        target = url.path + (f'?{url.query}' if url.query else '')
+        request = (
+            f'GET {target or "/"} HTTP/1.1\r\n'
+            f'Host: {url.netloc}\r\n'
+            + (f'Cookie: {options["cookie"]}\r\n' if options['cookie'] else '')
+            + '\r\n'
+        ).encode()
+        remaining = options['requests']
+        latencies = []
+        errors = 0
+
+        async def client():
+            nonlocal remaining, errors
+            reader = writer = None
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+                    writer.write(request)
+                    status, keep_alive = await self.read_response(reader)
+                    if status >= 400:
+                        errors += 1
+                    else:
+                        latencies.append(time.perf_counter() - start)
+                    if not keep_alive:
+                        writer.close()
+                        writer = None
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    writer = None
+            if writer is not None:
+                writer.close()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+        return latencies, errors, time.perf_counter() - start
+
+    async def read_response(self, reader):
+        """Read one HTTP/1.1 response; returns (status, keep_alive)"""
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await reader.read()
+            return status, False
+        return status, headers.get('connection', '').lower() != 'close'
@@ -0,0 +1,112 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ecommerce import promotions
+from ecommerce.models import Coupon
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the promotions engine on synthetic carts against a synthetic set '
+        'of active promotions, next to a naive evaluation that checks every '
+        'promotion against every line. Nothing is written to the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--promotions', type=int, default=1000, help='Active automatic promotions (default: 1000)')
+        parser.add_argument('--lines', type=int, default=100, help='Lines per cart (default: 100)')
+        parser.add_argument('--carts', type=int, default=200, help='Carts to evaluate (default: 200)')
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--brands', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        coupons = self.coupons(rng, options)
+
+        start = time.perf_counter()
+        engine = promotions.Engine('benchmark', coupons)
+        compile_seconds = time.perf_counter() - start
+
+        carts = [self.cart(rng, options) for _ in range(options['carts'])]
+        compiled = []
+        for lines in carts:
+            start = time.perf_counter()
+            engine.evaluate(lines)
+            compiled.append(time.perf_counter() - start)
+        naive = []
+        for lines, expected in zip(carts[:20], [engine.evaluate(lines).discount for lines in carts[:20]]):
+            start = time.perf_counter()
+            discount = self.naive(engine, lines)
+            naive.append(time.perf_counter() - start)
+            assert discount == expected, (discount, expected)
+
+        self.stdout.write(f'promotions   {len(engine)}, {options["lines"]} lines per cart')
+        self.stdout.write(f'compile      {compile_seconds * 1000:.1f} ms')
+        for label, timings in (('engine', compiled), ('naive', naive)):
+            timings.sort()
+            self.stdout.write(
+                f'{label:<12} mean {statistics.fmean(timings) * 1000:.2f} ms, '
+                f'p99 {timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000:.2f} ms '
+                f'over {len(timings)} carts'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Engine is {statistics.fmean(naive) / statistics.fmean(compiled):.0f}x faster than the naive pass.'
+        ))
+
+    def coupons(self, rng, options):
+        now = timezone.now()
+        coupons = []
+        for i in range(options['promotions']):
+            kind = rng.choice(['percentage', 'percentage', 'fixed', 'buy_x_get_y'])
+            coupons.append(Coupon(
+                id=i + 1,
+                code=f'BENCH{i}',
+                discount_type=kind,
+                discount_value=Decimal(100 if kind == 'buy_x_get_y' else rng.choice([5, 10, 15, 20])),
+                minimum_order_amount=Decimal(rng.choice([0, 0, 50, 100])),
+                maximum_discount_amount=rng.choice([None, Decimal('50.00')]),
+                category_id=rng.choice([None, rng.randint(1, options['categories'])]),
+                brand_id=rng.choice([None, None, rng.randint(1, options['brands'])]),
+                buy_quantity=2 if kind == 'buy_x_get_y' else 0,
+                get_quantity=1 if kind == 'buy_x_get_y' else 0,
+                tiers=[[100, 15], [250, 25]] if kind == 'percentage' and rng.random() < 0.3 else [],
+                valid_from=now - timedelta(days=1),
+                valid_to=now + timedelta(days=1),
+                is_automatic=True,
+            ))
+        return coupons
+
+    def cart(self, rng, options):
+        return [
+            (
+                rng.randint(1, options['categories']),
+                rng.randint(1, options['brands']),
+                Decimal(rng.randint(500, 20000)) / 100,
+                rng.randint(1, 3),
+            )
+            for _ in range(options['lines'])
+        ]
+
+    def naive(self, engine, lines):
+        """Every promotion scans every line, as the per-coupon view code did"""
+        now = timezone.now()
+        subtotal = sum(price * quantity for category_id, brand_id, price, quantity in lines)
+        best = Decimal('0')
+        for promotion in engine.by_code.values():
+            if subtotal < promotion.minimum or not promotion.is_available(now):
+                continue
+            category_id, brand_id = promotion.scope
+            matching = [
+                line for line in lines
+                if category_id in (None, line[0]) and brand_id in (None, line[1])
+            ]
+            cart = promotions.CartLines(matching)
+            best = max(best, promotion.discount(cart))
+        return best
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent read/write throughput of stock vs tuned SQLite settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Reader threads (default: 8)')
+        parser.add_argument('--writers', type=int, default=4, help='Writer threads (default: 4)')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration per run (default: 5)')
+        parser.add_argument('--rows', type=int, default=20000, help='Rows to seed (default: 20000)')
+
+    def handle(self, *args, **options):
+        # What Django gives you out of the box: rollback journal, 5 s timeout
+        stock = {'journal_mode': 'DELETE', 'busy_timeout': 5000}
+        runs = [
+            ('stock', stock, 'DEFERRED'),
+            ('tuned', settings.SQLITE_PRAGMAS, settings.SQLITE_TRANSACTION_MODES.get('checkout', 'DEFERRED')),
+        ]
+        self.stdout.write(f'{"run":<8} {"reads/s":>10} {"writes/s":>10} {"locked errors":>14}')
+        for label, pragmas, mode in runs:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                self.seed(path, pragmas, options['rows'])
+                reads, writes, errors = self.run(path, pragmas, mode, options)
+            seconds = options['seconds']
+            self.stdout.write(f'{label:<8} {reads / seconds:>10.0f} {writes / seconds:>10.0f} {errors:>14}')
+
+    def connect(self, path, pragmas):
+        # timeout=0 leaves lock waiting entirely to PRAGMA busy_timeout
+        conn = sqlite3.connect(path, timeout=0, isolation_level=None, check_same_thread=False)
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def seed(self, path, pragmas, rows):
+        conn = self.connect(path, pragmas)
+        conn.execute('CREATE TABLE variant (id INTEGER PRIMARY KEY, stock INTEGER NOT NULL)')
+        conn.execute('CREATE TABLE orderitem (id INTEGER PRIMARY KEY, variant_id INTEGER, quantity INTEGER)')
+        conn.execute('BEGIN')
+        conn.executemany('INSERT INTO variant (stock) VALUES (?)', ((1000,) for _ in range(rows)))
+        conn.execute('COMMIT')
+        conn.close()
+
+    def run(self, path, pragmas, mode, options):
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        rows = options['rows']
+        # Connect up front; PRAGMAs themselves can hit a lock once writers run
+        readers = [self.connect(path, pragmas) for _ in range(options['readers'])]
+        writers = [self.connect(path, pragmas) for _ in range(options['writers'])]
+        deadline = time.perf_counter() + options['seconds']
+
+        def reader(conn, seed):
+            done = errors = 0
+            i = seed
+            while time.perf_counter() < deadline:
+                try:
+                    conn.execute(
+                        'SELECT SUM(stock) FROM variant WHERE id BETWEEN ? AND ?', (i % rows, i % rows + 200)
+                    ).fetchone()
+                    done += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+                i += 7919
+            conn.close()
+            with lock:
+                counts['reads'] += done
+                counts['errors'] += errors
+
+        def writer(conn, seed):
+            # Mimics checkout: read stock, insert an order line, decrement
+            done = errors = 0
+            i = seed
+            while time.perf_counter() < deadline:
+                variant_id = i % rows + 1
+                try:
+                    conn.execute(f'BEGIN {mode}')
+                    conn.execute('SELECT stock FROM variant WHERE id = ?', (variant_id,)).fetchone()
+                    conn.execute('INSERT INTO orderitem (variant_id, quantity) VALUES (?, 1)', (variant_id,))
+                    conn.execute('UPDATE variant SET stock = stock - 1 WHERE id = ?', (variant_id,))
+                    conn.execute('COMMIT')
+                    done += 1
+                except sqlite3.OperationalError:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    errors += 1
+                i += 104729
+            conn.close()
+            with lock:
+                counts['writes'] += done
+                counts['errors'] += errors
+
+        threads = [threading.Thread(target=reader, args=(conn, n)) for n, conn in enumerate(readers)]
+        threads += [threading.Thread(target=writer, args=(conn, n)) for n, conn in enumerate(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counts['reads'], counts['writes'], counts['errors']
@@ -0,0 +1,140 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce import search, typeahead
+
+
+BRANDS = [
+    'Nike', 'Adidas', 'Puma', 'Reebok', 'New Balance', 'Asics', 'Converse', 'Vans', 'Fila', 'Skechers',
+    'Levis', 'Zara', 'Mango', 'Gucci', 'Prada', 'Uniqlo', 'Timberland', 'Clarks', 'Lacoste', 'Diesel',
+]
+WORDS = [
+    'air', 'max', 'classic', 'runner', 'pro', 'street', 'slim', 'fit', 'leather', 'canvas', 'sport', 'trail',
+    'comfort', 'urban', 'retro', 'light', 'ultra', 'boost', 'high', 'low', 'suede', 'denim', 'cotton', 'wool',
+    'sneaker', 'boot', 'sandal', 'jacket', 'dress', 'shirt', 'hoodie', 'jeans', 'skirt', 'coat', 'loafer',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Build an autocomplete snapshot of synthetic product names in a temporary '
+        'file and time prefix lookups and typo-tolerant search corrections against '
+        'it. Nothing is written to the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=1_000_000, help='Synthetic products (default: 1000000)')
+        parser.add_argument('--queries', type=int, default=20000, help='Lookups to time (default: 20000)')
+        parser.add_argument('--vocabulary', type=int, default=20000, help='Distinct made-up words in names (default: 20000)')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        entries = self.entries(rng, options['entries'], self.vocabulary(rng, options['vocabulary']))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'typeahead.idx')
+            start = time.perf_counter()
+            typeahead.Writer(entries).write(path)
+            build_seconds = time.perf_counter() - start
+            size = os.path.getsize(path)
+
+            start = time.perf_counter()
+            index = typeahead.Index(path)
+            open_seconds = time.perf_counter() - start
+
+            labels = [entry[3] for entry in rng.sample(entries, min(len(entries), 5000))]
+            queries = []
+            for _ in range(options['queries']):
+                key = rng.choice(sorted(typeahead.suffixes(rng.choice(labels))))
+                queries.append(key[:rng.randint(1, min(len(key), 12))])
+
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                index.complete(query)
+                timings.append(time.perf_counter() - start)
+            self.check_results(index, rng, queries[:5])
+
+            words = [index.word(rng.randrange(len(index.word_offsets) - 1)) for _ in range(options['queries'] // 10)]
+            fuzzy = []
+            corrected = 0
+            for word in words:
+                typo = self.typo(rng, word)
+                start = time.perf_counter()
+                correction = search.fuzzy(typo, index)
+                fuzzy.append(time.perf_counter() - start)
+                corrected += correction is not None and word in correction.query.split(' ')
+
+        timings.sort()
+        self.stdout.write(f'entries      {len(index)}, keys {index.key_count}, top lists {len(index.top_ranges)}')
+        self.stdout.write(f'build        {build_seconds:.1f} s, {size / 1024 / 1024:.1f} MB file, open {open_seconds * 1000:.2f} ms')
+        self.stdout.write(
+            f'lookup       mean {statistics.fmean(timings) * 1000:.3f} ms, '
+            f'p50 {self.percentile(timings, 0.5) * 1000:.3f} ms, '
+            f'p99 {self.percentile(timings, 0.99) * 1000:.3f} ms, '
+            f'max {timings[-1] * 1000:.3f} ms over {len(timings)} queries'
+        )
+        fuzzy.sort()
+        self.stdout.write(
+            f'fuzzy        mean {statistics.fmean(fuzzy) * 1000:.3f} ms, '
+            f'p99 {self.percentile(fuzzy, 0.99) * 1000:.3f} ms, '
+            f'max {fuzzy[-1] * 1000:.3f} ms over {len(fuzzy)} misspelled words, '
+            f'{corrected * 100 / len(fuzzy):.0f}% corrected back'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'p99 lookup is {self.percentile(timings, 0.99) * 1000:.2f} ms, '
+            f'p99 fuzzy correction is {self.percentile(fuzzy, 0.99) * 1000:.2f} ms.'
+        ))
+
+    def vocabulary(self, rng, count):
+        """Pronounceable made-up words, as model and collection names tend to be"""
+        syllables = [c + v for c in 'bcdfgklmnprstvz' for v in 'aeiou'] + ['an', 'ex', 'or', 'ul', 'is']
+        words = set()
+        while len(words) < count:
+            words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+        return sorted(words)
+
+    def entries(self, rng, count, vocabulary):
+        entries = [
+            ('brand', i + 1, f'brand-{i + 1}', name, 0.0) for i, name in enumerate(BRANDS)
+        ]
+        for i in range(count):
+            name = ' '.join(
+                [rng.choice(BRANDS), rng.choice(vocabulary)]
+                + rng.sample(WORDS, rng.randint(1, 3))
+                + [str(rng.randint(1, 999))]
+            )
+            # Heavy-tailed, like sales
+            entries.append(('product', i + 1, f'product-{i + 1}', name.title(), rng.paretovariate(1.2)))
+        return entries
+
+    def typo(self, rng, word):
+        """One dropped, doubled, swapped or replaced letter"""
+        i = rng.randrange(len(word))
+        edit = rng.choice(['drop', 'double', 'swap', 'replace']) if len(word) > 3 else 'double'
+        if edit == 'drop':
+            return word[:i] + word[i + 1:]
+        if edit == 'double':
+            return word[:i] + word[i] + word[i:]
+        if edit == 'swap' and i < len(word) - 1:
+            return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+
+    def percentile(self, timings, fraction):
+        return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+    def check_results(self, index, rng, queries):
+        """The index returns what a full scan of the snapshot would"""
+        everything = [(entry[:4], typeahead.suffixes(entry[3])) for entry in index.entries()]
+        for query in queries:
+            prefix = typeahead.normalize(query)
+            expected = [
+                entry for entry, keys in everything if any(key.startswith(prefix) for key in keys)
+            ][:typeahead.TOP_K]
+            assert index.complete(query) == expected, (query, index.complete(query), expected)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Fold new orders and wishlist items into "customers also bought" neighbours'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Discard all counts and rebuild from the full history'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        touched = recommendations.update(full=options['full'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed neighbours of {touched} products in {elapsed:.1f}s.'))
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from ecommerce.database import sqlite_stats
+
+
+class Command(BaseCommand):
+    help = 'Run ANALYZE, incremental VACUUM and PRAGMA optimize on a SQLite database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database alias to maintain (default: "default")'
+        )
+        parser.add_argument(
+            '--vacuum-pages',
+            type=int,
+            default=0,
+            help='Free pages to release with incremental_vacuum (default: all)'
+        )
+        parser.add_argument(
+            '--enable-incremental-vacuum',
+            action='store_true',
+            help='Switch auto_vacuum to INCREMENTAL; needs one full VACUUM'
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'Database "{using}" is not SQLite.')
+
+        before = sqlite_stats(using)
+        steps = []
+        with connection.cursor() as cursor:
+            if options['enable_incremental_vacuum'] and before['auto_vacuum'] != 2:
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                steps.append(self.timed(cursor, 'VACUUM'))
+
+            steps.append(self.timed(cursor, 'ANALYZE'))
+
+            cursor.execute('PRAGMA auto_vacuum')
+            if cursor.fetchone()[0] == 2:
+                pages = options['vacuum_pages']
+                statement = f'PRAGMA incremental_vacuum({pages})' if pages else 'PRAGMA incremental_vacuum'
+                steps.append(self.timed(cursor, statement))
+            else:
+                self.stdout.write(self.style.WARNING(
+                    'auto_vacuum is not INCREMENTAL, skipping incremental_vacuum. '
+                    'Run once with --enable-incremental-vacuum.'))
+
+            steps.append(self.timed(cursor, 'PRAGMA optimize'))
+            if before['journal_mode'] == 'wal':
+                steps.append(self.timed(cursor, 'PRAGMA wal_checkpoint(TRUNCATE)'))
+        after = sqlite_stats(using)
+
+        for statement, elapsed in steps:
+            self.stdout.write(f'{statement:<36} {elapsed * 1000:10.1f} ms')
+        self.stdout.write('')
+        self.stdout.write(f'{"":<16} {"before":>14} {"after":>14}')
+        for key in ('page_count', 'freelist_count', 'file_size', 'wal_size', 'auto_vacuum'):
+            self.stdout.write(f'{key:<16} {before[key]:>14} {after[key]:>14}')
+        self.stdout.write(self.style.SUCCESS(f'Maintenance of "{using}" complete.'))
+
+    def timed(self, cursor, statement):
+        start = time.perf_counter()
+        cursor.execute(statement)
+        # incremental_vacuum and friends only run as rows are stepped
+        cursor.fetchall()
+        return statement, time.perf_counter() - start
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ecommerce.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Delete raw storefront events past their retention; hourly rollups are kept'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.EVENTS['RAW_RETENTION_DAYS'],
+            help='Keep raw events from the last N days',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old = Event.objects.filter(created_at__lt=cutoff)
+        deleted = 0
+        # Small batches keep each write lock short
+        while batch := list(old.values_list('id', flat=True)[:options['batch_size']]):
+            deleted += Event.objects.filter(id__in=batch).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} events older than {options["days"]} days.'))
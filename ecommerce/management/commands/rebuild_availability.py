@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce import availability
+
+
+class Command(BaseCommand):
+    help = 'Recompute every product\'s stock availability summary from its variants'
+
+    def handle(self, *args, **options):
+        count = availability.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt availability for {count} products.'))
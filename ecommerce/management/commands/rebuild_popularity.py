@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce import popularity
+
+
+class Command(BaseCommand):
+    help = 'Recompute best-selling and trending scores from the full order history'
+
+    def handle(self, *args, **options):
+        count = popularity.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt popularity scores for {count} products.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce import typeahead
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the autocomplete snapshot from the whole catalog, refreshing popularity'
+
+    def handle(self, *args, **options):
+        count = typeahead.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products, brands and categories.'))
@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, connections
+
+from ecommerce import taskqueue
+
+
+def run_task(task_id):
+    """Pool entry point: run one task on this thread/process's own connection"""
+    try:
+        return taskqueue.execute(task_id)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue',
+            action='append',
+            dest='queues',
+            help='Queue to consume; repeat for several (default: default)',
+        )
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between polls when idle')
+        parser.add_argument('--burst', action='store_true', help='Exit once no task is due')
+        parser.add_argument('--stats', action='store_true', help='Print per-queue metrics and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for queue, stats in taskqueue.queue_stats().items():
+                figures = ', '.join(f'{key}={value}' for key, value in stats.items())
+                self.stdout.write(f'{queue}: {figures}')
+            return
+
+        taskqueue.load_tasks()
+        queues = options['queues'] or ['default']
+        concurrency = options['concurrency']
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        if options['pool'] == 'process':
+            # Forked children must not share the parent's SQLite handle
+            connections.close_all()
+            pool = ProcessPoolExecutor(concurrency, mp_context=multiprocessing.get_context('fork'))
+        else:
+            pool = ThreadPoolExecutor(concurrency, thread_name_prefix='task')
+
+        self.stdout.write(f'Worker {worker} consuming {", ".join(queues)} with {concurrency} {options["pool"]} workers')
+        running = set()
+        counts = {'done': 0, 'queued': 0, 'failed': 0}
+        last_maintenance = 0
+        with pool:
+            while not self.stopping:
+                if time.monotonic() - last_maintenance > 60:
+                    taskqueue.requeue_stale()
+                    taskqueue.purge_finished()
+                    last_maintenance = time.monotonic()
+
+                free = concurrency - len(running)
+                claimed = taskqueue.claim(queues, worker, free) if free else []
+                for task_id in claimed:
+                    running.add(pool.submit(run_task, task_id))
+                close_old_connections()
+
+                if not running:
+                    if options['burst']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+                finished, running = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    counts[future.result()] += 1
+
+            # Let claimed tasks finish rather than leave them for the stale-lock sweep
+            for future in running:
+                counts[future.result()] += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Worker stopped: {counts["done"]} done, {counts["queued"]} to retry, {counts["failed"]} failed.'
+        ))
+
+    def stop(self, signum, frame):
+        self.stopping = True
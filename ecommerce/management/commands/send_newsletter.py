@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce import newsletter
+from ecommerce.models import Campaign
+
+
+class Command(BaseCommand):
+    help = 'Stage subscribers for a newsletter campaign and deliver it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_id', type=int)
+        parser.add_argument('--workers', type=int, help='Parallel SMTP connections')
+        parser.add_argument('--rate', type=float, help='Messages per second across all workers (0 = unlimited)')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--smtp-host', help='Override EMAIL_HOST, e.g. a local debugging server')
+        parser.add_argument('--smtp-port', type=int, help='Override EMAIL_PORT')
+        parser.add_argument('--retry-failed', action='store_true', help='Queue failed recipients again')
+        parser.add_argument('--no-stage', action='store_true', help='Only deliver to recipients already staged')
+
+    def handle(self, *args, **options):
+        try:
+            campaign = Campaign.objects.get(pk=options['campaign_id'])
+        except Campaign.DoesNotExist:
+            raise CommandError(f'Campaign {options["campaign_id"]} does not exist')
+
+        if options['retry_failed']:
+            retried = campaign.recipients.filter(status='failed').update(status='queued', error='')
+            self.stdout.write(f'Requeued {retried} failed recipients')
+        if not options['no_stage']:
+            staged = newsletter.stage(campaign)
+            self.stdout.write(f'Staged {staged} new recipients')
+
+        connection_options = {}
+        if options['smtp_host']:
+            connection_options['host'] = options['smtp_host']
+        if options['smtp_port']:
+            connection_options['port'] = options['smtp_port']
+
+        counts = newsletter.deliver(
+            campaign,
+            workers=options['workers'],
+            rate=options['rate'],
+            batch_size=options['batch_size'],
+            progress=lambda counts: self.stdout.write(f'  {counts["sent"]} sent, {counts["failed"]} failed'),
+            **connection_options,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Campaign "{campaign}": {counts["sent"]} sent, {counts["failed"]} failed.'
+        ))
@@ -0,0 +1,59 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database onto each replica alias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases',
+            nargs='*',
+            help='Replica aliases (default: every alias whose TEST MIRROR is default)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Keep syncing every N seconds instead of once'
+        )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        replicas = options['aliases'] or [
+            alias for alias, config in settings.DATABASES.items()
+            if config.get('TEST', {}).get('MIRROR') == DEFAULT_DB_ALIAS
+        ]
+        if not replicas:
+            raise CommandError('No replica aliases configured.')
+        for alias in [DEFAULT_DB_ALIAS] + replicas:
+            if alias not in settings.DATABASES:
+                raise CommandError(f'Unknown database "{alias}".')
+            if settings.DATABASES[alias]['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError(f'Database "{alias}" is not SQLite.')
+
+        while True:
+            for alias in replicas:
+                start = time.perf_counter()
+                self.copy(primary['NAME'], settings.DATABASES[alias]['NAME'])
+                elapsed = (time.perf_counter() - start) * 1000
+                self.stdout.write(self.style.SUCCESS(f'Synced "{alias}" in {elapsed:.0f} ms'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def copy(self, source_path, target_path):
+        # The online backup API takes a consistent snapshot of the primary and
+        # locks the replica only while pages are written; copying the file
+        # would race with WAL checkpoints.
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ecommerce import search, tasks
+
+
+class Command(BaseCommand):
+    help = 'Cache the first results page of the most searched queries from the search log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=settings.SEARCH['WARM_TOP'], help='Number of queries to warm')
+        parser.add_argument('--days', type=int, default=settings.SEARCH['WARM_DAYS'], help='Count searches from the last N days')
+        parser.add_argument(
+            '--schedule',
+            action='store_true',
+            help='Also queue the warm_search_cache task, which repeats at SEARCH["WARM_HOURS"]',
+        )
+
+    def handle(self, *args, **options):
+        count = search.warm(options['top'], options['days'])
+        if options['schedule']:
+            tasks.warm_search_cache.enqueue(countdown=search.seconds_until_warm())
+        self.stdout.write(self.style.SUCCESS(f'Warmed {count} popular queries.'))
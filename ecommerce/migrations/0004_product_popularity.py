@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0003_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sales_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='trend_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', '-sales_score'], name='product_active_sales_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', '-trend_score'], name='product_active_trend_idx'),
+        ),
+    ]
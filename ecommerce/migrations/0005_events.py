@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0004_product_popularity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('view', 'Product view'), ('search', 'Search'), ('add_to_cart', 'Add to cart')], max_length=20)),
+                ('query', models.CharField(blank=True, max_length=200)),
+                ('session_key', models.CharField(blank=True, max_length=40)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ecommerce.product')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EventHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('view', 'Product view'), ('search', 'Search'), ('add_to_cart', 'Add to cart')], max_length=20)),
+                ('hour', models.DateTimeField()),
+                ('query', models.CharField(blank=True, max_length=200)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ecommerce.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Hourly events',
+                'ordering': ['-hour'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('product__isnull', False)), fields=('kind', 'hour', 'product'), name='eventhourly_product_unique'), models.UniqueConstraint(condition=models.Q(('product__isnull', True)), fields=('kind', 'hour', 'query'), name='eventhourly_query_unique')],
+            },
+        ),
+    ]
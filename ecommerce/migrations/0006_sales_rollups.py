@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0005_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('dimension', models.CharField(choices=[('total', 'All sales'), ('product', 'Product'), ('category', 'Category'), ('brand', 'Brand')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('key_id', models.PositiveIntegerField(default=0)),
+                ('label', models.CharField(blank=True, max_length=200)),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('discounts', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['-bucket'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'dimension', 'bucket', 'key_id'), name='salesrollup_unique')],
+            },
+        ),
+    ]
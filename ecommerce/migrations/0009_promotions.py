@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0008_newsletter_campaigns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='brand',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='coupons', to='ecommerce.brand'),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='buy_quantity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='coupons', to='ecommerce.category'),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='get_quantity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='is_automatic',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='tiers',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='coupon',
+            name='discount_type',
+            field=models.CharField(choices=[('percentage', 'Percentage'), ('fixed', 'Fixed Amount'), ('buy_x_get_y', 'Buy X Get Y')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0011_product_availability'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('back_in_stock', 'Back in stock'), ('price_drop', 'Price drop')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('notified_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('product', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='ecommerce.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_alerts', to=settings.AUTH_USER_MODEL)),
+                ('variant', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='ecommerce.productvariant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['variant', 'notified_at'], name='alert_variant_idx'), models.Index(fields=['product', 'notified_price'], name='alert_product_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('variant__isnull', False)), fields=('user', 'variant'), name='alert_variant_unique'), models.UniqueConstraint(condition=models.Q(('product__isnull', False)), fields=('user', 'product'), name='alert_product_unique')],
+            },
+        ),
+    ]
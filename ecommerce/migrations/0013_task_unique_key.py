@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0012_product_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='unique_key',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 'running'), models.Q(('unique_key', ''), _negated=True)), fields=['unique_key'], name='task_unique_running_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'queued'), models.Q(('unique_key', ''), _negated=True)), fields=('unique_key',), name='task_unique_queued'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def backfill(apps, schema_editor):
+    """availability.refresh() for every product, with the historical models"""
+    Product = apps.get_model('ecommerce', 'Product')
+    ProductVariant = apps.get_model('ecommerce', 'ProductVariant')
+
+    def encode_ids(ids):
+        return f'|{"|".join(str(pk) for pk in sorted(ids))}|' if ids else ''
+
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        totals = defaultdict(int)
+        sizes = defaultdict(set)
+        colors = defaultdict(set)
+        variants = ProductVariant.objects.filter(product_id__in=chunk, is_active=True).values_list(
+            'product_id', 'size_id', 'color_id', 'stock_quantity'
+        )
+        for product_id, size_id, color_id, stock in variants:
+            if stock > 0:
+                totals[product_id] += stock
+                sizes[product_id].add(size_id)
+                colors[product_id].add(color_id)
+        Product.objects.bulk_update(
+            [
+                Product(
+                    id=product_id,
+                    stock_total=totals[product_id],
+                    in_stock=totals[product_id] > 0,
+                    available_size_ids=encode_ids(sizes[product_id]),
+                    available_color_ids=encode_ids(colors[product_id]),
+                )
+                for product_id in chunk
+            ],
+            ['stock_total', 'in_stock', 'available_size_ids', 'available_color_ids'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0014_task_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0015_backfill_product_availability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productalert',
+            name='source',
+            field=models.CharField(choices=[('customer', 'Subscribed by the customer'), ('wishlist', 'Added from the wishlist')], default='customer', max_length=10),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def backfill(apps, schema_editor):
+    """popularity.rebuild() for products that predate the score columns, with the historical models"""
+    from ecommerce.popularity import replay
+
+    Product = apps.get_model('ecommerce', 'Product')
+    OrderItem = apps.get_model('ecommerce', 'OrderItem')
+    EventHourly = apps.get_model('ecommerce', 'EventHourly')
+
+    sales, trend = replay(
+        OrderItem.objects.values_list('product_variant__product_id', 'quantity', 'created_at').iterator(chunk_size=5000),
+        EventHourly.objects.filter(kind='view', product__isnull=False).values_list(
+            'product_id', 'count', 'hour'
+        ).iterator(chunk_size=5000),
+    )
+    Product.objects.bulk_update(
+        [
+            Product(id=product_id, sales_score=sales[product_id], trend_score=trend[product_id])
+            for product_id in sales.keys() | trend.keys()
+        ],
+        ['sales_score', 'trend_score'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0016_product_alert_source'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
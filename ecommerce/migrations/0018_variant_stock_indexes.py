@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0017_backfill_product_popularity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productvariant',
+            index=models.Index(condition=models.Q(('is_active', True), ('stock_quantity__gt', 0)), fields=['size', 'product'], name='variant_size_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productvariant',
+            index=models.Index(condition=models.Q(('is_active', True), ('stock_quantity__gt', 0)), fields=['color', 'product'], name='variant_color_stock_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.text import slugify
 from decimal import Decimal
@@ -49,7 +51,9 @@ class SubCategory(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.category.name} - {self.name}"
+        from .refdata import snapshot
+        category = snapshot().categories.get(self.category_id) or self.category
+        return f"{category.name} - {self.name}"
 
 
 class Brand(models.Model):
@@ -130,7 +134,22 @@ class Product(models.Model):
     sku = models.CharField(max_length=50, unique=True)
     base_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, validators=[MinValueValidator(Decimal('0.01'))])
+    # Stored in the row so listings can sort, filter and index on the real price
+    effective_price = models.GeneratedField(
+        expression=Coalesce('discount_price', 'base_price'),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+    )
     gender = models.CharField(max_length=10, choices=GENDER_CHOICES)
+    # Time-decayed popularity, maintained by ecommerce.popularity
+    sales_score = models.FloatField(default=0, editable=False)
+    trend_score = models.FloatField(default=0, editable=False)
+    # Availability summary of the active variants, kept by ecommerce.availability.
+    # Id sets are "|3|7|12|" strings, for display only
+    stock_total = models.PositiveIntegerField(default=0, editable=False)
+    in_stock = models.BooleanField(default=False, editable=False)
+    available_size_ids = models.TextField(default='', blank=True, editable=False)
+    available_color_ids = models.TextField(default='', blank=True, editable=False)
     material = models.CharField(max_length=200, blank=True)
     care_instructions = models.TextField(blank=True)
     weight = models.DecimalField(max_digits=6, decimal_places=2, blank=True, null=True, help_text="Weight in grams")
@@ -147,15 +166,44 @@ class Product(models.Model):
             models.Index(fields=['category', 'is_active']),
             models.Index(fields=['brand', 'is_active']),
             models.Index(fields=['is_featured', 'is_active']),
+            # (category, is_active, effective_price) as a partial index: Django
+            # renders is_active=True as a bare "is_active" term, which SQLite
+            # can match against an index condition but not an index column
+            models.Index(
+                fields=['category', 'effective_price'],
+                condition=models.Q(is_active=True),
+                name='product_active_price_idx',
+            ),
+            models.Index(
+                fields=['category', '-sales_score'],
+                condition=models.Q(is_active=True),
+                name='product_active_sales_idx',
+            ),
+            models.Index(
+                fields=['category', '-trend_score'],
+                condition=models.Q(is_active=True),
+                name='product_active_trend_idx',
+            ),
+            models.Index(
+                fields=['category', 'name'],
+                condition=models.Q(is_active=True, in_stock=True),
+                name='product_in_stock_idx',
+            ),
         ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
+        # The database recomputed effective_price; don't keep a stale copy
+        self.__dict__.pop('effective_price', None)
 
     @property
     def current_price(self):
+        # effective_price is only loaded from the database; fall back for
+        # instances that haven't been saved or refreshed yet
+        if 'effective_price' in self.__dict__ and self.effective_price is not None:
+            return self.effective_price
         return self.discount_price if self.discount_price else self.base_price
 
     @property
@@ -184,6 +232,15 @@ class ProductVariant(models.Model):
         indexes = [
             models.Index(fields=['product', 'is_active']),
             models.Index(fields=['stock_quantity']),
+            # Products with a size or color in stock (availability.filter_available)
+            models.Index(
+                fields=['size', 'product'], name='variant_size_stock_idx',
+                condition=models.Q(is_active=True, stock_quantity__gt=0),
+            ),
+            models.Index(
+                fields=['color', 'product'], name='variant_color_stock_idx',
+                condition=models.Q(is_active=True, stock_quantity__gt=0),
+            ),
         ]
 
     @property
@@ -196,7 +253,11 @@ class ProductVariant(models.Model):
         return self.stock_quantity > 0
 
     def __str__(self):
-        return f"{self.product.name} - {self.color.name} - {self.size.name}"
+        from .refdata import snapshot
+        refs = snapshot()
+        color = refs.colors.get(self.color_id) or self.color
+        size = refs.sizes.get(self.size_id) or self.size
+        return f"{self.product.name} - {color.name} - {size.name}"
 
 
 class ProductImage(models.Model):
@@ -412,12 +473,21 @@ class Review(models.Model):
     comment = models.TextField()
     is_verified_purchase = models.BooleanField(default=False)
     is_approved = models.BooleanField(default=True)
+    helpful_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ['product', 'customer']
         ordering = ['-created_at']
+        # One per review sort (ecommerce.reviews), over approved reviews only.
+        # The rowid at the end of each index breaks ties, so keyset pages
+        # never sort in memory
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='review_recent_idx', condition=models.Q(is_approved=True)),
+            models.Index(fields=['product', 'helpful_count'], name='review_helpful_idx', condition=models.Q(is_approved=True)),
+            models.Index(fields=['product', 'rating'], name='review_rating_idx', condition=models.Q(is_approved=True)),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.rating} stars by {self.customer.user.username}"
@@ -428,14 +498,26 @@ class Coupon(models.Model):
     DISCOUNT_TYPES = [
         ('percentage', 'Percentage'),
         ('fixed', 'Fixed Amount'),
+        ('buy_x_get_y', 'Buy X Get Y'),
     ]
 
     code = models.CharField(max_length=50, unique=True)
     description = models.CharField(max_length=200, blank=True)
-    discount_type = models.CharField(max_length=10, choices=DISCOUNT_TYPES)
+    discount_type = models.CharField(max_length=20, choices=DISCOUNT_TYPES)
+    # Percent or amount off; for buy X get Y, the percent off each free item
     discount_value = models.DecimalField(max_digits=10, decimal_places=2)
     minimum_order_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     maximum_discount_amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    # Only items of this category and/or brand count towards the discount
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='coupons', blank=True, null=True)
+    brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name='coupons', blank=True, null=True)
+    buy_quantity = models.PositiveIntegerField(default=0)
+    get_quantity = models.PositiveIntegerField(default=0)
+    # [[threshold, value], ...]: the value of the highest threshold the
+    # qualifying subtotal reaches replaces discount_value
+    tiers = models.JSONField(default=list, blank=True)
+    # Applied to qualifying carts without entering the code
+    is_automatic = models.BooleanField(default=False)
     usage_limit = models.PositiveIntegerField(blank=True, null=True)
     used_count = models.PositiveIntegerField(default=0)
     valid_from = models.DateTimeField()
@@ -446,6 +528,14 @@ class Coupon(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+    def clean(self):
+        if self.discount_type == 'buy_x_get_y' and not (self.buy_quantity and self.get_quantity):
+            raise ValidationError('Buy X get Y needs both a buy and a get quantity.')
+        try:
+            [(Decimal(str(threshold)), Decimal(str(value))) for threshold, value in self.tiers]
+        except Exception:
+            raise ValidationError({'tiers': 'Enter a list of [threshold, value] pairs.'})
+
     def is_valid(self):
         from django.utils import timezone
         now = timezone.now()
@@ -464,4 +554,292 @@ class Newsletter(models.Model):
     subscribed_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return self.email
\ No newline at end of file
+        return self.email
+
+
+class ProductAffinity(models.Model):
+    """Weighted count of baskets (orders, wishlists) holding both products.
+
+    Stored in both directions; the product == other row holds the number of
+    baskets containing the product at all.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    weight = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Product affinities"
+        unique_together = ['product', 'other']
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.other_id}: {self.weight}"
+
+
+class RelatedProduct(models.Model):
+    """Top-k "customers also bought" neighbours of a product"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_for')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ['product', 'rank']
+        ordering = ['product', 'rank']
+
+    def __str__(self):
+        return f"{self.product} -> {self.related} (#{self.rank})"
+
+
+class BatchCheckpoint(models.Model):
+    """High-water mark of an incremental batch job"""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+class Event(models.Model):
+    """Raw storefront event, written in batches by ecommerce.events"""
+    KIND_CHOICES = [
+        ('view', 'Product view'),
+        ('search', 'Search'),
+        ('add_to_cart', 'Add to cart'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    query = models.CharField(max_length=200, blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    session_key = models.CharField(max_length=40, blank=True)
+    # Time the event happened, not when the batch was written
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} {self.product_id or self.query} @ {self.created_at}"
+
+
+class EventHourly(models.Model):
+    """Event counts per hour, per product (views, adds) or per query (searches)"""
+    kind = models.CharField(max_length=20, choices=Event.KIND_CHOICES)
+    hour = models.DateTimeField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    query = models.CharField(max_length=200, blank=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Hourly events"
+        ordering = ['-hour']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'hour', 'product'],
+                condition=models.Q(product__isnull=False),
+                name='eventhourly_product_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['kind', 'hour', 'query'],
+                condition=models.Q(product__isnull=True),
+                name='eventhourly_query_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.product_id or self.query} @ {self.hour}: {self.count}"
+
+
+class SalesRollup(models.Model):
+    """Order totals per hour or day, overall or for one product, category or brand"""
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    DIMENSION_CHOICES = [
+        ('total', 'All sales'),
+        ('product', 'Product'),
+        ('category', 'Category'),
+        ('brand', 'Brand'),
+    ]
+
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    bucket = models.DateTimeField()
+    # Id of the product/category/brand; 0 for the 'total' dimension
+    key_id = models.PositiveIntegerField(default=0)
+    # Name as of the latest order, so reports never join the catalog
+    label = models.CharField(max_length=200, blank=True)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    # Order total paid for 'total'; item sales before discounts for the others
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discounts = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'dimension', 'bucket', 'key_id'],
+                name='salesrollup_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.bucket:%Y-%m-%d %H:%M} {self.dimension} {self.label or self.key_id}"
+
+
+class Task(models.Model):
+    """Queued background job, run by the run_tasks worker"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    queue = models.CharField(max_length=50, default='default')
+    # Dotted path of the @task function
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Higher runs first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Moved by heartbeat() during long runs; stale runs are requeued from here
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    # Hash of name and arguments for @task(unique=True) calls, else blank
+    unique_key = models.CharField(max_length=64, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['queue', '-priority', 'run_at'],
+                condition=models.Q(status='queued'),
+                name='task_due_idx',
+            ),
+            models.Index(fields=['status', 'finished_at'], name='task_status_idx'),
+            models.Index(
+                fields=['unique_key'],
+                condition=models.Q(status='running') & ~models.Q(unique_key=''),
+                name='task_unique_running_idx',
+            ),
+        ]
+        constraints = [
+            # At most one identical unique call waits at a time
+            models.UniqueConstraint(
+                fields=['unique_key'],
+                condition=models.Q(status='queued') & ~models.Q(unique_key=''),
+                name='task_unique_queued',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.queue}] {self.status}"
+
+
+class Campaign(models.Model):
+    """A newsletter mailing; bodies are Django templates rendered once per campaign"""
+    STATUS_CHOICES = [
+        ('draft', 'Draft'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+    ]
+
+    subject = models.CharField(max_length=200)
+    text_body = models.TextField(help_text='Plain-text template; {{ unsubscribe_url }} is filled in per recipient')
+    html_body = models.TextField(blank=True, help_text='Optional HTML alternative, same placeholders')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.subject
+
+
+class CampaignRecipient(models.Model):
+    """Delivery status of one campaign to one address"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        # Claimed by a deliver() run
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='recipients')
+    email = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    error = models.CharField(max_length=500, blank=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ['campaign', 'email']
+        indexes = [
+            models.Index(fields=['campaign', 'status', 'id'], name='recipient_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.email} ({self.status})"
+
+
+class ProductAlert(models.Model):
+    """A customer's request to hear about a restocked variant or a cheaper product"""
+    KIND_CHOICES = [
+        ('back_in_stock', 'Back in stock'),
+        ('price_drop', 'Price drop'),
+    ]
+    SOURCE_CHOICES = [
+        ('customer', 'Subscribed by the customer'),
+        ('wishlist', 'Added from the wishlist'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Wishlist alerts go away with the wishlist item; the customer's own stay
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='customer')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='product_alerts')
+    # Set for back_in_stock
+    variant = models.ForeignKey(
+        ProductVariant, on_delete=models.CASCADE, related_name='alerts', blank=True, null=True, db_index=False
+    )
+    # Set for price_drop
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='alerts', blank=True, null=True, db_index=False
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Back-in-stock alerts fire once. Price-drop alerts fire whenever the
+    # price falls below the one at sign-up or at the last alert
+    notified_at = models.DateTimeField(blank=True, null=True)
+    notified_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Fan-out reads one variant's or product's subscribers in id order
+            models.Index(fields=['variant', 'notified_at'], name='alert_variant_idx'),
+            models.Index(fields=['product', 'notified_price'], name='alert_product_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'variant'], condition=models.Q(variant__isnull=False), name='alert_variant_unique'
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'product'], condition=models.Q(product__isnull=False), name='alert_product_unique'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.user}"
@@ -0,0 +1,245 @@
+"""
+Newsletter delivery.
+
+A campaign goes out in two steps. stage() streams the subscriber list
+(active Newsletter sign-ups plus opted-in customers, deduplicated by a SQL
+UNION) with iterator() into CampaignRecipient rows, so re-running only adds
+new addresses and an interrupted send resumes where it stopped.
+
+deliver() renders the campaign templates once, then claims queued
+recipients in id-ordered batches, each with one ``UPDATE ... SET status =
+'sending' ... RETURNING``, so two runs of the same campaign never send to
+the same address. Each batch is split across worker threads that keep one
+SMTP connection open apiece and share one rate limit; the batch outcome is
+written back with one UPDATE for the sent rows and one bulk_update for the
+failures. Only the main thread touches the database.
+
+A run that dies mid-batch leaves that batch 'sending'. The next run marks
+those rows failed, since they may have been delivered; send_newsletter
+--retry-failed sends them again. The send_campaign task is unique and calls
+heartbeat() after every batch, so a long campaign is never handed to a
+second worker while the first is still sending.
+"""
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection
+from django.template import Context, Template
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import CampaignRecipient, Newsletter
+
+
+UNSUBSCRIBE_SALT = 'ecommerce.newsletter.unsubscribe'
+# Stands in for the per-recipient link while the campaign is rendered once
+UNSUBSCRIBE_MARKER = '__UNSUBSCRIBE_URL__'
+
+
+def unsubscribe_url(email):
+    token = signing.dumps(email, salt=UNSUBSCRIBE_SALT, compress=True)
+    return settings.NEWSLETTER['SITE_URL'] + reverse('newsletter_unsubscribe', args=[token])
+
+
+def unsubscribe_email(token):
+    """Email address of a valid unsubscribe token; raises signing.BadSignature"""
+    return signing.loads(token, salt=UNSUBSCRIBE_SALT)
+
+
+def subscribers():
+    """Distinct subscribed addresses, as a lazy queryset of strings"""
+    opted_out = Newsletter.objects.filter(is_active=False).values('email')
+    newsletter = Newsletter.objects.filter(is_active=True).values_list('email', flat=True)
+    customers = (
+        User.objects.filter(is_active=True, customer__newsletter_subscription=True)
+        .exclude(email='')
+        .exclude(email__in=opted_out)
+        .values_list('email', flat=True)
+    )
+    return newsletter.union(customers)
+
+
+def stage(campaign, chunk_size=2000):
+    """Add current subscribers to the campaign; returns how many rows were written"""
+    # bulk_create(ignore_conflicts=True) returns every object, inserted or not
+    before = campaign.recipients.count()
+    batch = []
+    for email in subscribers().iterator(chunk_size=chunk_size):
+        batch.append(CampaignRecipient(campaign=campaign, email=email))
+        if len(batch) >= chunk_size:
+            CampaignRecipient.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        CampaignRecipient.objects.bulk_create(batch, ignore_conflicts=True)
+    return campaign.recipients.count() - before
+
+
+def claim(campaign, batch_size):
+    """Atomically mark the next ``batch_size`` queued recipients as sending; returns [(id, email)]"""
+    table = CampaignRecipient._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET status = 'sending' "
+            f"WHERE id IN ("
+            f"SELECT id FROM {table} WHERE campaign_id = %s AND status = 'queued' ORDER BY id LIMIT %s"
+            f") RETURNING id, email",
+            [campaign.pk, batch_size],
+        )
+        return sorted(cursor.fetchall())
+
+
+def render(campaign):
+    """Subject, text and HTML bodies with UNSUBSCRIBE_MARKER in place of the link"""
+    context = Context({'campaign': campaign, 'unsubscribe_url': UNSUBSCRIBE_MARKER})
+    text = Template(campaign.text_body).render(context)
+    html = Template(campaign.html_body).render(context) if campaign.html_body else ''
+    return campaign.subject, text, html
+
+
+class RateLimiter:
+    """Spaces calls evenly at ``rate`` per second across all threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Sender:
+    """Per-thread SMTP connections, reused for every message that thread sends"""
+
+    def __init__(self, rendered, limiter, **connection_options):
+        self.subject, self.text, self.html = rendered
+        self.limiter = limiter
+        self.connection_options = connection_options
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = get_connection(**self.connection_options)
+            connection.open()
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def discard_connection(self):
+        connection = self.local.__dict__.pop('connection', None)
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def message(self, email):
+        url = unsubscribe_url(email)
+        message = EmailMultiAlternatives(
+            self.subject,
+            self.text.replace(UNSUBSCRIBE_MARKER, url),
+            settings.NEWSLETTER['FROM_EMAIL'],
+            [email],
+            headers={'List-Unsubscribe': f'<{url}>'},
+        )
+        if self.html:
+            message.attach_alternative(self.html.replace(UNSUBSCRIBE_MARKER, url), 'text/html')
+        return message
+
+    def send(self, recipients):
+        """Send to ``[(recipient_id, email)]``; returns [(recipient_id, error or None)]"""
+        results = []
+        for recipient_id, email in recipients:
+            self.limiter.wait()
+            try:
+                if self.connection().send_messages([self.message(email)]):
+                    results.append((recipient_id, None))
+                else:
+                    results.append((recipient_id, 'Rejected by the mail server'))
+            except Exception as e:
+                # Start the next message on a fresh connection
+                self.discard_connection()
+                results.append((recipient_id, f'{type(e).__name__}: {e}'))
+        return results
+
+    def close(self):
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+def record_results(results):
+    now = timezone.now()
+    sent = [recipient_id for recipient_id, error in results if error is None]
+    failed = [
+        CampaignRecipient(id=recipient_id, status='failed', error=error[:500])
+        for recipient_id, error in results if error is not None
+    ]
+    CampaignRecipient.objects.filter(id__in=sent).update(status='sent', sent_at=now)
+    CampaignRecipient.objects.bulk_update(failed, ['status', 'error'], batch_size=500)
+    return len(sent), len(failed)
+
+
+def deliver(campaign, workers=None, rate=None, batch_size=None, progress=None, **connection_options):
+    """
+    Send the campaign to its queued recipients. ``progress`` is called with
+    the running counts after each batch. ``connection_options`` go to
+    get_connection(), e.g. host/port for a local debugging server.
+    Returns a Counter of sent and failed recipients.
+    """
+    config = settings.NEWSLETTER
+    workers = workers or config['WORKERS']
+    batch_size = batch_size or config['BATCH_SIZE']
+    rate = config['RATE_PER_SECOND'] if rate is None else rate
+
+    if campaign.status != 'sending':
+        campaign.status = 'sending'
+        campaign.started_at = campaign.started_at or timezone.now()
+        campaign.save(update_fields=['status', 'started_at'])
+
+    # Left by a run that died mid-batch
+    campaign.recipients.filter(status='sending').update(
+        status='failed', error='Interrupted while sending; may have been delivered'
+    )
+
+    sender = Sender(render(campaign), RateLimiter(rate), **connection_options)
+    counts = Counter()
+    try:
+        with ThreadPoolExecutor(workers, thread_name_prefix='newsletter') as pool:
+            while batch := claim(campaign, batch_size):
+                shares = [batch[i::workers] for i in range(workers)]
+                results = [result for share in pool.map(sender.send, shares) for result in share]
+                sent, failed = record_results(results)
+                counts['sent'] += sent
+                counts['failed'] += failed
+                if progress:
+                    progress(counts)
+    finally:
+        sender.close()
+
+    if not campaign.recipients.filter(status__in=['queued', 'sending']).exists():
+        campaign.status = 'sent'
+        campaign.finished_at = timezone.now()
+        campaign.save(update_fields=['status', 'finished_at'])
+    return counts
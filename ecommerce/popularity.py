@@ -0,0 +1,107 @@
+"""
+Time-decayed popularity scores behind the "best selling" and "trending" sorts.
+
+Scores are kept in exponential-growth form: an event at time t adds
+``weight * 2 ** ((t - EPOCH) / half_life)`` to the product's column. Every
+score decays by the same factor, so ordering by the stored column equals
+ordering by the decayed score, and old rows never need rewriting. Doubles
+reach their limit after about a thousand half-lives, roughly eight years
+for the 3-day trending half-life, after which EPOCH should move forward and
+rebuild_popularity be rerun.
+
+rebuild() replays every order and the hourly 'view' rollups that
+ecommerce.events keeps, so it reproduces both scores, not just the sales.
+"""
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection
+
+from . import database
+from .models import EventHourly, OrderItem, Product
+
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()
+DAY = 24 * 60 * 60
+
+
+def growth(half_life_days, at=None):
+    """Weight of an event at ``at`` (unix time) relative to EPOCH"""
+    at = time.time() if at is None else at
+    return 2.0 ** ((at - EPOCH) / (half_life_days * DAY))
+
+
+def sale_increments(quantity, at=None):
+    config = settings.POPULARITY
+    return (
+        quantity * growth(config['SALES_HALF_LIFE_DAYS'], at),
+        quantity * config['TREND_SALE_WEIGHT'] * growth(config['TREND_HALF_LIFE_DAYS'], at),
+    )
+
+
+def record_sales(quantities, at=None):
+    """Add ``{product_id: units}`` from a new order to both scores"""
+    table = Product._meta.db_table
+    rows = []
+    for product_id, quantity in quantities.items():
+        sales, trend = sale_increments(quantity, at)
+        rows.append((sales, trend, product_id))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {table} SET sales_score = sales_score + %s, '
+            f'trend_score = trend_score + %s WHERE id = %s',
+            rows,
+        )
+
+
+def record_views(counts, at=None):
+    """Add ``{product_id: views}`` to trend_score; fed by the ecommerce.events flusher"""
+    config = settings.POPULARITY
+    factor = config['TREND_VIEW_WEIGHT'] * growth(config['TREND_HALF_LIFE_DAYS'], at)
+    table = Product._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {table} SET trend_score = trend_score + %s WHERE id = %s',
+            [(views * factor, product_id) for product_id, views in counts.items()],
+        )
+
+
+def replay(sales_rows, view_rows):
+    """
+    (sales_score, trend_score) Counters by product from (product_id,
+    quantity, ordered_at) sales and (product_id, views, hour) view rollups
+    """
+    config = settings.POPULARITY
+    sales = Counter()
+    trend = Counter()
+    for product_id, quantity, created_at in sales_rows:
+        sales_inc, trend_inc = sale_increments(quantity, created_at.timestamp())
+        sales[product_id] += sales_inc
+        trend[product_id] += trend_inc
+    for product_id, views, hour in view_rows:
+        trend[product_id] += views * config['TREND_VIEW_WEIGHT'] * growth(config['TREND_HALF_LIFE_DAYS'], hour.timestamp())
+    return sales, trend
+
+
+def rebuild():
+    """Recompute both scores from all orders and the hourly view rollups"""
+    # IMMEDIATE, so an event flush can't add views between the replay and the write
+    with database.atomic('popularity'):
+        sales, trend = replay(
+            OrderItem.objects.values_list(
+                'product_variant__product_id', 'quantity', 'created_at'
+            ).iterator(chunk_size=5000),
+            EventHourly.objects.filter(kind='view', product__isnull=False).values_list(
+                'product_id', 'count', 'hour'
+            ).iterator(chunk_size=5000),
+        )
+        table = Product._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {table} SET sales_score = 0, trend_score = 0')
+            cursor.executemany(
+                f'UPDATE {table} SET sales_score = %s, trend_score = %s WHERE id = %s',
+                [(sales[product_id], trend[product_id], product_id) for product_id in sales.keys() | trend.keys()],
+            )
+    return len(sales.keys() | trend.keys())
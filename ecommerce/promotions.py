@@ -0,0 +1,271 @@
+"""
+Promotions engine: every discount rule is a Coupon row.
+
+A coupon discounts the cart (or only its lines of one category and/or
+brand) by a percentage or a fixed amount, optionally stepped by subtotal
+tiers, or gives buy-X-get-Y on the cheapest qualifying items. Automatic
+coupons apply without a code. Discounts don't stack: the best applicable
+promotion wins, including the entered code.
+
+Active coupons are compiled once per process into Promotion objects,
+indexed by code and by (category, brand) scope. Saving or deleting a Coupon
+stores a new version token in the cache and every worker recompiles on its
+next evaluation. evaluate() sums the cart into per-scope totals in one pass
+over the lines, so each candidate promotion costs a dictionary lookup, and
+promotions scoped to categories or brands not in the cart are never looked at.
+"""
+import threading
+import uuid
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Coupon
+
+
+VERSION_KEY = 'promotions:version'
+CENT = Decimal('0.01')
+ZERO = Decimal('0')
+
+Evaluation = namedtuple('Evaluation', 'discount promotion error')
+
+
+class Promotion:
+    """One Coupon compiled into a discount function"""
+
+    __slots__ = (
+        'id', 'code', 'description', 'kind', 'value', 'tiers', 'minimum', 'maximum',
+        'scope', 'buy', 'get', 'valid_from', 'valid_to', 'remaining', 'is_automatic',
+    )
+
+    def __init__(self, coupon):
+        self.id = coupon.id
+        self.code = coupon.code
+        self.description = coupon.description
+        self.kind = coupon.discount_type
+        self.value = coupon.discount_value
+        # Highest threshold first, so the first one reached wins
+        self.tiers = sorted(
+            ((Decimal(str(threshold)), Decimal(str(value))) for threshold, value in coupon.tiers or ()),
+            reverse=True,
+        )
+        self.minimum = coupon.minimum_order_amount
+        self.maximum = coupon.maximum_discount_amount
+        self.scope = (coupon.category_id, coupon.brand_id)
+        self.buy = coupon.buy_quantity
+        self.get = coupon.get_quantity
+        self.valid_from = coupon.valid_from
+        self.valid_to = coupon.valid_to
+        self.remaining = None if coupon.usage_limit is None else coupon.usage_limit - coupon.used_count
+        self.is_automatic = coupon.is_automatic
+
+    def is_available(self, now):
+        return self.valid_from <= now <= self.valid_to and (self.remaining is None or self.remaining > 0)
+
+    def discount(self, cart):
+        """Discount on a CartLines; zero when nothing in the cart qualifies"""
+        subtotal = cart.totals.get(self.scope)
+        if not subtotal:
+            return ZERO
+        if self.kind == 'buy_x_get_y':
+            amount = cart.free_value(self.scope, self.buy, self.get) * self.value / 100
+        else:
+            value = next((value for threshold, value in self.tiers if subtotal >= threshold), self.value)
+            amount = subtotal * value / 100 if self.kind == 'percentage' else value
+        if self.maximum is not None:
+            amount = min(amount, self.maximum)
+        return min(amount, subtotal).quantize(CENT)
+
+
+def free_units_value(prices, buy, get):
+    """
+    Value of the free units when every ``buy + get`` units, most expensive
+    first, make the last ``get`` free. ``prices`` is [(unit_price, quantity)]
+    sorted by price, highest first.
+    """
+    if not (buy and get):
+        return ZERO
+    group = buy + get
+
+    def free_before(position):
+        return position // group * get + max(0, position % group - buy)
+
+    total = ZERO
+    position = 0
+    for price, quantity in prices:
+        total += price * (free_before(position + quantity) - free_before(position))
+        position += quantity
+    return total
+
+
+class CartLines:
+    """Cart lines summed once per (category, brand) scope for all promotions to share"""
+
+    def __init__(self, lines):
+        self.subtotal = ZERO
+        self.totals = {}
+        self.prices = defaultdict(list)
+        for category_id, brand_id, unit_price, quantity in lines:
+            amount = unit_price * quantity
+            self.subtotal += amount
+            for scope in {(None, None), (category_id, None), (None, brand_id), (category_id, brand_id)}:
+                self.totals[scope] = self.totals.get(scope, ZERO) + amount
+                self.prices[scope].append((unit_price, quantity))
+        self.free = {}
+
+    def scopes(self):
+        """Every promotion scope that matches something in the cart"""
+        return self.totals.keys()
+
+    def free_value(self, scope, buy, get):
+        """free_units_value() of the lines in ``scope``, shared by promotions with the same terms"""
+        key = (scope, buy, get)
+        if key not in self.free:
+            prices = self.prices.get(scope, [])
+            prices.sort(reverse=True)
+            self.free[key] = free_units_value(prices, buy, get)
+        return self.free[key]
+
+
+class Engine:
+    """All active promotions, compiled and indexed"""
+
+    def __init__(self, version, coupons):
+        self.version = version
+        self.by_code = {}
+        self.automatic = defaultdict(list)
+        for coupon in coupons:
+            promotion = Promotion(coupon)
+            self.by_code[promotion.code] = promotion
+            if promotion.is_automatic:
+                self.automatic[promotion.scope].append(promotion)
+
+    def __len__(self):
+        return len(self.by_code)
+
+    def check_code(self, code, now=None, exclude=()):
+        """
+        Why ``code`` can't be used at all, or None. Answered from the
+        compiled index: unknown and expired codes never reach the database.
+        """
+        promotion = self.by_code.get(code)
+        if promotion is None:
+            return 'Invalid coupon code'
+        if not promotion.is_available(now or timezone.now()) or promotion.id in exclude:
+            return 'Invalid or expired coupon code'
+        return None
+
+    def evaluate(self, lines, code='', exclude=()):
+        """
+        Best discount for ``lines`` ([(category_id, brand_id, unit_price,
+        quantity)]), trying automatic promotions and ``code``. ``error``
+        explains why an entered code was not accepted.
+        """
+        cart = CartLines(lines)
+        now = timezone.now()
+        best, best_discount, error = None, ZERO, None
+
+        candidates = [
+            promotion for scope in cart.scopes() for promotion in self.automatic.get(scope, ())
+        ]
+        if code:
+            error = self.check_code(code, now, exclude)
+        if code and not error:
+            promotion = self.by_code[code]
+            if cart.subtotal < promotion.minimum:
+                error = f'Minimum order amount is ${promotion.minimum}'
+            elif not promotion.discount(cart):
+                error = 'This coupon does not apply to the items in your cart'
+            else:
+                candidates.append(promotion)
+
+        for promotion in candidates:
+            if promotion.id in exclude or cart.subtotal < promotion.minimum or not promotion.is_available(now):
+                continue
+            discount = promotion.discount(cart)
+            if discount > best_discount:
+                best, best_discount = promotion, discount
+        return Evaluation(best_discount, best, error)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def compile_promotions(version=None):
+    coupons = Coupon.objects.filter(is_active=True, valid_to__gte=timezone.now())
+    return Engine(version, coupons.iterator(chunk_size=2000))
+
+
+def engine():
+    """This process's compiled promotions, rebuilt when the version moves"""
+    global _engine
+    version = current_version()
+    if _engine is None or _engine.version != version:
+        with _engine_lock:
+            if _engine is None or _engine.version != version:
+                _engine = compile_promotions(version)
+    return _engine
+
+
+def invalidate(sender=None, **kwargs):
+    """post_save/post_delete receiver for Coupon"""
+    # After commit, or another process could recompile from the old rows
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, None))
+
+
+def cart_lines(items):
+    """Engine input from cart lines (CartItem or CartLine with variants loaded)"""
+    return [
+        (
+            item.product_variant.product.category_id,
+            item.product_variant.product.brand_id,
+            item.product_variant.final_price,
+            item.quantity,
+        )
+        for item in items
+    ]
+
+
+def check_code(code):
+    return engine().check_code(code)
+
+
+def evaluate(lines, code='', exclude=()):
+    return engine().evaluate(lines, code, exclude)
+
+
+def claim(promotion):
+    """Count one use if the coupon still has any left; True on success"""
+    claimed = Coupon.objects.filter(pk=promotion.id).filter(
+        Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit'))
+    ).update(used_count=F('used_count') + 1)
+    if claimed and promotion.remaining is not None:
+        # Compiled usage counts are only a hint; refresh them
+        invalidate()
+    return bool(claimed)
+
+
+def redeem(lines, code=''):
+    """
+    evaluate() and claim the winning promotion, falling back to the next
+    best if its uses ran out meanwhile. Call inside the order's transaction.
+    """
+    exclude = set()
+    while True:
+        evaluation = evaluate(lines, code, exclude)
+        if evaluation.promotion is None or claim(evaluation.promotion):
+            return evaluation
+        exclude.add(evaluation.promotion.id)
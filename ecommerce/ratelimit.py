@@ -0,0 +1,84 @@
+"""
+Per-user token buckets for endpoints worth brute-forcing.
+
+    @login_required
+    @rate_limit('apply_coupon')
+    def apply_coupon(request):
+        ...
+
+Each bucket in RATE_LIMITS['BUCKETS'] holds up to ``capacity`` tokens and
+refills at ``refill_per_second``; a request spends one token and is
+answered with 429 when none is left. Buckets are keyed by user, or by
+client address when anonymous, and live in the cache alias
+RATE_LIMITS['CACHE'] so every worker shares them. That alias should be the
+shared cache itself, not the two-tier default, whose local copies would
+let a worker spend from a bucket up to a POLL_INTERVAL old. Reads and
+writes aren't atomic, so racing requests can each spend the same token;
+the limit is a brake on bots, not an exact quota.
+"""
+import math
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+
+KEY = 'ratelimit:%s:%s'
+
+
+def identity(request, user):
+    if user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+
+def take(name, ident):
+    """Spend one token; returns 0 if allowed, else seconds until the next token"""
+    config = settings.RATE_LIMITS['BUCKETS'][name]
+    capacity = config['capacity']
+    rate = config['refill_per_second']
+    cache = caches[settings.RATE_LIMITS['CACHE']]
+    key = KEY % (name, ident)
+
+    now = time.time()
+    tokens, updated = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    # A bucket left alone this long is full again, so it can expire
+    cache.set(key, (tokens, now), math.ceil(capacity / rate) + 1)
+    return 0 if allowed else (1 - tokens) / rate
+
+
+def too_many(wait):
+    response = JsonResponse(
+        {'success': False, 'message': 'Too many attempts, please try again later'}, status=429
+    )
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def rate_limit(name):
+    """View decorator; works on sync and async views"""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                user = await request.auser()
+                wait = await sync_to_async(take)(name, identity(request, user))
+                if wait:
+                    return too_many(wait)
+                return await view(request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                wait = take(name, identity(request, request.user))
+                if wait:
+                    return too_many(wait)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
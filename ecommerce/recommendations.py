@@ -0,0 +1,201 @@
+"""
+"Customers also bought": item-to-item co-occurrence built from OrderItem and
+WishlistItem history.
+
+Each order and each wishlist is a basket. Pair counts are accumulated as a
+sparse delta dict per batch and added to ProductAffinity with one upsert
+statement per chunk, so runs only touch products seen in new baskets. The
+deltas are applied under an IMMEDIATE transaction that re-reads the
+checkpoints first; if an overlapping run moved them meanwhile, the run
+applies nothing, so no basket is ever counted twice. Scores
+are cosine similarity over basket counts, and the top-k per product land in
+RelatedProduct, which product_detail reads with one indexed join.
+"""
+import heapq
+import math
+from collections import defaultdict
+from itertools import combinations, groupby
+
+from django.db import connection, transaction
+from django.db.models import F, Max, Sum
+
+from . import database
+from .models import (
+    BatchCheckpoint, OrderItem, Product, ProductAffinity, RelatedProduct,
+    WishlistItem,
+)
+
+
+ORDER_WEIGHT = 1.0
+WISHLIST_WEIGHT = 0.5
+TOP_K = 12
+# Huge baskets (bulk B2B orders) add n^2 pairs and say little about taste
+MAX_BASKET_SIZE = 50
+CHUNK_SIZE = 500
+
+
+def add_basket(deltas, product_ids, weight, new_ids=None):
+    """
+    Count one basket into ``deltas``. With ``new_ids`` only pairs involving
+    those products are counted, for baskets that were partly seen before.
+    """
+    product_ids = sorted(set(product_ids))[:MAX_BASKET_SIZE]
+    new_ids = set(product_ids) if new_ids is None else set(new_ids) & set(product_ids)
+    for product_id in new_ids:
+        deltas[product_id, product_id] += weight
+    for a, b in combinations(product_ids, 2):
+        if a in new_ids or b in new_ids:
+            deltas[a, b] += weight
+            deltas[b, a] += weight
+
+
+def order_deltas(after_order_id):
+    """Pair deltas from orders newer than the checkpoint"""
+    deltas = defaultdict(float)
+    last_id = after_order_id
+    rows = (
+        OrderItem.objects.filter(order_id__gt=after_order_id)
+        .order_by('order_id')
+        .values_list('order_id', 'product_variant__product_id')
+        .iterator(chunk_size=2000)
+    )
+    for order_id, items in groupby(rows, key=lambda row: row[0]):
+        add_basket(deltas, [product_id for _, product_id in items], ORDER_WEIGHT)
+        last_id = order_id
+    return deltas, last_id
+
+
+def wishlist_deltas(after_item_id):
+    """Pair deltas from wishlist items added since the checkpoint"""
+    deltas = defaultdict(float)
+    new_items = WishlistItem.objects.filter(id__gt=after_item_id)
+    last_id = new_items.aggregate(last=Max('id'))['last'] or after_item_id
+    wishlist_ids = new_items.values('wishlist_id')
+    rows = (
+        WishlistItem.objects.filter(wishlist_id__in=wishlist_ids, id__lte=last_id)
+        .order_by('wishlist_id')
+        .values_list('wishlist_id', 'id', 'product_id')
+        .iterator(chunk_size=2000)
+    )
+    for _, items in groupby(rows, key=lambda row: row[0]):
+        items = list(items)
+        add_basket(
+            deltas,
+            [product_id for _, _, product_id in items],
+            WISHLIST_WEIGHT,
+            new_ids=[product_id for _, item_id, product_id in items if item_id > after_item_id],
+        )
+    return deltas, last_id
+
+
+def apply_deltas(deltas):
+    """Add pair deltas to ProductAffinity with an upsert per chunk"""
+    table = ProductAffinity._meta.db_table
+    sql = (
+        f'INSERT INTO {table} (product_id, other_id, weight) VALUES (%s, %s, %s) '
+        f'ON CONFLICT (product_id, other_id) DO UPDATE SET weight = {table}.weight + excluded.weight'
+    )
+    rows = [(a, b, weight) for (a, b), weight in deltas.items()]
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), CHUNK_SIZE):
+            cursor.executemany(sql, rows[start:start + CHUNK_SIZE])
+
+
+def rebuild_neighbours(product_ids, k=TOP_K):
+    """Recompute the top-k RelatedProduct rows of the given products"""
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), CHUNK_SIZE):
+        chunk = product_ids[start:start + CHUNK_SIZE]
+        rows = ProductAffinity.objects.filter(product_id__in=chunk)
+        pairs = defaultdict(list)
+        for product_id, other_id, weight in rows.values_list('product_id', 'other_id', 'weight'):
+            if product_id != other_id:
+                pairs[product_id].append((other_id, weight))
+
+        # Subqueries rather than id lists: neighbour sets can be large
+        others = rows.values('other_id')
+        basket_counts = dict(
+            ProductAffinity.objects.filter(product_id__in=others, other_id=F('product_id'))
+            .values_list('product_id', 'weight')
+        )
+        active = set(
+            Product.objects.filter(id__in=others, is_active=True).values_list('id', flat=True)
+        )
+
+        links = []
+        for product_id in chunk:
+            own = basket_counts.get(product_id)
+            if not own:
+                continue
+            scored = (
+                (weight / math.sqrt(own * basket_counts[other_id]), other_id)
+                for other_id, weight in pairs[product_id]
+                if other_id in active and basket_counts.get(other_id)
+            )
+            for rank, (score, other_id) in enumerate(heapq.nlargest(k, scored), start=1):
+                links.append(RelatedProduct(product_id=product_id, related_id=other_id, rank=rank, score=score))
+
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=chunk).delete()
+            RelatedProduct.objects.bulk_create(links)
+
+
+def update(full=False):
+    """
+    Fold new orders and wishlist items into the affinity table and refresh
+    the neighbours of every product they touched. Returns that product count.
+    """
+    if full:
+        ProductAffinity.objects.all().delete()
+        RelatedProduct.objects.all().delete()
+        BatchCheckpoint.objects.filter(name__startswith='recommendations.').delete()
+
+    orders, _ = BatchCheckpoint.objects.get_or_create(name='recommendations.orders')
+    wishlists, _ = BatchCheckpoint.objects.get_or_create(name='recommendations.wishlists')
+
+    deltas, last_order_id = order_deltas(orders.position)
+    wish_deltas, last_item_id = wishlist_deltas(wishlists.position)
+    for pair, weight in wish_deltas.items():
+        deltas[pair] += weight
+
+    with database.atomic('recommendations'):
+        # Under the write lock, so an overlapping run can't apply the same range
+        positions = dict(
+            BatchCheckpoint.objects.select_for_update()
+            .filter(pk__in=[orders.pk, wishlists.pk])
+            .values_list('pk', 'position')
+        )
+        if positions != {orders.pk: orders.position, wishlists.pk: wishlists.position}:
+            return 0
+        apply_deltas(deltas)
+        orders.position = last_order_id
+        orders.save()
+        wishlists.position = last_item_id
+        wishlists.save()
+
+    touched = {a for a, _ in deltas}
+    rebuild_neighbours(touched)
+    return len(touched)
+
+
+def related_products(product):
+    """Precomputed neighbours of ``product``, best first"""
+    return (
+        Product.objects.filter(recommended_for__product=product, is_active=True)
+        .order_by('recommended_for__rank')
+    )
+
+
+def for_customer(user):
+    """Neighbours of the customer's recent purchases they haven't bought yet"""
+    recent = (
+        OrderItem.objects.filter(order__customer__user=user)
+        .order_by('-order__created_at')
+        .values('product_variant__product_id')[:20]
+    )
+    return (
+        Product.objects.filter(recommended_for__product__in=recent, is_active=True)
+        .exclude(id__in=recent)
+        .annotate(affinity=Sum('recommended_for__score'))
+        .order_by('-affinity')
+    )
@@ -0,0 +1,145 @@
+"""
+Process-wide snapshot of the small reference tables: Color, Size, Category,
+SubCategory and Brand, plus counts of active products per category,
+subcategory and brand, and the category navigation tree built from them
+(rendered by the ``category_nav`` template tag).
+
+snapshot() returns the current Snapshot. Its maps are read-only and are
+never mutated after construction; a change builds a whole new Snapshot and
+swaps the module reference, so a request that holds one sees a consistent
+set. Saving or deleting any of these models (or a Product, which moves the
+counts) stores a new version token in the cache, and each process rebuilds
+on its next snapshot() call. Between rebuilds, lookups cost no queries.
+
+Treat the model instances as read-only too; they are shared by every
+request in the process.
+"""
+import threading
+import uuid
+from collections import defaultdict
+from types import MappingProxyType
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.urls import reverse
+
+from .models import Brand, Category, Color, Product, Size, SubCategory
+
+
+VERSION_KEY = 'refdata:version'
+
+
+def by_id(objects):
+    return MappingProxyType({obj.pk: obj for obj in objects})
+
+
+class Snapshot:
+    """Reference data as of one version"""
+
+    def __init__(self, version):
+        self.version = version
+        active_products = Q(products__is_active=True)
+        categories = list(Category.objects.annotate(product_count=Count('products', filter=active_products)))
+        brands = list(Brand.objects.annotate(product_count=Count('products', filter=active_products)))
+        subcategories = list(SubCategory.objects.annotate(product_count=Count('products', filter=active_products)))
+        self.colors = by_id(Color.objects.all())
+        self.sizes = by_id(Size.objects.all())
+        self.categories = by_id(categories)
+        self.subcategories = by_id(subcategories)
+        self.brands = by_id(brands)
+        self.category_by_slug = MappingProxyType({category.slug: category for category in categories})
+        self.brand_by_slug = MappingProxyType({brand.slug: brand for brand in brands})
+        # In model ordering (by name), as the querysets they replace
+        self.active_categories = tuple(category for category in categories if category.is_active)
+        self.active_brands = tuple(brand for brand in brands if brand.is_active)
+
+        brand_ids = defaultdict(set)
+        pairs = Product.objects.filter(is_active=True).values_list('category_id', 'brand_id').distinct()
+        for category_id, brand_id in pairs:
+            brand_ids[category_id].add(brand_id)
+        self.brands_by_category = MappingProxyType({
+            category_id: tuple(brand for brand in self.active_brands if brand.pk in ids)
+            for category_id, ids in brand_ids.items()
+        })
+
+        # Children point at the shared parents, so str() needs no query
+        for subcategory in self.subcategories.values():
+            subcategory.category = self.categories[subcategory.category_id]
+
+        self.category_tree = category_tree(self.active_categories, subcategories)
+
+    def active_category(self, slug):
+        category = self.category_by_slug.get(slug)
+        return category if category is not None and category.is_active else None
+
+    def attach(self, variants):
+        """Point variants at the shared Color and Size instead of loading them"""
+        for variant in variants:
+            # Rows newer than the snapshot are left to load normally
+            if variant.color_id in self.colors:
+                variant.color = self.colors[variant.color_id]
+            if variant.size_id in self.sizes:
+                variant.size = self.sizes[variant.size_id]
+        return variants
+
+
+def category_tree(categories, subcategories):
+    """
+    Navigation menu as plain tuples and dicts: active categories, each with
+    its active subcategories, product counts and URLs, ready for templates.
+    """
+    children = defaultdict(list)
+    for subcategory in subcategories:
+        if subcategory.is_active:
+            children[subcategory.category_id].append(subcategory)
+    tree = []
+    for category in categories:
+        url = reverse('category_products', args=[category.slug])
+        tree.append(MappingProxyType({
+            'id': category.pk,
+            'name': category.name,
+            'slug': category.slug,
+            'url': url,
+            'product_count': category.product_count,
+            'subcategories': tuple(
+                MappingProxyType({
+                    'id': subcategory.pk,
+                    'name': subcategory.name,
+                    'slug': subcategory.slug,
+                    'url': f'{url}?subcategory={subcategory.slug}',
+                    'product_count': subcategory.product_count,
+                })
+                for subcategory in children[category.pk]
+            ),
+        }))
+    return tuple(tree)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def snapshot():
+    """The current Snapshot, rebuilt when the version moves"""
+    global _snapshot
+    version = current_version()
+    if _snapshot is None or _snapshot.version != version:
+        with _snapshot_lock:
+            if _snapshot is None or _snapshot.version != version:
+                _snapshot = Snapshot(version)
+    return _snapshot
+
+
+def invalidate(sender=None, **kwargs):
+    """post_save/post_delete receiver for the reference models and Product"""
+    # After commit, or another process could rebuild from the old rows
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, None))
@@ -0,0 +1,105 @@
+"""
+Primary/replica database routing.
+
+Catalog and report reads go to the aliases in settings.DATABASE_REPLICAS;
+writes, and reads of cart/checkout/auth data, stay on ``default``. Once a
+request writes, it and the same browser's requests for the next
+REPLICA_PIN_SECONDS read from the primary too, so users see their own writes
+before the replicas catch up.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+PIN_COOKIE = 'pin_primary'
+
+# Request-local flags; contextvars follow asgiref's thread hops under ASGI
+_pinned = ContextVar('pinned_to_primary', default=False)
+_wrote = ContextVar('wrote_to_primary', default=False)
+
+
+def pin_to_primary():
+    """Send the remaining reads of this request to the primary"""
+    _pinned.set(True)
+    _wrote.set(True)
+
+
+class PrimaryReplicaRouter:
+    # Read straight after being written, or guarding the login/checkout flow
+    primary_apps = {'auth', 'sessions', 'admin', 'contenttypes'}
+    primary_models = {'customer', 'address', 'cart', 'cartitem', 'coupon'}
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or _pinned.get():
+            return DEFAULT_DB_ALIAS
+        opts = model._meta
+        if opts.app_label in self.primary_apps or opts.model_name in self.primary_models:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas are full copies of the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pins a browser to the primary for REPLICA_PIN_SECONDS after it writes.
+    Must sit above SessionMiddleware so session saves count as writes.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self.start(request)
+        try:
+            return self.finish(self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    async def __acall__(self, request):
+        tokens = self.start(request)
+        try:
+            return self.finish(await self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    def start(self, request):
+        return _pinned.set(PIN_COOKIE in request.COOKIES), _wrote.set(False)
+
+    def finish(self, response):
+        if _wrote.get():
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def reset(self, tokens):
+        pinned_token, wrote_token = tokens
+        _pinned.reset(pinned_token)
+        _wrote.reset(wrote_token)
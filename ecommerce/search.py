@@ -0,0 +1,244 @@
+"""
+Storefront product search behind index().
+
+exact() is the substring match on product, brand and category names and
+descriptions. When it finds fewer than SEARCH['FUZZY_MIN_RESULTS'] products,
+fuzzy() corrects each query word to the catalog words within
+SEARCH['FUZZY_THRESHOLD'] trigram similarity ("addidas" -> "adidas",
+"nkie" -> "nike") and matches the products, brands and categories that
+contain them. It reads only the typeahead snapshot, never the products
+table, and its work is bounded by the FUZZY_MAX_* settings, not by the
+size of the catalog.
+
+listing() is everything index() shows for one query, filters and page,
+ready for the template. It is cached in the SEARCH['CACHE'] alias under the
+normalized query, filters, page and the catalog version. Before the key is
+built, category and brand slugs missing from the refdata snapshot are
+dropped and pages past the last are clamped, using the count cached with
+page 1, so arbitrary parameters can't fill the cache. Saving or deleting a
+Product, ProductImage, Brand or Category moves the version after commit,
+so every cached listing is orphaned at once and expires on its own.
+The shared alias is used directly, like the rate limiter's: listings are
+many and large, and would only churn the workers' local LRUs.
+warm() fills the cache for the most searched queries in the search log;
+the warm_search_cache task does that at SEARCH['WARM_HOURS'], ahead of
+the daily peaks.
+"""
+import hashlib
+import heapq
+import uuid
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Prefetch, Q, Sum
+from django.utils import timezone
+
+from . import events, refdata, typeahead
+from .models import EventHourly, Product, ProductImage
+
+
+VERSION_KEY = 'search:version'
+PAGE_SIZE = 12
+
+Correction = namedtuple('Correction', 'condition query')
+Listing = namedtuple('Listing', 'featured latest page_products page_number count corrected_query')
+
+
+def exact(query):
+    return (
+        Q(name__icontains=query) |
+        Q(description__icontains=query) |
+        Q(brand__name__icontains=query) |
+        Q(category__name__icontains=query)
+    )
+
+
+def fuzzy(query, index=None):
+    """
+    Correction with a product filter for ``query`` and the query as it was
+    understood, or None when no word is close to anything in the catalog.
+    Every understood word must match; words that match nothing are dropped.
+    """
+    if index is None:
+        index = typeahead.index()
+    if index is None:
+        return None
+    config = settings.SEARCH
+    matched = None
+    understood = []
+    for word in typeahead.normalize(query).split(' ')[:config['FUZZY_MAX_WORDS']]:
+        if len(word) < 3:
+            continue
+        similar = index.similar_words(
+            word, config['FUZZY_THRESHOLD'], config['FUZZY_MAX_POSTINGS'], config['FUZZY_MAX_CANDIDATES']
+        )[:config['FUZZY_MAX_CORRECTIONS']]
+        if not similar:
+            continue
+        understood.append(similar[0][1])
+        ranks = set().union(*(index.word_ranks(candidate) for similarity, candidate in similar))
+        matched = ranks if matched is None else matched & ranks
+    if not matched:
+        return None
+
+    ids = defaultdict(list)
+    # Lowest ranks are the most popular entries
+    for rank in heapq.nsmallest(config['FUZZY_MAX_MATCHES'], matched):
+        kind, pk = index.entry(rank)[:2]
+        ids[kind].append(pk)
+    condition = Q(id__in=ids['product']) | Q(brand_id__in=ids['brand']) | Q(category_id__in=ids['category'])
+    return Correction(condition, ' '.join(understood))
+
+
+def search(products, query):
+    """
+    ``products`` matching ``query``, with the fuzzy matches added when the
+    exact ones are too few. Returns (products, corrected query or None).
+    """
+    condition = exact(query)
+    minimum = settings.SEARCH['FUZZY_MIN_RESULTS']
+    if len(products.filter(condition).values('id')[:minimum]) < minimum:
+        correction = fuzzy(query)
+        if correction is not None:
+            return products.filter(condition | correction.condition), correction.query
+    return products.filter(condition), None
+
+
+def add_template_properties(product_list):
+    for product in product_list:
+        # Get primary image or first image
+        primary_images = [img for img in product.images.all() if img.is_primary]
+        if primary_images:
+            product.image = primary_images[0]
+        elif product.images.all():
+            product.image = product.images.all()[0]
+        else:
+            product.image = None
+
+        # Add price property for template compatibility
+        product.price = product.effective_price
+    return product_list
+
+
+def page_number(page):
+    """The page index() will show; anything that isn't a page number is 1"""
+    try:
+        return max(int(page), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def compute_listing(query, category='', brand='', page=1):
+    """Listing for a normalized query, category and brand slugs and page"""
+    # Base queryset for products with optimized queries
+    products = Product.objects.filter(is_active=True).select_related(
+        'brand', 'category'
+    ).prefetch_related(
+        Prefetch('images', queryset=ProductImage.objects.filter(is_primary=True))
+    )
+
+    corrected_query = None
+    if query:
+        products, corrected_query = search(products, query)
+    if category:
+        products = products.filter(category__slug=category)
+    if brand:
+        products = products.filter(brand__slug=brand)
+
+    featured = add_template_properties(list(products.filter(is_featured=True)[:8]))
+    latest = add_template_properties(list(products.order_by('-created_at')[:12]))
+
+    # Pagination for search results
+    page_products, number, count = None, 1, 0
+    if query or category or brand:
+        paginated = Paginator(products, PAGE_SIZE).get_page(page)
+        page_products = add_template_properties(list(paginated.object_list))
+        number, count = paginated.number, paginated.paginator.count
+    return Listing(featured, latest, page_products, number, count, corrected_query)
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def listing_key(query, category, brand, page):
+    digest = hashlib.md5(f'{query}\n{category}\n{brand}\n{page}'.encode()).hexdigest()
+    return f'search:{current_version()}:{digest}'
+
+
+def cached_listing(query, category, brand, page):
+    results = caches[settings.SEARCH['CACHE']]
+    key = listing_key(query, category, brand, page)
+    cached = results.get(key)
+    if cached is None:
+        cached = compute_listing(query, category, brand, page)
+        results.set(key, cached, settings.SEARCH['CACHE_SECONDS'])
+    return cached
+
+
+def listing(query, category='', brand='', page=None):
+    """Cached compute_listing() for raw query, filter and page parameters"""
+    query = events.normalize_query(query)
+    refs = refdata.snapshot()
+    category = category if category in refs.category_by_slug else ''
+    brand = brand if brand in refs.brand_by_slug else ''
+    page = page_number(page)
+    if page > 1:
+        # Key on the page that will be shown, so ?page=N can't add entries
+        count = cached_listing(query, category, brand, 1).count
+        page = min(page, Paginator(range(count), PAGE_SIZE).num_pages)
+    return cached_listing(query, category, brand, page)
+
+
+def paginate(result):
+    """A Page like Paginator.get_page() gives, without recounting the products"""
+    if result.page_products is None:
+        return None
+    page = Paginator(range(result.count), PAGE_SIZE).get_page(result.page_number)
+    page.object_list = result.page_products
+    return page
+
+
+def invalidate(sender=None, **kwargs):
+    """post_save/post_delete receiver for Product, ProductImage, Brand and Category"""
+    # After commit, or another process could cache the old rows under the new version
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, None))
+
+
+def popular_queries(top, days):
+    """The ``top`` most searched normalized queries over the last ``days`` days"""
+    since = timezone.now() - timedelta(days=days)
+    return list(
+        EventHourly.objects.filter(kind='search', product__isnull=True, hour__gte=since)
+        .values('query')
+        .annotate(total=Sum('count'))
+        .order_by('-total', 'query')
+        .values_list('query', flat=True)[:top]
+    )
+
+
+def warm(top=None, days=None):
+    """Cache the first page of the most searched queries; returns how many"""
+    config = settings.SEARCH
+    queries = popular_queries(top or config['WARM_TOP'], days or config['WARM_DAYS'])
+    results = caches[config['CACHE']]
+    for query in queries:
+        results.set(listing_key(query, '', '', 1), compute_listing(query), config['CACHE_SECONDS'])
+    return len(queries)
+
+
+def seconds_until_warm(now=None):
+    """Seconds from ``now`` to the next of SEARCH['WARM_HOURS'], in local time"""
+    now = timezone.localtime(now)
+    runs = [
+        now.replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=days)
+        for days in (0, 1) for hour in settings.SEARCH['WARM_HOURS']
+    ]
+    return min((run - now).total_seconds() for run in runs if run > now)
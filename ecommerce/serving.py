@@ -0,0 +1,201 @@
+"""
+Production file serving for MEDIA_ROOT and STATIC_ROOT.
+
+Adds what ``django.views.static.serve`` leaves out: strong ETags, long-lived
+Cache-Control for hashed file names, single HTTP Range requests and an
+X-Accel-Redirect / X-Sendfile mode for a front proxy.
+"""
+import mimetypes
+import posixpath
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+
+# ManifestStaticFilesStorage appends the first 12 hex digits of the MD5
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Matches django.views.static.serve: never let the browser decompress these
+ENCODED_CONTENT_TYPES = {
+    'br': 'application/x-brotli',
+    'bzip2': 'application/x-bzip',
+    'compress': 'application/x-compress',
+    'gzip': 'application/gzip',
+    'xz': 'application/x-xz',
+}
+
+
+class FileRange:
+    """Read-only view of ``length`` bytes of an open file, from ``offset``.
+
+    ``fileno()`` passes through to the real file, so WSGI servers whose
+    ``wsgi.file_wrapper`` uses ``os.sendfile`` (gunicorn, uWSGI) still send
+    the range zero-copy; they start at the current offset and stop at
+    Content-Length.
+    """
+
+    def __init__(self, file, offset, length):
+        file.seek(offset)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def make_etag(statobj):
+    """Strong validator from mtime and size, the same scheme nginx uses"""
+    return '"%x-%x"' % (statobj.st_mtime_ns, statobj.st_size)
+
+
+def cache_control(path):
+    """Hashed names never change content, everything else must revalidate"""
+    if HASHED_NAME_RE.search(path):
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f'public, max-age={settings.FILE_SERVE_MAX_AGE}'
+
+
+def parse_range(header, size):
+    """
+    Return the ``(start, end)`` byte positions (inclusive) requested by a
+    Range header, or None when the whole file should be sent. Multi-range
+    and malformed headers are ignored as RFC 9110 allows. Raises ValueError
+    when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        if size == 0:
+            # No last byte to count back from (RFC 9110 section 14.1.2)
+            raise ValueError('Range not satisfiable')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('Range not satisfiable')
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag, mtime):
+    """A Range only applies if If-Range (when sent) still matches the file"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return parse_etags(if_range) == [etag]
+    since = parse_http_date_safe(if_range)
+    return since == int(mtime)
+
+
+@require_safe
+def serve(request, path, document_root=None, accel_prefix=None):
+    """
+    Serve a file below ``document_root``.
+
+    With ``FILE_SERVE_BACKEND`` set to ``'x-accel-redirect'`` or
+    ``'x-sendfile'`` the body is left to the front proxy; ``accel_prefix``
+    is the internal nginx location mapped onto ``document_root``.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    fullpath = Path(safe_join(document_root, path))
+    if not fullpath.is_file():
+        raise Http404('File not found')
+
+    statobj = fullpath.stat()
+    etag = make_etag(statobj)
+    content_type, encoding = mimetypes.guess_type(str(fullpath))
+    content_type = ENCODED_CONTENT_TYPES.get(encoding, content_type) or 'application/octet-stream'
+
+    backend = settings.FILE_SERVE_BACKEND
+    if backend == 'x-accel-redirect':
+        # nginx does conditional and Range handling itself
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(path)
+        response['Cache-Control'] = cache_control(path)
+        return response
+    if backend == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = str(fullpath)
+        response['Cache-Control'] = cache_control(path)
+        return response
+
+    # Validators go on every response, including 304 and 206
+    headers = HttpResponse()
+    headers['ETag'] = etag
+    headers['Last-Modified'] = http_date(statobj.st_mtime)
+    headers['Cache-Control'] = cache_control(path)
+    headers['Accept-Ranges'] = 'bytes'
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=int(statobj.st_mtime), response=headers
+    )
+    if conditional is not headers:
+        return conditional
+
+    size = statobj.st_size
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and if_range_matches(request, etag, statobj.st_mtime):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = fullpath.open('rb')
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end - start + 1), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        response = FileResponse(file, content_type=content_type)
+    response.block_size = settings.FILE_SERVE_BLOCK_SIZE
+
+    for header in ('ETag', 'Last-Modified', 'Cache-Control', 'Accept-Ranges'):
+        response[header] = headers[header]
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+def file_patterns(prefix, document_root, accel_prefix=None):
+    """URL patterns serving ``document_root`` under ``prefix``, like ``static()``"""
+    return [
+        re_path(
+            r'^%s(?P<path>.*)$' % re.escape(prefix.lstrip('/')),
+            serve,
+            kwargs={'document_root': document_root, 'accel_prefix': accel_prefix},
+        ),
+    ]
@@ -0,0 +1,239 @@
+"""
+Database-backed queue for work that shouldn't hold up a request.
+
+    @task(queue='emails', max_attempts=5)
+    def send_order_confirmation(order_id):
+        ...
+
+    send_order_confirmation.delay(order.id)
+
+delay() inserts a Task row in the caller's transaction, so a job enqueued
+during checkout only exists if the order commits. The run_tasks command
+claims due jobs with one ``UPDATE ... RETURNING`` statement, highest
+priority first, and runs them on a thread or process pool. Failures are
+retried with exponential backoff until max_attempts. Jobs whose worker
+died are requeued after LOCK_TIMEOUT_SECONDS without a heartbeat(); a task
+that can run longer than that calls heartbeat() as it goes.
+
+A ``unique`` task has at most one identical call waiting, enforced by a
+partial unique index on its unique_key, and claim() skips it while an
+identical call is running, so two runs never overlap. A call queued during a
+run waits for that run to finish and then picks up what it missed.
+
+Task functions live in each app's ``tasks`` module and take JSON-safe
+arguments (ids rather than model instances).
+"""
+import functools
+import hashlib
+import json
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules, import_string
+
+from .models import Task
+
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+# The Task being run by execute() on this thread
+current = threading.local()
+
+
+class TaskFunction:
+    """A function registered with @task; call it directly or .delay() it"""
+
+    def __init__(self, func, queue, priority, max_attempts, unique):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.queue = queue
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.unique = unique
+        registry[self.name] = self
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return self.enqueue(args, kwargs)
+
+    def unique_key(self, args, kwargs):
+        call = json.dumps([self.name, list(args), kwargs], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(call.encode()).hexdigest()
+
+    def enqueue(self, args=(), kwargs=None, priority=None, countdown=0):
+        """Queue a run; returns the Task, or None if run eagerly or deduplicated"""
+        kwargs = kwargs or {}
+        if settings.TASKS['EAGER']:
+            self.func(*args, **kwargs)
+            return None
+        try:
+            # A savepoint, so a duplicate doesn't break the caller's transaction
+            with transaction.atomic():
+                return Task.objects.create(
+                    queue=self.queue,
+                    name=self.name,
+                    args=list(args),
+                    kwargs=kwargs,
+                    priority=self.priority if priority is None else priority,
+                    max_attempts=self.max_attempts,
+                    run_at=timezone.now() + timedelta(seconds=countdown),
+                    unique_key=self.unique_key(args, kwargs) if self.unique else '',
+                )
+        except IntegrityError:
+            if not self.unique:
+                raise
+            return None
+
+
+def task(func=None, *, queue='default', priority=0, max_attempts=5, unique=False):
+    """
+    Register a background task. ``unique`` skips enqueueing while an
+    identical call is still waiting and never runs two identical calls at
+    once, for idempotent catch-up jobs.
+    """
+    def decorator(func):
+        return TaskFunction(func, queue, priority, max_attempts, unique)
+    return decorator(func) if func else decorator
+
+
+def load_tasks():
+    """Import every installed app's tasks module so the registry is complete"""
+    autodiscover_modules('tasks')
+
+
+def claim(queues, worker, limit):
+    """
+    Atomically mark up to ``limit`` due tasks as running; returns their ids.
+    Unique tasks with an identical call still running are left queued.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    table = Task._meta.db_table
+    placeholders = ', '.join(['%s'] * len(queues))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET status = 'running', locked_by = %s, started_at = %s, "
+            f"heartbeat_at = %s, attempts = attempts + 1 "
+            f"WHERE id IN ("
+            f"SELECT id FROM {table} AS t WHERE status = 'queued' AND queue IN ({placeholders}) "
+            f"AND run_at <= %s AND (unique_key = '' OR NOT EXISTS ("
+            f"SELECT 1 FROM {table} WHERE status = 'running' AND unique_key != '' "
+            f"AND unique_key = t.unique_key"
+            f")) ORDER BY priority DESC, run_at, id LIMIT %s"
+            f") RETURNING id",
+            [worker, now, now, *queues, now, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def backoff(attempts):
+    config = settings.TASKS
+    return min(config['BACKOFF_SECONDS'] * 2 ** (attempts - 1), config['BACKOFF_MAX_SECONDS'])
+
+
+def execute(task_id):
+    """Run one claimed task and record the outcome"""
+    job = Task.objects.get(pk=task_id)
+    current.task_id = job.pk
+    try:
+        func = registry.get(job.name) or import_string(job.name)
+        func(*job.args, **job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()[-4000:]
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+            logger.error('Task %s #%s failed for good', job.name, job.pk)
+        else:
+            job.status = 'queued'
+            job.run_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+    else:
+        job.status = 'done'
+        job.finished_at = timezone.now()
+    finally:
+        current.task_id = None
+    job.locked_by = ''
+    fields = ['status', 'run_at', 'finished_at', 'last_error', 'locked_by']
+    try:
+        with transaction.atomic():
+            job.save(update_fields=fields)
+    except IntegrityError:
+        # An identical unique call was queued meanwhile and will redo the work
+        job.status = 'failed'
+        job.finished_at = timezone.now()
+        job.save(update_fields=fields)
+    return job.status
+
+
+def heartbeat():
+    """
+    Keep the running task's lock from going stale. Returns False outside a
+    task run, or when the task was already requeued as stale.
+    """
+    task_id = getattr(current, 'task_id', None)
+    if task_id is None:
+        return False
+    return bool(Task.objects.filter(pk=task_id, status='running').update(heartbeat_at=timezone.now()))
+
+
+def requeue_stale():
+    """
+    Give jobs of crashed workers back to the queue. A unique job with an
+    identical call already waiting is failed instead; the waiting one redoes it.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.TASKS['LOCK_TIMEOUT_SECONDS'])
+    stale = Task.objects.alias(seen_at=Coalesce('heartbeat_at', 'started_at')).filter(
+        status='running', seen_at__lt=cutoff
+    )
+    waiting = Task.objects.filter(status='queued').exclude(unique_key='').values('unique_key')
+    with transaction.atomic():
+        stale.exclude(unique_key='').filter(unique_key__in=waiting).update(
+            status='failed', locked_by='', finished_at=now,
+            last_error='Worker died; an identical call is already queued',
+        )
+        return stale.update(status='queued', locked_by='', run_at=now)
+
+
+def purge_finished():
+    """Delete done tasks past KEEP_DONE_DAYS; failed ones stay for inspection"""
+    cutoff = timezone.now() - timedelta(days=settings.TASKS['KEEP_DONE_DAYS'])
+    return Task.objects.filter(status='done', finished_at__lt=cutoff).delete()[0]
+
+
+def queue_stats():
+    """Per-queue depth, lag and recent throughput"""
+    now = timezone.now()
+    hour_ago = now - timedelta(hours=1)
+    runtime = ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())
+    rows = Task.objects.values('queue').annotate(
+        queued=Count('id', filter=Q(status='queued')),
+        due=Count('id', filter=Q(status='queued', run_at__lte=now)),
+        running=Count('id', filter=Q(status='running')),
+        failed=Count('id', filter=Q(status='failed')),
+        done_last_hour=Count('id', filter=Q(status='done', finished_at__gte=hour_ago)),
+        retried_last_hour=Count('id', filter=Q(attempts__gt=1, started_at__gte=hour_ago)),
+        oldest_due=Min('run_at', filter=Q(status='queued', run_at__lte=now)),
+        avg_runtime=Avg(runtime, filter=Q(status='done', finished_at__gte=hour_ago)),
+    ).order_by('queue')
+
+    stats = {}
+    for row in rows:
+        queue = row.pop('queue')
+        oldest_due = row.pop('oldest_due')
+        avg_runtime = row.pop('avg_runtime')
+        row['lag_seconds'] = round((now - oldest_due).total_seconds(), 1) if oldest_due else 0
+        row['avg_runtime_seconds'] = round(avg_runtime.total_seconds(), 3) if avg_runtime else None
+        stats[queue] = row
+    return stats
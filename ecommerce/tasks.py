@@ -0,0 +1,62 @@
+"""Background jobs run by the run_tasks worker (see ecommerce.taskqueue)"""
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from . import alerts, newsletter, recommendations, search, taskqueue, typeahead
+from .models import Campaign, Order
+from .taskqueue import task
+
+
+@task(queue='emails', priority=10)
+def send_order_confirmation(order_id):
+    """Email the customer a summary of a newly placed order"""
+    order = Order.objects.select_related('customer__user').get(pk=order_id)
+    email = order.customer.user.email
+    if not email:
+        return
+    body = render_to_string('emails/order_confirmation.txt', {
+        'order': order,
+        'items': order.items.all(),
+    })
+    send_mail(f'Your order {order.order_number}', body, None, [email])
+
+
+@task(priority=-10, unique=True)
+def update_recommendations():
+    """Fold new orders and wishlist items into "customers also bought" """
+    recommendations.update()
+
+
+@task(queue='emails', max_attempts=3, unique=True)
+def send_campaign(campaign_id):
+    """Stage and deliver a newsletter campaign; reruns resume where it stopped"""
+    campaign = Campaign.objects.get(pk=campaign_id)
+    newsletter.stage(campaign)
+    # A large campaign outlives LOCK_TIMEOUT_SECONDS
+    newsletter.deliver(campaign, progress=lambda counts: taskqueue.heartbeat())
+
+
+@task(queue='emails', unique=True)
+def fan_out_alerts(kind, target_id, old_price=None):
+    """Split a restock or price drop's subscribers into deliver_alerts batches"""
+    alerts.fan_out(kind, target_id, old_price)
+
+
+@task(queue='emails', unique=True)
+def deliver_alerts(kind, target_id, first_id, last_id):
+    """Email one batch of back-in-stock or price-drop alerts"""
+    alerts.deliver(kind, target_id, first_id, last_id)
+
+
+@task(priority=-5, unique=True)
+def refresh_typeahead():
+    """Fold catalog edits into the autocomplete snapshot"""
+    typeahead.refresh()
+
+
+@task(priority=-5, unique=True)
+def warm_search_cache():
+    """Precompute the most searched queries, then queue the next run"""
+    # Queued first, so a failed run doesn't end the schedule
+    warm_search_cache.enqueue(countdown=search.seconds_until_warm())
+    search.warm()
@@ -0,0 +1,16 @@
+from django import template
+
+from ecommerce import refdata
+
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/category_nav.html', takes_context=True)
+def category_nav(context):
+    """Category menu with subcategories and product counts; no queries between changes"""
+    request = context.get('request')
+    return {
+        'tree': refdata.snapshot().category_tree,
+        'current_path': request.path if request else '',
+    }
@@ -0,0 +1,14 @@
+"""The AJAX routes as the ASGI profile serves them, from async_views"""
+from django.urls import include, path
+
+from .. import async_views
+
+
+urlpatterns = [
+    path('cart/add/', async_views.add_to_cart, name='add_to_cart'),
+    path('cart/update/', async_views.update_cart, name='update_cart'),
+    path('cart/remove/', async_views.remove_from_cart, name='remove_from_cart'),
+    path('ajax/apply-coupon/', async_views.apply_coupon, name='apply_coupon'),
+    path('ajax/variant-info/', async_views.get_variant_info, name='get_variant_info'),
+    path('', include('mkurugenzisite.urls')),
+]
@@ -0,0 +1,138 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from .. import alerts
+from ..models import Customer, Product, ProductAlert, ProductVariant, Task, Wishlist, WishlistItem
+from .utils import TEST_CACHES, make_catalog
+
+
+class AlertTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category, nike, adidas, (cls.nike_42, cls.adidas_42) = make_catalog()
+        cls.product = cls.nike_42.product
+        cls.user = User.objects.create_user('shopper', 'shopper@example.com')
+        cls.fan = User.objects.create_user('fan', 'fan@example.com')
+        cls.wishlist = Wishlist.objects.create(customer=Customer.objects.create(user=cls.fan))
+
+    def variant(self):
+        return ProductVariant.objects.get(pk=self.nike_42.pk)
+
+    def product_now(self):
+        return Product.objects.get(pk=self.product.pk)
+
+    def set_stock(self, quantity):
+        variant = self.variant()
+        variant.stock_quantity = quantity
+        variant.save()
+
+    def set_price(self, price):
+        product = self.product_now()
+        product.base_price = Decimal(price)
+        product.save()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class EdgeTriggerTests(AlertTestCase):
+    def fan_outs(self):
+        return list(Task.objects.filter(name='ecommerce.tasks.fan_out_alerts').values_list('args', flat=True))
+
+    def test_stock_arriving_queues_one_fan_out(self):
+        self.set_stock(0)
+        self.assertEqual(self.fan_outs(), [])
+        self.set_stock(5)
+        self.assertEqual(self.fan_outs(), [['back_in_stock', self.nike_42.pk]])
+        # Still in stock, or other fields changing: no edge
+        self.set_stock(7)
+        variant = self.variant()
+        variant.price_adjustment = Decimal('1.00')
+        variant.save()
+        self.assertEqual(len(self.fan_outs()), 1)
+
+    def test_only_a_lower_price_queues_a_fan_out(self):
+        self.set_price('45.00')
+        product = self.product_now()
+        product.description = 'Lighter'
+        product.save()
+        self.assertEqual(self.fan_outs(), [])
+        self.set_price('30.00')
+        self.assertEqual(self.fan_outs(), [['price_drop', self.product.pk, '45.00']])
+
+    def test_a_discount_counts_as_a_drop(self):
+        product = self.product_now()
+        product.discount_price = Decimal('35.00')
+        product.save()
+        self.assertEqual(self.fan_outs(), [['price_drop', self.product.pk, '40.00']])
+
+    def test_a_save_costs_one_lookup(self):
+        variant = self.variant()
+        variant.stock_quantity = 8
+        # The pre_save read, the UPDATE, and the availability refresh's read and write
+        with self.assertNumQueries(4):
+            variant.save()
+
+
+@override_settings(CACHES=TEST_CACHES, TASKS={**settings.TASKS, 'EAGER': True})
+class DeliveryTests(AlertTestCase):
+    def test_back_in_stock_is_sent_once(self):
+        self.set_stock(0)
+        alert = alerts.subscribe(self.user, variant=self.variant())
+        self.set_stock(3)
+        self.assertEqual([message.to for message in mail.outbox], [['shopper@example.com']])
+        self.assertIn('back in stock', mail.outbox[0].subject)
+        alert.refresh_from_db()
+        self.assertIsNotNone(alert.notified_at)
+
+        self.set_stock(0)
+        self.set_stock(2)
+        self.assertEqual(len(mail.outbox), 1)
+        # Subscribing again re-arms it
+        alerts.subscribe(self.user, variant=self.variant())
+        self.set_stock(0)
+        self.set_stock(4)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_sold_out_again_sends_nothing(self):
+        self.set_stock(0)
+        alerts.subscribe(self.user, variant=self.variant())
+        ProductVariant.objects.filter(pk=self.nike_42.pk).update(stock_quantity=0)
+        self.assertEqual(alerts.fan_out('back_in_stock', self.nike_42.pk), 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_price_drop_reaches_subscribers_and_wishlists(self):
+        alerts.subscribe(self.user, product=self.product_now())
+        WishlistItem.objects.create(wishlist=self.wishlist, product=self.product)
+        self.set_price('30.00')
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['fan@example.com', 'shopper@example.com'])
+        sources = dict(ProductAlert.objects.values_list('user__username', 'source'))
+        self.assertEqual(sources, {'shopper': 'customer', 'fan': 'wishlist'})
+        self.assertEqual(
+            set(ProductAlert.objects.values_list('notified_price', flat=True)), {Decimal('30.00')}
+        )
+
+        # Only a price below the last one notified goes out again
+        self.set_price('35.00')
+        self.set_price('32.00')
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_removing_a_wishlist_item_keeps_the_customers_own_alert(self):
+        item = WishlistItem.objects.create(wishlist=self.wishlist, product=self.product)
+        alerts.include_wishlists(self.product.pk, '40.00')
+        self.assertEqual(ProductAlert.objects.get(user=self.fan).source, 'wishlist')
+
+        # Subscribing makes the alert the customer's own...
+        alerts.subscribe(self.fan, product=self.product_now())
+        item.delete()
+        self.assertEqual(ProductAlert.objects.get(user=self.fan).source, 'customer')
+
+        # ...while a wishlist alert goes with its item
+        ProductAlert.objects.all().delete()
+        item = WishlistItem.objects.create(wishlist=self.wishlist, product=self.product)
+        alerts.include_wishlists(self.product.pk, '40.00')
+        item.delete()
+        self.assertFalse(ProductAlert.objects.exists())
@@ -0,0 +1,99 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from .. import analytics
+from ..models import BatchCheckpoint, Customer, Order, SalesRollup
+from .utils import TEST_CACHES, make_catalog, make_order
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category, cls.nike, cls.adidas, (cls.nike_42, cls.adidas_42) = make_catalog()
+        cls.customer = Customer.objects.create(user=User.objects.create_user('shopper'))
+
+    def place(self, lines, discount='0', extra='0'):
+        """An order as checkout records it: discount off the items, tax and shipping on top"""
+        order = make_order(self.customer, lines)
+        order.discount_amount = Decimal(discount)
+        order.total_amount = order.subtotal - order.discount_amount + Decimal(extra)
+        order.save()
+        analytics.record_order(order)
+        return order
+
+    def rows(self, period='day'):
+        return {
+            (row.dimension, row.key_id): (row.orders, row.units, row.revenue, row.discounts)
+            for row in SalesRollup.objects.filter(period=period)
+        }
+
+    def test_orders_are_upserted_into_each_dimension(self):
+        # 2 x 40 + 1 x 25 = 105, 21 off, 5 shipping
+        self.place([(self.nike_42, 2), (self.adidas_42, 1)], discount='21', extra='5')
+        self.place([(self.nike_42, 1)])
+        rows = self.rows()
+        self.assertEqual(rows['total', 0], (2, 4, Decimal('129.00'), Decimal('21.00')))
+        self.assertEqual(rows['product', self.nike_42.product_id], (2, 3, Decimal('120.00'), Decimal('16.00')))
+        self.assertEqual(rows['product', self.adidas_42.product_id], (1, 1, Decimal('25.00'), Decimal('5.00')))
+        self.assertEqual(rows['brand', self.nike.pk], (2, 3, Decimal('120.00'), Decimal('16.00')))
+        self.assertEqual(rows['category', self.category.pk], (2, 4, Decimal('145.00'), Decimal('21.00')))
+        self.assertEqual(self.rows('hour'), rows)
+
+    def test_cancelling_and_restoring_an_order(self):
+        self.place([(self.adidas_42, 1)])
+        order = self.place([(self.nike_42, 2)])
+        before = self.rows()
+
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(self.rows()['total', 0], (1, 1, Decimal('25.00'), Decimal('0.00')))
+        self.assertEqual(self.rows()['product', self.nike_42.product_id], (0, 0, Decimal('0.00'), Decimal('0.00')))
+
+        order.status = 'refunded'
+        order.save()
+        order.status = 'confirmed'
+        order.save()
+        self.assertEqual(self.rows(), before)
+
+    def test_backfill_matches_live_recording(self):
+        self.place([(self.nike_42, 2), (self.adidas_42, 1)], discount='10')
+        self.place([(self.adidas_42, 3)], extra='5')
+        cancelled = self.place([(self.nike_42, 1)])
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        live = self.rows()
+
+        SalesRollup.objects.update(orders=0, units=0, revenue=0, discounts=0)
+        progress = list(analytics.backfill(chunk_size=2))
+        last = Order.objects.order_by('id').last().pk
+        self.assertEqual(progress[-1], (last, last))
+        self.assertEqual(self.rows(), live)
+        self.assertFalse(BatchCheckpoint.objects.exists())
+
+    def test_status_changes_wait_for_a_running_backfill(self):
+        order = self.place([(self.nike_42, 1)])
+        BatchCheckpoint.objects.create(name=analytics.BACKFILL_END, position=order.pk)
+        BatchCheckpoint.objects.create(name=analytics.BACKFILL_POSITION, position=0)
+        order.status = 'cancelled'
+        order.save()
+        # The backfill will skip it when it gets there
+        self.assertEqual(self.rows()['total', 0][0], 1)
+
+    def test_report_reads_the_rollups(self):
+        self.place([(self.nike_42, 2)], extra='5')
+        self.place([(self.adidas_42, 1)])
+        report = analytics.report(days=7)
+        self.assertEqual(report['totals']['orders'], 2)
+        self.assertEqual(report['totals']['revenue'], Decimal('110.00'))
+        self.assertEqual([row['label'] for row in report['leaders']['brand']], ['Nike', 'Adidas'])
+
+    def test_dashboard_labels_the_two_revenues(self):
+        self.place([(self.nike_42, 1)])
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        response = self.client.get('/admin/ecommerce/salesrollup/', {'days': 7})
+        self.assertEqual(response.context['days'], 7)
+        self.assertContains(response, 'Order revenue')
+        self.assertContains(response, 'Item sales')
@@ -0,0 +1,103 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .. import carts, events
+from ..models import CartItem, Coupon
+from .utils import TEST_CACHES, make_catalog
+
+
+@override_settings(CACHES=TEST_CACHES, ROOT_URLCONF='ecommerce.tests.async_urls')
+class AsyncViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category, nike, adidas, (cls.nike_42, cls.adidas_42) = make_catalog()
+        cls.user = User.objects.create_user('shopper', password='secret')
+
+    def setUp(self):
+        # Keep events out of the process-wide buffer
+        recorder = mock.patch.object(events, 'record')
+        self.record = recorder.start()
+        self.addCleanup(recorder.stop)
+
+
+class AsyncCartTests(AsyncViewTestCase):
+
+    async def add(self, variant, quantity=1):
+        response = await self.async_client.post('/cart/add/', {'variant_id': variant.pk, 'quantity': quantity})
+        return response.json()
+
+    async def test_anonymous_cart_lives_in_the_cookie(self):
+        self.assertEqual((await self.add(self.nike_42, 2))['cart_count'], 2)
+        self.assertEqual((await self.add(self.adidas_42))['cart_count'], 3)
+        self.assertIn(carts.CART_COOKIE, self.async_client.cookies)
+        self.assertFalse(await CartItem.objects.aexists())
+
+        response = await self.async_client.post('/cart/update/', {'item_id': self.nike_42.pk, 'quantity': 5})
+        self.assertEqual(response.json()['subtotal'], '225.00')
+        response = await self.async_client.post('/cart/remove/', {'item_id': self.adidas_42.pk})
+        self.assertTrue(response.json()['success'])
+        response = await self.async_client.post('/cart/update/', {'item_id': self.nike_42.pk, 'quantity': 1})
+        self.assertEqual(response.json()['cart_count'], 1)
+
+    async def test_signed_in_cart_is_capped_at_stock(self):
+        await self.async_client.aforce_login(self.user)
+        self.assertTrue((await self.add(self.nike_42, 6))['success'])
+        result = await self.add(self.nike_42, 6)
+        self.assertEqual(result, {'success': False, 'message': 'Cannot add more than 10 items'})
+        item = await CartItem.objects.aget(cart__customer__user=self.user)
+        self.assertEqual(item.quantity, 6)
+
+    async def test_add_records_the_session(self):
+        await self.async_client.aforce_login(self.user)
+        await self.add(self.adidas_42)
+        args, kwargs = self.record.call_args
+        self.assertEqual(args, ('add_to_cart',))
+        self.assertEqual(kwargs['product_id'], self.adidas_42.product_id)
+        self.assertEqual(kwargs['user'], self.user)
+        self.assertEqual(kwargs['session_key'], self.async_client.session.session_key)
+
+
+class AsyncApplyCouponTests(AsyncViewTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            Coupon.objects.create(
+                code='SAVE10', description='10% off', discount_type='percentage', discount_value=Decimal('10'),
+                valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+            )
+
+    async def apply(self, code):
+        response = await self.async_client.post('/ajax/apply-coupon/', {'coupon_code': code})
+        return response.json()
+
+    async def test_applies_to_the_backend_cart(self):
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.post('/cart/add/', {'variant_id': self.nike_42.pk, 'quantity': 2})
+        result = await self.apply('SAVE10')
+        self.assertEqual(
+            (result['success'], result['discount_amount'], result['coupon_description']), (True, '8.00', '10% off')
+        )
+
+    async def test_better_automatic_offer_is_kept(self):
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.post('/cart/add/', {'variant_id': self.nike_42.pk, 'quantity': 2})
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            await Coupon.objects.acreate(
+                code='SPRING', description='25% off', discount_type='percentage', discount_value=Decimal('25'),
+                is_automatic=True, valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+            )
+        result = await self.apply('SAVE10')
+        self.assertFalse(result['success'])
+        self.assertIn('better automatic offer', result['message'])
+
+    async def test_unknown_code_and_empty_cart(self):
+        await self.async_client.aforce_login(self.user)
+        self.assertEqual(await self.apply('NOPE'), {'success': False, 'message': 'Invalid coupon code'})
+        self.assertEqual(await self.apply('SAVE10'), {'success': False, 'message': 'Invalid coupon code'})
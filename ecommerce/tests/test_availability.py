@@ -0,0 +1,61 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from .. import availability
+from ..models import Color, Product, ProductVariant, Size
+from .utils import TEST_CACHES, make_catalog
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AvailabilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category, nike, adidas, (cls.nike_42, cls.adidas_42) = make_catalog()
+        cls.nike, cls.adidas = cls.nike_42.product, cls.adidas_42.product
+        cls.black = cls.nike_42.color
+        cls.white = Color.objects.create(name='White')
+        cls.size_43 = Size.objects.create(name='43', size_type='shoe')
+        cls.nike_43 = ProductVariant.objects.create(
+            product=cls.nike, color=cls.white, size=cls.size_43, sku='nike-runner-43', stock_quantity=4,
+        )
+
+    def available(self, **filters):
+        return set(availability.filter_available(Product.objects.all(), **filters).values_list('name', flat=True))
+
+    def test_variant_saves_refresh_the_summary(self):
+        self.nike.refresh_from_db()
+        self.assertEqual((self.nike.stock_total, self.nike.in_stock), (14, True))
+        self.assertEqual(availability.decode_ids(self.nike.available_size_ids), sorted([self.nike_42.size_id, self.size_43.pk]))
+
+        self.nike_43.stock_quantity = 0
+        self.nike_43.save()
+        self.nike.refresh_from_db()
+        self.assertEqual((self.nike.stock_total, self.nike.available_color_ids), (10, f'|{self.black.pk}|'))
+
+    def test_filters(self):
+        self.assertEqual(self.available(), {'Nike Runner', 'Adidas Runner'})
+        self.assertEqual(self.available(size_id=self.size_43.pk), {'Nike Runner'})
+        self.assertEqual(self.available(color_id=self.black.pk), {'Nike Runner', 'Adidas Runner'})
+        # Each facet on its own: Nike has a 43 and a black shoe, not a black 43
+        self.assertEqual(self.available(size_id=self.size_43.pk, color_id=self.black.pk), {'Nike Runner'})
+
+    def test_filters_follow_stock_updates_without_a_refresh(self):
+        # As checkout does, before it refreshes the summary
+        ProductVariant.objects.filter(pk=self.nike_43.pk).update(stock_quantity=0)
+        self.assertEqual(self.available(size_id=self.size_43.pk), set())
+        ProductVariant.objects.filter(pk=self.adidas_42.pk).update(is_active=False)
+        self.assertEqual(self.available(color_id=self.black.pk), {'Nike Runner'})
+
+    def test_filters_use_the_partial_indexes(self):
+        products = availability.filter_available(Product.objects.all(), self.size_43.pk, self.black.pk)
+        sql, params = products.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('variant_size_stock_idx', plan)
+        self.assertIn('variant_color_stock_idx', plan)
+
+    def test_rebuild(self):
+        Product.objects.update(in_stock=False, stock_total=0, available_size_ids='')
+        self.assertEqual(availability.rebuild(), 2)
+        self.assertEqual(self.available(size_id=self.nike_42.size_id), {'Nike Runner', 'Adidas Runner'})
@@ -0,0 +1,91 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import carts, events
+from ..models import CartItem, Customer, ProductVariant
+from .utils import TEST_CACHES, make_catalog, make_order
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkAddTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category, nike, adidas, (cls.nike_42, cls.adidas_42) = make_catalog()
+        cls.user = User.objects.create_user('shopper', password='secret')
+        cls.customer = Customer.objects.create(user=cls.user)
+
+    def setUp(self):
+        recorder = mock.patch.object(events, 'record')
+        self.record = recorder.start()
+        self.addCleanup(recorder.stop)
+
+    def bulk_add(self, items):
+        return self.client.post(
+            reverse('bulk_add_to_cart'), json.dumps({'items': items}), content_type='application/json',
+        )
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__customer=self.customer).values_list(
+            'product_variant_id', 'quantity'
+        ))
+
+    def test_adds_every_line_and_sums_repeats(self):
+        self.client.force_login(self.user)
+        response = self.bulk_add([
+            {'variant_id': self.nike_42.pk, 'quantity': 2},
+            {'variant_id': self.adidas_42.pk},
+            {'variant_id': self.nike_42.pk, 'quantity': 1},
+        ])
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(self.quantities(), {self.nike_42.pk: 3, self.adidas_42.pk: 1})
+        self.assertEqual(data['summary']['count'], 4)
+        self.assertEqual(self.record.call_count, 2)
+
+    def test_form_fields_into_the_cookie_cart(self):
+        response = self.client.post(reverse('bulk_add_to_cart'), {
+            'variant_id': [self.nike_42.pk, self.adidas_42.pk], 'quantity': [1, 2],
+        })
+        self.assertTrue(response.json()['success'])
+        self.assertIn(carts.CART_COOKIE, response.cookies)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_nothing_is_added_unless_every_line_fits(self):
+        self.client.force_login(self.user)
+        ProductVariant.objects.filter(pk=self.adidas_42.pk).update(is_active=False)
+        data = self.bulk_add([
+            {'variant_id': self.nike_42.pk, 'quantity': 11},
+            {'variant_id': self.adidas_42.pk, 'quantity': 1},
+        ]).json()
+        self.assertFalse(data['success'])
+        self.assertEqual(data['errors'], {
+            str(self.nike_42.pk): 'Only 10 more available',
+            str(self.adidas_42.pk): 'No longer available',
+        })
+        self.assertEqual(self.quantities(), {})
+
+    def test_invalid_items(self):
+        for items in ([], [{'variant_id': self.nike_42.pk, 'quantity': 0}], [{'quantity': 1}]):
+            with self.subTest(items=items):
+                self.assertEqual(self.bulk_add(items).status_code, 400)
+
+    def test_reorder_adds_what_stock_allows(self):
+        order = make_order(self.customer, [(self.nike_42, 2), (self.adidas_42, 1), (self.nike_42, 1)])
+        ProductVariant.objects.filter(pk=self.adidas_42.pk).update(stock_quantity=0)
+        self.client.force_login(self.user)
+
+        data = self.client.post(reverse('reorder', args=[order.order_number])).json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['added'], {str(self.nike_42.pk): 3})
+        self.assertEqual(data['errors'], {str(self.adidas_42.pk): 'Cannot add more than 0 items'})
+        self.assertEqual(self.quantities(), {self.nike_42.pk: 3})
+
+    def test_reorder_only_own_orders(self):
+        order = make_order(self.customer, [(self.nike_42, 1)])
+        other = User.objects.create_user('other', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.client.post(reverse('reorder', args=[order.order_number])).status_code, 404)
@@ -0,0 +1,107 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+
+def two_tier(location, poll_interval):
+    return {
+        'BACKEND': 'ecommerce.cache.TwoTierCache',
+        'LOCATION': location,
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'POLL_INTERVAL': poll_interval,
+            'NAMESPACES': {'catalog': {'timeout': 600, 'l1_timeout': 60, 'max_bytes': 2048}},
+        },
+    }
+
+
+# Two workers with their own L1s over one L2
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-two-tier'},
+    'worker_a': two_tier('tests-worker-a', 0),
+    'worker_b': two_tier('tests-worker-b', 0),
+    'trusting': two_tier('tests-trusting', 60),
+})
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.a, self.b = caches['worker_a'], caches['worker_b']
+        for alias in ('worker_a', 'worker_b', 'trusting'):
+            # L1 entries and counters outlive the backend instances
+            caches[alias].namespaces.clear()
+        self.addCleanup(caches['shared'].clear)
+
+    def stats(self, cache, namespace='catalog'):
+        return cache.stats()['namespaces'][namespace]
+
+    def test_reads_fill_l1(self):
+        self.a.set('catalog:product:1', {'name': 'Runner'})
+        self.assertEqual(self.b.get('catalog:product:1'), {'name': 'Runner'})
+        self.assertEqual(self.b.get('catalog:product:1'), {'name': 'Runner'})
+        stats = self.stats(self.b)
+        self.assertEqual((stats['l2_hits'], stats['l1_hits'], stats['l1_entries']), (1, 1, 1))
+        self.assertIsNone(self.b.get('catalog:product:2'))
+        self.assertEqual(self.stats(self.b)['misses'], 1)
+
+    def test_a_write_invalidates_other_workers_copies(self):
+        self.a.set('catalog:product:1', 'old')
+        self.a.set('catalog:product:2', 'other')
+        self.assertEqual(self.b.get('catalog:product:1'), 'old')
+        self.assertEqual(self.b.get('catalog:product:2'), 'other')
+
+        self.a.set('catalog:product:1', 'new')
+        self.assertEqual(self.b.get('catalog:product:1'), 'new')
+        self.assertEqual(self.b.get('catalog:product:2'), 'other')
+        stats = self.stats(self.b)
+        # Only the written key was dropped
+        self.assertEqual((stats['invalidations'], stats['l1_hits']), (1, 1))
+
+        self.a.delete('catalog:product:1')
+        self.assertIsNone(self.b.get('catalog:product:1'))
+
+    def test_hits_are_trusted_for_the_poll_interval(self):
+        trusting = caches['trusting']
+        self.a.set('catalog:product:1', 'old')
+        self.assertEqual(trusting.get('catalog:product:1'), 'old')
+        self.a.set('catalog:product:1', 'new')
+        with mock.patch.object(caches['shared'], 'get') as shared_get:
+            self.assertEqual(trusting.get('catalog:product:1'), 'old')
+        shared_get.assert_not_called()
+
+    def test_racing_writers_never_leave_a_stale_hit(self):
+        write_stamp = self.a.write_stamp
+
+        def b_writes_first(*args):
+            # B's value and stamp both land between A's value and A's stamp
+            self.b.set('catalog:product:1', 'from b')
+            return write_stamp(*args)
+
+        with mock.patch.object(self.a, 'write_stamp', side_effect=b_writes_first):
+            self.a.set('catalog:product:1', 'from a')
+        self.assertEqual(caches['shared'].get('catalog:product:1'), 'from b')
+        self.assertEqual(self.a.get('catalog:product:1'), 'from b')
+        self.assertEqual(self.b.get('catalog:product:1'), 'from b')
+
+    def test_add_invalidates_copies_of_an_expired_key(self):
+        self.a.set('catalog:product:1', 'old')
+        self.assertEqual(self.b.get('catalog:product:1'), 'old')
+        caches['shared'].delete('catalog:product:1')
+        self.assertTrue(self.a.add('catalog:product:1', 'new'))
+        self.assertFalse(self.a.add('catalog:product:1', 'newer'))
+        self.assertEqual(self.b.get('catalog:product:1'), 'new')
+
+    def test_l1_stays_within_its_byte_budget(self):
+        for pk in range(10):
+            self.a.set(f'catalog:product:{pk}', 'x' * 500)
+            self.a.get(f'catalog:product:{pk}')
+        stats = self.stats(self.a)
+        self.assertLessEqual(stats['l1_bytes'], 2048)
+        self.assertGreater(stats['evictions'], 0)
+        # Evicted from L1, still in L2
+        self.assertEqual(self.a.get('catalog:product:0'), 'x' * 500)
+
+    def test_keys_outside_configured_namespaces_share_the_default(self):
+        self.a.set('misc:1', 1)
+        self.a.get('misc:1')
+        self.assertEqual(self.stats(self.a, 'default')['l1_entries'], 1)
@@ -0,0 +1,68 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from .. import carts
+from ..models import Cart, CartItem, Customer, ProductVariant, Size
+from .utils import TEST_CACHES, make_catalog
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MergeCookieCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category, nike, adidas, (cls.nike_42, cls.adidas_42) = make_catalog()
+        cls.retired = ProductVariant.objects.create(
+            product=cls.nike_42.product, color=cls.nike_42.color,
+            size=Size.objects.create(name='43', size_type='shoe'), sku='nike-runner-43', is_active=False,
+        )
+        cls.user = User.objects.create_user('shopper', password='secret')
+
+    def login(self, cookie):
+        response = HttpResponse()
+        response.set_signed_cookie(carts.CART_COOKIE, cookie, salt=carts.CART_COOKIE_SALT)
+        request = RequestFactory().get('/')
+        request.COOKIES[carts.CART_COOKIE] = response.cookies[carts.CART_COOKIE].value
+        user_logged_in.send(sender=User, request=request, user=self.user)
+        return request
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__customer__user=self.user).values_list(
+            'product_variant_id', 'quantity'
+        ))
+
+    def test_adds_cookie_lines_to_the_customer_cart(self):
+        customer = Customer.objects.create(user=self.user)
+        cart = Cart.objects.create(customer=customer)
+        CartItem.objects.create(cart=cart, product_variant=self.nike_42, quantity=1)
+
+        request = self.login(f'{self.nike_42.pk}:2,{self.adidas_42.pk}:1,{self.retired.pk}:4')
+        self.assertEqual(self.quantities(), {self.nike_42.pk: 3, self.adidas_42.pk: 1})
+
+        response = carts.CartMiddleware(lambda request: HttpResponse()).process_response(request, HttpResponse())
+        self.assertEqual(response.cookies[carts.CART_COOKIE].value, '')
+
+    def test_caps_merged_quantities_at_stock(self):
+        customer = Customer.objects.create(user=self.user)
+        cart = Cart.objects.create(customer=customer)
+        CartItem.objects.create(cart=cart, product_variant=self.nike_42, quantity=8)
+
+        self.login(f'{self.nike_42.pk}:5,{self.adidas_42.pk}:15')
+        self.assertEqual(self.quantities(), {self.nike_42.pk: 10, self.adidas_42.pk: 10})
+
+    def test_sold_out_lines_are_left_alone(self):
+        ProductVariant.objects.filter(pk=self.adidas_42.pk).update(stock_quantity=0)
+        self.login(f'{self.nike_42.pk}:1,{self.adidas_42.pk}:2')
+        self.assertEqual(self.quantities(), {self.nike_42.pk: 1})
+
+    def test_creates_the_customer_and_cart(self):
+        self.login(f'{self.adidas_42.pk}:2')
+        self.assertEqual(self.quantities(), {self.adidas_42.pk: 2})
+
+    def test_empty_or_tampered_cookie_changes_nothing(self):
+        request = self.login('')
+        request.COOKIES[carts.CART_COOKIE] += 'x'
+        user_logged_in.send(sender=User, request=request, user=self.user)
+        self.assertFalse(Customer.objects.filter(user=self.user).exists())
+        self.assertFalse(getattr(request, '_clear_cart_cookie', False))
@@ -0,0 +1,61 @@
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .. import database
+from ..models import Color
+
+
+class PragmaTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_applied_on_connect(self):
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        # 1 is NORMAL, 2 is MEMORY
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('temp_store'), 2)
+        self.assertEqual(self.pragma('cache_size'), -64 * 1024)
+
+    def test_stats(self):
+        stats = database.sqlite_stats()
+        self.assertGreater(stats['page_count'], 0)
+        self.assertEqual(
+            set(stats),
+            {'page_size', 'page_count', 'freelist_count', 'journal_mode', 'auto_vacuum', 'file_size', 'wal_size'},
+        )
+
+
+@override_settings(SQLITE_TRANSACTION_MODES={'checkout': 'IMMEDIATE'})
+class AtomicTests(TransactionTestCase):
+    def begins(self, queries):
+        return [query['sql'] for query in queries if query['sql'].startswith('BEGIN')]
+
+    def test_outermost_begin_uses_the_purpose_mode(self):
+        with CaptureQueriesContext(connection) as queries:
+            with database.atomic('checkout'):
+                Color.objects.create(name='Red')
+        self.assertEqual(self.begins(queries), ['BEGIN IMMEDIATE'])
+        self.assertTrue(Color.objects.filter(name='Red').exists())
+        # Later transactions are back to the default mode
+        with CaptureQueriesContext(connection) as queries:
+            with database.atomic():
+                Color.objects.create(name='Blue')
+        self.assertEqual(self.begins(queries), ['BEGIN'])
+
+    def test_nested_and_unconfigured_blocks_are_plain_savepoints(self):
+        with CaptureQueriesContext(connection) as queries:
+            with database.atomic('reports'):
+                with database.atomic('checkout'):
+                    Color.objects.create(name='Red')
+        self.assertEqual(self.begins(queries), ['BEGIN'])
+
+    def test_rolls_back_on_error(self):
+        with self.assertRaises(ValueError):
+            with database.atomic('checkout'):
+                Color.objects.create(name='Red')
+                raise ValueError
+        self.assertFalse(Color.objects.exists())
+        self.assertFalse(connection.in_atomic_block)
@@ -0,0 +1,104 @@
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .. import events
+from ..models import Event, EventHourly, Product
+from .utils import TEST_CACHES, make_catalog
+
+
+class ManualBuffer(events.EventBuffer):
+    """An EventBuffer the test flushes itself, without the flusher thread"""
+
+    def ensure_flusher(self):
+        if self.events is None:
+            self.events = deque(maxlen=self.config['MAX_BUFFERED'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class EventBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category, nike, adidas, (nike_42, adidas_42) = make_catalog()
+        cls.nike, cls.adidas = nike_42.product, adidas_42.product
+
+    def setUp(self):
+        self.buffer = ManualBuffer()
+        patcher = mock.patch.object(events, 'buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def hourly(self, **filters):
+        return dict(EventHourly.objects.filter(**filters).values_list('kind', 'count'))
+
+    def test_record_never_touches_the_database(self):
+        with self.assertNumQueries(0):
+            events.record('view', product_id=self.nike.pk)
+            events.record_search('  Red   SHOES ')
+        self.assertEqual(self.buffer.stats()['buffered'], 2)
+        self.assertFalse(Event.objects.exists())
+
+    def test_flush_writes_raw_rows_and_hourly_rollups(self):
+        for _ in range(3):
+            events.record('view', product_id=self.nike.pk, session_key='abc')
+        events.record('add_to_cart', product_id=self.nike.pk)
+        events.record_search('Red  Shoes')
+        events.record_search('red shoes')
+        events.record_search('   ')
+
+        self.assertEqual(self.buffer.flush(), 6)
+        self.assertEqual(Event.objects.count(), 6)
+        self.assertEqual(self.hourly(product=self.nike), {'view': 3, 'add_to_cart': 1})
+        self.assertEqual(self.hourly(query='red shoes'), {'search': 2})
+        # Views also feed trending
+        self.assertGreater(Product.objects.get(pk=self.nike.pk).trend_score, 0)
+
+    def test_later_flushes_add_to_the_same_hour(self):
+        at = datetime(2026, 3, 1, 12, 15, tzinfo=timezone.utc).timestamp()
+        events.write_batch([('view', self.adidas.pk, '', None, '', at)] * 2)
+        events.write_batch([('view', self.adidas.pk, '', None, '', at + 60)])
+        events.write_batch([('view', self.adidas.pk, '', None, '', at + 3600)])
+        self.assertEqual(
+            list(EventHourly.objects.filter(product=self.adidas).order_by('hour').values_list('hour', 'count')),
+            [
+                (datetime(2026, 3, 1, 12, tzinfo=timezone.utc), 3),
+                (datetime(2026, 3, 1, 13, tzinfo=timezone.utc), 1),
+            ],
+        )
+
+    @override_settings(EVENTS={**settings.EVENTS, 'MAX_BUFFERED': 3, 'BATCH_SIZE': 2})
+    def test_overflow_drops_the_oldest(self):
+        self.buffer = ManualBuffer()
+        with mock.patch.object(events, 'buffer', self.buffer):
+            for product in (self.nike, self.nike, self.adidas, self.adidas, self.adidas):
+                events.record('view', product_id=product.pk)
+            self.assertTrue(self.buffer.wakeup.is_set())
+            stats = self.buffer.stats()
+            self.assertEqual((stats['buffered'], stats['dropped'], stats['recorded']), (3, 2, 5))
+            self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(self.buffer.stats()['batches'], 2)
+        self.assertEqual(self.hourly(product=self.adidas), {'view': 3})
+        self.assertFalse(EventHourly.objects.filter(product=self.nike).exists())
+
+    def test_a_failed_batch_is_counted_and_skipped(self):
+        events.record('view', product_id=self.nike.pk)
+        with mock.patch.object(events, 'write_batch', side_effect=RuntimeError), \
+                self.assertLogs('ecommerce.events', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.stats()['failed'], 1)
+        self.assertEqual(self.buffer.stats()['buffered'], 0)
+
+    def test_prune_keeps_the_rollups(self):
+        events.record('view', product_id=self.nike.pk)
+        events.record('view', product_id=self.adidas.pk)
+        self.buffer.flush()
+        Event.objects.filter(product=self.nike).update(created_at=datetime.now(timezone.utc) - timedelta(days=40))
+
+        call_command('prune_events', days=30, stdout=StringIO())
+        self.assertEqual(list(Event.objects.values_list('product_id', flat=True)), [self.adidas.pk])
+        self.assertEqual(EventHourly.objects.filter(kind='view').count(), 2)
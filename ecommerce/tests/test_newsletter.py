@@ -0,0 +1,110 @@
+from django.contrib.auth.models import User
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from .. import newsletter, taskqueue
+from ..models import Campaign, CampaignRecipient, Customer, Newsletter, Task
+from ..taskqueue import task
+from .utils import TEST_CACHES
+
+
+heartbeats = []
+
+
+@task()
+def beat():
+    heartbeats.append(taskqueue.heartbeat())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NewsletterTests(TestCase):
+    def setUp(self):
+        self.campaign = Campaign.objects.create(
+            subject='Spring drop', text_body='New in. Unsubscribe: {{ unsubscribe_url }}',
+        )
+
+    def subscribe(self, *emails):
+        Newsletter.objects.bulk_create([Newsletter(email=email) for email in emails])
+
+    def statuses(self):
+        return dict(self.campaign.recipients.values_list('email', 'status'))
+
+    def test_stage_deduplicates_and_counts_new_rows(self):
+        self.subscribe('a@example.com', 'b@example.com')
+        Newsletter.objects.create(email='gone@example.com', is_active=False)
+        for username, email, opted_in in [
+            ('a', 'a@example.com', True),
+            ('c', 'c@example.com', True),
+            ('d', 'd@example.com', False),
+            ('gone', 'gone@example.com', True),
+        ]:
+            user = User.objects.create_user(username, email)
+            Customer.objects.create(user=user, newsletter_subscription=opted_in)
+
+        self.assertEqual(newsletter.stage(self.campaign, chunk_size=2), 3)
+        self.assertEqual(set(self.statuses()), {'a@example.com', 'b@example.com', 'c@example.com'})
+        # Re-staging only adds new sign-ups
+        self.subscribe('e@example.com')
+        self.assertEqual(newsletter.stage(self.campaign), 1)
+
+    def test_claims_never_overlap(self):
+        self.subscribe(*[f'{n}@example.com' for n in range(5)])
+        newsletter.stage(self.campaign)
+        first = newsletter.claim(self.campaign, 3)
+        second = newsletter.claim(self.campaign, 3)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({pk for pk, _ in first} & {pk for pk, _ in second})
+        self.assertEqual(set(self.statuses().values()), {'sending'})
+        self.assertEqual(newsletter.claim(self.campaign, 3), [])
+
+    def test_deliver_sends_and_finishes(self):
+        self.subscribe('a@example.com', 'b@example.com', 'c@example.com')
+        newsletter.stage(self.campaign)
+        progress = []
+        counts = newsletter.deliver(
+            self.campaign, workers=2, rate=0, batch_size=2, progress=lambda c: progress.append(dict(c)),
+        )
+
+        self.assertEqual(counts['sent'], 3)
+        self.assertEqual([c['sent'] for c in progress], [2, 3])
+        self.assertEqual(set(self.statuses().values()), {'sent'})
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['a@example.com', 'b@example.com', 'c@example.com'])
+        message = mail.outbox[0]
+        self.assertIn(newsletter.unsubscribe_url(message.to[0]), message.body)
+        self.assertNotIn(newsletter.UNSUBSCRIBE_MARKER, message.body)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, 'sent')
+        self.assertIsNotNone(self.campaign.finished_at)
+
+    def test_deliver_fails_rows_left_sending(self):
+        self.subscribe('a@example.com', 'b@example.com')
+        newsletter.stage(self.campaign)
+        # A run that died after claiming this batch
+        newsletter.claim(self.campaign, 1)
+        counts = newsletter.deliver(self.campaign, workers=1, rate=0)
+
+        self.assertEqual(counts['sent'], 1)
+        self.assertEqual(self.statuses(), {'a@example.com': 'failed', 'b@example.com': 'sent'})
+        self.assertEqual([m.to for m in mail.outbox], [['b@example.com']])
+        self.assertTrue(CampaignRecipient.objects.get(email='a@example.com').error.startswith('Interrupted'))
+
+    def test_unsubscribe_token_round_trip(self):
+        token = newsletter.unsubscribe_url('a@example.com').rstrip('/').rsplit('/', 1)[-1]
+        self.assertEqual(newsletter.unsubscribe_email(token), 'a@example.com')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class HeartbeatTests(TestCase):
+    def setUp(self):
+        heartbeats.clear()
+
+    def test_outside_a_task_run(self):
+        self.assertFalse(taskqueue.heartbeat())
+
+    def test_inside_a_task_run(self):
+        job = beat.enqueue()
+        taskqueue.claim(['default'], 'worker-1', 1)
+        self.assertEqual(taskqueue.execute(job.pk), 'done')
+        self.assertEqual(heartbeats, [True])
+        self.assertIsNotNone(Task.objects.get(pk=job.pk).heartbeat_at)
@@ -0,0 +1,77 @@
+import importlib
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from .. import events, popularity
+from ..models import Customer, Product
+from .utils import TEST_CACHES, make_catalog, make_order
+
+
+HOUR = datetime(2026, 3, 1, 12, tzinfo=timezone.utc)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PopularityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category, nike, adidas, (cls.nike_42, cls.adidas_42) = make_catalog()
+        cls.nike, cls.adidas = cls.nike_42.product, cls.adidas_42.product
+        cls.customer = Customer.objects.create(user=User.objects.create_user('shopper'))
+
+    def setUp(self):
+        # Views and sales all land at HOUR, so replayed scores match exactly
+        clock = mock.patch.object(popularity.time, 'time', return_value=HOUR.timestamp())
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def scores(self):
+        return {
+            name: (round(sales, 6), round(trend, 6))
+            for name, sales, trend in Product.objects.order_by('name').values_list('name', 'sales_score', 'trend_score')
+        }
+
+    def view(self, product, times):
+        events.write_batch([('view', product.pk, '', None, '', HOUR.timestamp())] * times)
+
+    def test_sales_and_views_feed_the_scores(self):
+        popularity.record_sales({self.nike.pk: 2})
+        self.view(self.adidas, 30)
+        nike = Product.objects.get(pk=self.nike.pk)
+        adidas = Product.objects.get(pk=self.adidas.pk)
+        self.assertGreater(nike.sales_score, adidas.sales_score)
+        # 30 views outweigh 2 units sold at TREND_SALE_WEIGHT = 10
+        self.assertGreater(adidas.trend_score, nike.trend_score)
+
+    def test_later_events_weigh_more(self):
+        early = popularity.sale_increments(1, HOUR.timestamp())
+        late = popularity.sale_increments(1, HOUR.timestamp() + 3 * popularity.DAY)
+        self.assertAlmostEqual(late[1] / early[1], 2)
+        self.assertAlmostEqual(late[0] / early[0], 2 ** (3 / 30))
+
+    def test_rebuild_keeps_view_driven_trend(self):
+        order = make_order(self.customer, [(self.nike_42, 2)])
+        order.items.update(created_at=HOUR)
+        popularity.record_sales({self.nike.pk: 2})
+        self.view(self.adidas, 30)
+        self.view(self.nike, 5)
+        before = self.scores()
+
+        Product.objects.update(sales_score=0, trend_score=0)
+        self.assertEqual(popularity.rebuild(), 2)
+        self.assertEqual(self.scores(), before)
+
+    def test_backfill_migration_matches_rebuild(self):
+        order = make_order(self.customer, [(self.adidas_42, 3)])
+        order.items.update(created_at=HOUR)
+        self.view(self.nike, 7)
+        popularity.rebuild()
+        expected = self.scores()
+
+        Product.objects.update(sales_score=0, trend_score=0)
+        migration = importlib.import_module('ecommerce.migrations.0017_backfill_product_popularity')
+        migration.backfill(apps, None)
+        self.assertEqual(self.scores(), expected)
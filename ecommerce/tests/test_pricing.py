@@ -0,0 +1,53 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+
+from .. import views
+from ..models import Brand, Category, Product
+from .utils import TEST_CACHES
+
+
+@override_settings(CACHES=TEST_CACHES)
+class EffectivePriceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Shoes')
+        brand = Brand.objects.create(name='Nike')
+        cls.prices = {}
+        # name: (base_price, discount_price); effective prices 30, 45, 60
+        for name, base, discount in (('Alpha', '90', '30'), ('Bravo', '45', None), ('Charlie', '60', None)):
+            cls.prices[name] = Product.objects.create(
+                name=name, description=name, category=cls.category, brand=brand, sku=name.lower(),
+                base_price=Decimal(base), discount_price=Decimal(discount) if discount else None, gender='unisex',
+            )
+
+    def listing(self, **params):
+        # The listing template isn't part of this tree; check what it would be given
+        with mock.patch.object(views, 'render', return_value=HttpResponse()) as render:
+            self.client.get(f'/category/{self.category.slug}/', params)
+        request, template, context = render.call_args.args
+        return [product.name for product in context['products']]
+
+    def test_stored_in_the_row(self):
+        alpha = Product.objects.get(name='Alpha')
+        self.assertEqual(alpha.effective_price, Decimal('30.00'))
+        self.assertEqual(alpha.current_price, Decimal('30.00'))
+        Product.objects.filter(pk=alpha.pk).update(discount_price=None)
+        alpha.refresh_from_db()
+        self.assertEqual(alpha.effective_price, Decimal('90.00'))
+
+    def test_unsaved_products_fall_back_to_python(self):
+        product = Product(base_price=Decimal('20'), discount_price=Decimal('15'))
+        self.assertEqual(product.current_price, Decimal('15'))
+
+    def test_sorts_on_the_discounted_price(self):
+        self.assertEqual(self.listing(sort='price_low'), ['Alpha', 'Bravo', 'Charlie'])
+        self.assertEqual(self.listing(sort='price_high'), ['Charlie', 'Bravo', 'Alpha'])
+
+    def test_filters_on_the_discounted_price(self):
+        # Alpha's base price is 90, but it sells for 30
+        self.assertEqual(self.listing(min_price='40', sort='price_low'), ['Bravo', 'Charlie'])
+        self.assertEqual(self.listing(max_price='50', sort='price_low'), ['Alpha', 'Bravo'])
+        self.assertEqual(self.listing(min_price='oops', sort='price_low'), ['Alpha', 'Bravo', 'Charlie'])
@@ -0,0 +1,139 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .. import events, promotions
+from ..models import Coupon
+from .utils import TEST_CACHES, make_catalog
+
+
+def coupon(**fields):
+    now = timezone.now()
+    defaults = {
+        'discount_type': 'percentage', 'discount_value': Decimal('10'), 'is_automatic': True,
+        'valid_from': now - timedelta(days=1), 'valid_to': now + timedelta(days=1),
+    }
+    return Coupon(**{**defaults, **fields})
+
+
+class FreeUnitsValueTests(SimpleTestCase):
+    def test_cheapest_of_each_group_is_free(self):
+        prices = [(Decimal('30'), 1), (Decimal('20'), 2), (Decimal('10'), 1)]
+        # 30, 20 | 20 free, then 10 starts a group that never completes
+        self.assertEqual(promotions.free_units_value(prices, 2, 1), Decimal('20'))
+
+    def test_groups_span_lines(self):
+        self.assertEqual(promotions.free_units_value([(Decimal('10'), 4)], 1, 1), Decimal('20'))
+        prices = [(Decimal('50'), 1), (Decimal('5'), 3)]
+        # 50, 5 | 5 free, 5 free
+        self.assertEqual(promotions.free_units_value(prices, 2, 2), Decimal('10'))
+
+    def test_missing_terms_give_nothing(self):
+        self.assertEqual(promotions.free_units_value([(Decimal('10'), 4)], 0, 1), Decimal('0'))
+        self.assertEqual(promotions.free_units_value([(Decimal('10'), 4)], 2, 0), Decimal('0'))
+
+
+class EngineTests(SimpleTestCase):
+    def evaluate(self, coupons, lines, code=''):
+        return promotions.Engine(None, coupons).evaluate(lines, code)
+
+    def test_highest_tier_reached_wins(self):
+        tiered = coupon(id=1, code='TIERS', tiers=[[100, 15], [50, 12]])
+        lines = [(1, 1, Decimal('20'), 2)]
+        self.assertEqual(self.evaluate([tiered], lines).discount, Decimal('4.00'))
+        lines = [(1, 1, Decimal('20'), 3)]
+        self.assertEqual(self.evaluate([tiered], lines).discount, Decimal('7.20'))
+        lines = [(1, 1, Decimal('20'), 5)]
+        self.assertEqual(self.evaluate([tiered], lines).discount, Decimal('15.00'))
+
+    def test_tiers_count_only_the_scope(self):
+        tiered = coupon(id=1, code='TIERS', brand_id=2, tiers=[[100, 20]])
+        # 150 in the cart, but only 60 of brand 2
+        lines = [(1, 1, Decimal('90'), 1), (1, 2, Decimal('60'), 1)]
+        self.assertEqual(self.evaluate([tiered], lines).discount, Decimal('6.00'))
+
+    def test_buy_x_get_y(self):
+        bogo = coupon(
+            id=1, code='B2G1', discount_type='buy_x_get_y', discount_value=Decimal('100'),
+            buy_quantity=2, get_quantity=1,
+        )
+        lines = [(1, 1, Decimal('30'), 1), (1, 1, Decimal('20'), 2), (1, 1, Decimal('10'), 1)]
+        self.assertEqual(self.evaluate([bogo], lines).discount, Decimal('20.00'))
+
+    def test_best_promotion_wins_and_codes_are_checked(self):
+        automatic = coupon(id=1, code='AUTO', discount_value=Decimal('5'))
+        entered = coupon(id=2, code='SAVE20', discount_value=Decimal('20'), is_automatic=False)
+        lines = [(1, 1, Decimal('50'), 2)]
+        self.assertEqual(self.evaluate([automatic, entered], lines).promotion.code, 'AUTO')
+        evaluation = self.evaluate([automatic, entered], lines, 'SAVE20')
+        self.assertEqual((evaluation.promotion.code, evaluation.discount), ('SAVE20', Decimal('20.00')))
+        self.assertEqual(self.evaluate([automatic], lines, 'NOPE').error, 'Invalid coupon code')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RedeemTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.best = coupon(code='BEST', discount_value=Decimal('30'), usage_limit=5)
+            self.best.save()
+            self.next_best = coupon(code='NEXT', discount_value=Decimal('10'))
+            self.next_best.save()
+        self.lines = [(1, 1, Decimal('100'), 1)]
+
+    def test_claims_the_winner(self):
+        evaluation = promotions.redeem(self.lines)
+        self.assertEqual(evaluation.promotion.code, 'BEST')
+        self.best.refresh_from_db()
+        self.assertEqual(self.best.used_count, 1)
+
+    def test_falls_back_when_the_winner_ran_out(self):
+        # Compiled while BEST still had uses left...
+        self.assertEqual(promotions.evaluate(self.lines).promotion.code, 'BEST')
+        # ...then another checkout took the last one
+        Coupon.objects.filter(pk=self.best.pk).update(used_count=F('usage_limit'))
+
+        evaluation = promotions.redeem(self.lines)
+        self.assertEqual((evaluation.promotion.code, evaluation.discount), ('NEXT', Decimal('10.00')))
+        self.best.refresh_from_db()
+        self.next_best.refresh_from_db()
+        self.assertEqual((self.best.used_count, self.next_best.used_count), (5, 1))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ApplyCouponViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category, nike, adidas, (cls.nike_42, cls.adidas_42) = make_catalog()
+        cls.user = User.objects.create_user('shopper', password='secret')
+
+    def setUp(self):
+        recorder = mock.patch.object(events, 'record')
+        recorder.start()
+        self.addCleanup(recorder.stop)
+        with self.captureOnCommitCallbacks(execute=True):
+            coupon(code='SAVE10', description='10% off', is_automatic=False).save()
+        self.client.force_login(self.user)
+        self.client.post('/cart/add/', {'variant_id': self.nike_42.pk, 'quantity': 2})
+
+    def apply(self, code):
+        return self.client.post('/ajax/apply-coupon/', {'coupon_code': code}).json()
+
+    def test_applies_the_code(self):
+        result = self.apply('SAVE10')
+        self.assertEqual(
+            (result['success'], result['message'], result['discount_amount']),
+            (True, 'Coupon applied successfully', '8.00'),
+        )
+
+    def test_better_automatic_offer_is_kept(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            coupon(code='SPRING', discount_value=Decimal('25')).save()
+        result = self.apply('SAVE10')
+        self.assertFalse(result['success'])
+        self.assertIn('better automatic offer', result['message'])
+        self.assertNotIn('discount_amount', result)
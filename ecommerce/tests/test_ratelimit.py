@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from .. import promotions, ratelimit
+from .utils import TEST_CACHES
+
+
+RATE_LIMITS = {
+    'CACHE': 'shared',
+    'BUCKETS': {'apply_coupon': {'capacity': 2, 'refill_per_second': 0.5}},
+}
+
+
+@override_settings(CACHES=TEST_CACHES, RATE_LIMITS=RATE_LIMITS)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        clock = mock.patch.object(ratelimit.time, 'time', return_value=1000.0)
+        self.clock = clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_bucket_drains_and_refills(self):
+        self.assertEqual(ratelimit.take('apply_coupon', 'user:1'), 0)
+        self.assertEqual(ratelimit.take('apply_coupon', 'user:1'), 0)
+        self.assertEqual(ratelimit.take('apply_coupon', 'user:1'), 2.0)
+        # Other identities have their own bucket
+        self.assertEqual(ratelimit.take('apply_coupon', 'user:2'), 0)
+
+        self.clock.return_value = 1001.0
+        self.assertEqual(ratelimit.take('apply_coupon', 'user:1'), 1.0)
+        self.clock.return_value = 1002.0
+        self.assertEqual(ratelimit.take('apply_coupon', 'user:1'), 0)
+
+    def test_identity(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.7')
+        self.assertEqual(ratelimit.identity(request, AnonymousUser()), 'ip:10.0.0.7')
+        user = User(pk=5)
+        self.assertEqual(ratelimit.identity(request, user), 'user:5')
+
+    def test_sync_view_answers_429_with_retry_after(self):
+        view = ratelimit.rate_limit('apply_coupon')(lambda request: HttpResponse('ok'))
+        request = RequestFactory().post('/')
+        request.user = User.objects.create_user('shopper')
+
+        self.assertEqual([view(request).status_code for _ in range(2)], [200, 200])
+        response = view(request)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+
+    async def test_async_view(self):
+        async def view(request):
+            return HttpResponse('ok')
+
+        async def auser():
+            return AnonymousUser()
+
+        limited = ratelimit.rate_limit('apply_coupon')(view)
+        request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.7')
+        request.auser = auser
+        statuses = [(await limited(request)).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_apply_coupon_is_limited(self):
+        self.client.force_login(User.objects.create_user('shopper'))
+        for _ in range(2):
+            self.client.post('/ajax/apply-coupon/', {'coupon_code': 'NOPE'})
+        self.assertEqual(self.client.post('/ajax/apply-coupon/', {'coupon_code': 'NOPE'}).status_code, 429)
+
+    def test_unknown_codes_never_reach_the_database(self):
+        promotions.check_code('WARMUP')
+        with self.assertNumQueries(0):
+            self.assertEqual(promotions.check_code('NOPE'), 'Invalid coupon code')
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core import signing
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import reviews
+from ..models import Customer, Review
+from .utils import TEST_CACHES, make_catalog
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReviewPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category, nike, adidas, (nike_42, adidas_42) = make_catalog()
+        cls.product = nike_42.product
+        now = timezone.now()
+        # Ratings and helpful counts tie, so ids have to break them
+        for n, (rating, helpful, approved) in enumerate([
+            (5, 2, True), (3, 0, True), (5, 2, True), (1, 7, True),
+            (3, 1, False), (4, 0, True), (3, 2, True),
+        ]):
+            customer = Customer.objects.create(user=User.objects.create_user(f'reviewer{n}'))
+            review = Review.objects.create(
+                product=cls.product, customer=customer, rating=rating, helpful_count=helpful,
+                is_approved=approved, comment='Fine',
+            )
+            Review.objects.filter(pk=review.pk).update(created_at=now - timedelta(hours=n % 3))
+
+    def expected(self, *order):
+        return list(Review.objects.filter(is_approved=True).order_by(*order).values_list('id', flat=True))
+
+    def walk(self, sort):
+        seen, cursor = [], None
+        while True:
+            page, cursor = reviews.page(self.product.id, sort, cursor, size=2)
+            seen.extend(review.pk for review in page)
+            if cursor is None:
+                return seen
+
+    def test_pages_follow_each_sort(self):
+        for sort, order in [
+            ('newest', ('-created_at', '-id')),
+            ('helpful', ('-helpful_count', '-id')),
+            ('rating_high', ('-rating', '-id')),
+            ('rating_low', ('rating', 'id')),
+        ]:
+            with self.subTest(sort=sort):
+                self.assertEqual(self.walk(sort), self.expected(*order))
+
+    def test_unknown_sort_falls_back_to_newest(self):
+        self.assertEqual(self.walk('bogus'), self.expected('-created_at', '-id'))
+
+    def test_last_page_has_no_cursor(self):
+        page, cursor = reviews.page(self.product.id, size=6)
+        self.assertEqual((len(page), cursor), (6, None))
+
+    def test_summary_counts_approved_reviews(self):
+        summary = reviews.summary(self.product.id)
+        self.assertEqual(summary['count'], 6)
+        self.assertEqual(summary['average'], 3.5)
+        self.assertEqual(summary['rating_counts'], {1: 1, 2: 0, 3: 2, 4: 1, 5: 2})
+
+    def test_endpoint(self):
+        url = reverse('product_reviews', args=[self.product.id])
+        first = self.client.get(url, {'sort': 'helpful'}).json()
+        self.assertEqual([review['id'] for review in first['reviews']], self.expected('-helpful_count', '-id'))
+        self.assertIsNone(first['next'])
+
+        page, cursor = reviews.page(self.product.id, 'helpful', size=2)
+        second = self.client.get(url, {'sort': 'helpful', 'cursor': cursor}).json()
+        self.assertEqual([review['id'] for review in second['reviews']], self.expected('-helpful_count', '-id')[2:])
+
+    def test_tampered_cursor_is_rejected(self):
+        url = reverse('product_reviews', args=[self.product.id])
+        page, cursor = reviews.page(self.product.id, size=2)
+        response = self.client.get(url, {'cursor': cursor[:-2] + 'xx'})
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(signing.BadSignature):
+            reviews.page(self.product.id, cursor='nonsense')
@@ -0,0 +1,85 @@
+import contextvars
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from ..models import Cart, Product, SalesRollup
+from .. import routers
+from ..routers import PIN_COOKIE, PrimaryReplicaRouter, ReplicaStickinessMiddleware, pin_to_primary
+
+
+def run_isolated(func, *args):
+    """Run ``func`` as a fresh request would, unpinned and without leaking a pin"""
+    def fresh():
+        routers._pinned.set(False)
+        routers._wrote.set(False)
+        return func(*args)
+    return contextvars.copy_context().run(fresh)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class RouterTests(SimpleTestCase):
+    router = PrimaryReplicaRouter()
+
+    def test_catalog_and_report_reads_go_to_a_replica(self):
+        self.assertEqual(run_isolated(lambda: self.router.db_for_read(Product)), 'replica')
+        self.assertEqual(run_isolated(lambda: self.router.db_for_read(SalesRollup)), 'replica')
+
+    def test_auth_and_cart_reads_stay_on_the_primary(self):
+        self.assertEqual(run_isolated(lambda: self.router.db_for_read(User)), 'default')
+        self.assertEqual(run_isolated(lambda: self.router.db_for_read(Cart)), 'default')
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        def write_then_read():
+            self.assertEqual(self.router.db_for_write(Product), 'default')
+            return self.router.db_for_read(Product)
+        self.assertEqual(run_isolated(write_then_read), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(run_isolated(lambda: self.router.db_for_read(Product)), 'default')
+
+    def test_replicas_are_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'ecommerce'))
+        self.assertTrue(self.router.allow_migrate('default', 'ecommerce'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=10)
+class StickinessMiddlewareTests(SimpleTestCase):
+    router = PrimaryReplicaRouter()
+
+    def call(self, view, **cookies):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        return run_isolated(ReplicaStickinessMiddleware(view), request)
+
+    def test_a_write_pins_the_browser(self):
+        def view(request):
+            pin_to_primary()
+            return HttpResponse()
+        cookie = self.call(view).cookies[PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 10)
+        self.assertTrue(cookie['httponly'])
+
+    def test_pinned_browser_reads_from_the_primary(self):
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Product))
+            return HttpResponse()
+        response = self.call(view, **{PIN_COOKIE: '1'})
+        self.call(view)
+        self.assertEqual(reads, ['default', 'replica'])
+        # Reading doesn't extend the pin
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_flags_are_reset_after_the_request(self):
+        def view(request):
+            pin_to_primary()
+            return HttpResponse()
+
+        def request_then_read():
+            ReplicaStickinessMiddleware(view)(RequestFactory().get('/'))
+            return self.router.db_for_read(Product)
+        self.assertEqual(run_isolated(request_then_read), 'replica')
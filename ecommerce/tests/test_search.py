@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from .. import search
+from ..models import Product
+from .utils import TEST_CACHES, SnapshotMixin, make_catalog
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FuzzySearchTests(SnapshotMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category, cls.nike, cls.adidas, (cls.nike_42, cls.adidas_42) = make_catalog()
+
+    def setUp(self):
+        self.index = self.write_index([
+            ('brand', self.nike.pk, 'nike', 'Nike', 2.0),
+            ('brand', self.adidas.pk, 'adidas', 'Adidas', 1.0),
+            ('category', self.category.pk, 'shoes', 'Shoes', 3.0),
+            ('product', self.nike_42.product_id, 'nike-runner', 'Nike Runner', 1.0),
+            ('product', self.adidas_42.product_id, 'adidas-runner', 'Adidas Runner', 1.0),
+        ])
+
+    def matches(self, correction):
+        return set(Product.objects.filter(correction.condition).values_list('brand__name', flat=True))
+
+    def test_corrects_misspellings(self):
+        correction = search.fuzzy('addidas', self.index)
+        self.assertEqual(correction.query, 'adidas')
+        self.assertEqual(self.matches(correction), {'Adidas'})
+
+    def test_corrects_swapped_letters(self):
+        correction = search.fuzzy('nkie', self.index)
+        self.assertEqual(correction.query, 'nike')
+        self.assertEqual(self.matches(correction), {'Nike'})
+
+    def test_every_understood_word_must_match(self):
+        correction = search.fuzzy('nkie runer', self.index)
+        self.assertEqual(correction.query, 'nike runner')
+        self.assertEqual(self.matches(correction), {'Nike'})
+
+    def test_nothing_close(self):
+        self.assertIsNone(search.fuzzy('xyzzy', self.index))
+        self.assertIsNone(search.fuzzy('ab', self.index))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ListingCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category, cls.nike, cls.adidas, variants = make_catalog()
+
+    def setUp(self):
+        # A fresh catalog version, so the refdata snapshot sees this catalog
+        for alias in ('default', 'shared'):
+            caches[alias].clear()
+        computed = mock.patch.object(search, 'compute_listing', wraps=search.compute_listing)
+        self.compute = computed.start()
+        self.addCleanup(computed.stop)
+
+    def computed(self):
+        return [call.args for call in self.compute.call_args_list]
+
+    def test_equivalent_queries_share_an_entry(self):
+        first = search.listing('  Nike   RUNNER', page='1')
+        again = search.listing('nike runner', page='x')
+        self.assertEqual(self.computed(), [('nike runner', '', '', 1)])
+        self.assertEqual(first.count, again.count)
+
+    def test_pages_past_the_last_are_clamped(self):
+        search.listing('', page='1')
+        search.listing('', page='999')
+        search.listing('', page='-3')
+        self.assertEqual(self.computed(), [('', '', '', 1)])
+
+    def test_unknown_filters_are_dropped(self):
+        search.listing('', 'no-such-category', 'no-such-brand')
+        search.listing('', '', '')
+        search.listing('', self.category.slug, self.nike.slug)
+        self.assertEqual(self.computed(), [('', '', '', 1), ('', self.category.slug, self.nike.slug, 1)])
+
+    def test_catalog_changes_move_the_key(self):
+        key = search.listing_key('', '', '', 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nike.save()
+        self.assertNotEqual(search.listing_key('', '', '', 1), key)
+
+    def test_warm_fills_first_pages(self):
+        with mock.patch.object(search, 'popular_queries', return_value=['nike', 'adidas']):
+            self.assertEqual(search.warm(), 2)
+        search.listing('Nike')
+        self.assertEqual(self.computed(), [('nike',), ('adidas',)])
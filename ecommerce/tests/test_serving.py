@@ -0,0 +1,91 @@
+import os
+import tempfile
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from ..serving import parse_range, serve
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=500-', 1000), (500, 999))
+        self.assertEqual(parse_range('bytes=900-5000', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+
+    def test_ignored_headers_send_the_whole_file(self):
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range('items=0-1', 1000))
+        self.assertIsNone(parse_range('bytes=-', 1000))
+
+    def test_unsatisfiable(self):
+        for header, size in (('bytes=1000-', 1000), ('bytes=5-4', 1000), ('bytes=-0', 1000), ('bytes=0-', 0)):
+            with self.subTest(header=header, size=size), self.assertRaises(ValueError):
+                parse_range(header, size)
+
+    def test_suffix_range_of_an_empty_file(self):
+        with self.assertRaises(ValueError):
+            parse_range('bytes=-10', 0)
+
+@override_settings(FILE_SERVE_BACKEND='python')
+class ServeTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        with open(os.path.join(self.root, 'notes.txt'), 'wb') as file:
+            file.write(b'0123456789')
+        open(os.path.join(self.root, 'empty.txt'), 'wb').close()
+        with open(os.path.join(self.root, 'app.0123456789ab.css'), 'wb') as file:
+            file.write(b'body{}')
+
+    def get(self, path, **headers):
+        response = serve(RequestFactory().get('/', **headers), path, document_root=self.root)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file_with_validators(self):
+        response = self.get('notes.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('immutable', self.get('app.0123456789ab.css')['Cache-Control'])
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.get('notes.txt')['ETag']
+        response = self.get('notes.txt', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_range(self):
+        response = self.get('notes.txt', HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+        self.assertEqual(self.body(response), b'2345')
+
+    def test_stale_if_range_sends_the_whole_file(self):
+        response = self.get('notes.txt', HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), b'0123456789')
+
+    def test_unsatisfiable_range(self):
+        for path, header, size in (('notes.txt', 'bytes=20-', 10), ('empty.txt', 'bytes=-5', 0)):
+            with self.subTest(path=path, header=header):
+                response = self.get(path, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+    @override_settings(FILE_SERVE_BACKEND='x-accel-redirect')
+    def test_accel_redirect_leaves_the_body_to_the_proxy(self):
+        response = serve(
+            RequestFactory().get('/'), 'notes.txt', document_root=self.root, accel_prefix='/protected/media/'
+        )
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/media/notes.txt')
+        self.assertEqual(response.content, b'')
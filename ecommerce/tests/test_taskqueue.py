@@ -0,0 +1,135 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .. import taskqueue
+from ..models import Task
+from ..taskqueue import task
+from .utils import TEST_CACHES
+
+
+@task(unique=True)
+def rebuild(kind):
+    pass
+
+
+@task(max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+@task(unique=True)
+def flaky(kind):
+    raise RuntimeError('flaky')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TaskQueueTests(TestCase):
+    def claim(self, limit=10):
+        return taskqueue.claim(['default'], 'worker-1', limit)
+
+    def test_claim_takes_due_tasks_by_priority(self):
+        low = explode.enqueue(priority=-1)
+        high = explode.enqueue(priority=5)
+        later = explode.enqueue(countdown=3600)
+        # RETURNING order isn't defined; priority decides which fit the limit
+        self.assertEqual(self.claim(limit=1), [high.pk])
+        self.assertEqual(self.claim(), [low.pk])
+        self.assertEqual(self.claim(), [])
+
+        high.refresh_from_db()
+        later.refresh_from_db()
+        self.assertEqual((high.status, high.locked_by, high.attempts), ('running', 'worker-1', 1))
+        self.assertIsNotNone(high.heartbeat_at)
+        self.assertEqual(later.status, 'queued')
+
+    def test_claim_respects_limit_and_queues(self):
+        first = explode.enqueue()
+        explode.enqueue()
+        self.assertEqual(taskqueue.claim(['emails'], 'worker-1', 10), [])
+        self.assertEqual(self.claim(limit=1), [first.pk])
+
+    def test_unique_call_waits_once(self):
+        queued = rebuild.delay('catalog')
+        self.assertIsNotNone(queued)
+        self.assertIsNone(rebuild.delay('catalog'))
+        self.assertIsNotNone(rebuild.delay('search'))
+        self.assertEqual(Task.objects.filter(name=rebuild.name).count(), 2)
+
+    def test_unique_call_never_overlaps_a_run(self):
+        running = rebuild.delay('catalog')
+        self.assertEqual(self.claim(), [running.pk])
+
+        # Queued during the run, but not claimed until it finishes
+        waiting = rebuild.delay('catalog')
+        self.assertIsNotNone(waiting)
+        self.assertIsNone(rebuild.delay('catalog'))
+        self.assertEqual(self.claim(), [])
+
+        self.assertEqual(taskqueue.execute(running.pk), 'done')
+        self.assertEqual(self.claim(), [waiting.pk])
+
+    def test_failures_are_retried_then_failed(self):
+        job = explode.delay()
+        self.claim()
+        self.assertEqual(taskqueue.execute(job.pk), 'queued')
+        job.refresh_from_db()
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+
+        Task.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.claim()
+        with self.assertLogs('ecommerce.taskqueue', 'ERROR'):
+            self.assertEqual(taskqueue.execute(job.pk), 'failed')
+
+    def test_requeue_stale(self):
+        stale = explode.delay()
+        alive = explode.delay()
+        self.claim()
+        long_ago = timezone.now() - timedelta(hours=1)
+        Task.objects.filter(pk=stale.pk).update(started_at=long_ago, heartbeat_at=long_ago)
+        # Started long ago, but still heartbeating
+        Task.objects.filter(pk=alive.pk).update(started_at=long_ago)
+
+        self.assertEqual(taskqueue.requeue_stale(), 1)
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_by), ('queued', ''))
+        self.assertEqual(alive.status, 'running')
+
+    def test_requeue_stale_unique_with_a_twin_waiting(self):
+        stale = rebuild.delay('catalog')
+        self.claim()
+        waiting = rebuild.delay('catalog')
+        long_ago = timezone.now() - timedelta(hours=1)
+        Task.objects.filter(pk=stale.pk).update(started_at=long_ago, heartbeat_at=long_ago)
+
+        self.assertEqual(taskqueue.requeue_stale(), 0)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertEqual(self.claim(), [waiting.pk])
+
+    def test_retry_with_a_twin_waiting_is_failed(self):
+        running = flaky.delay('catalog')
+        self.claim()
+        waiting = flaky.delay('catalog')
+        # The retry would be a second queued copy; the waiting one redoes the work
+        self.assertEqual(taskqueue.execute(running.pk), 'failed')
+        self.assertEqual(Task.objects.get(pk=waiting.pk).status, 'queued')
+
+    def test_purge_keeps_failures(self):
+        done = explode.delay()
+        failed = explode.delay()
+        long_ago = timezone.now() - timedelta(days=30)
+        Task.objects.filter(pk=done.pk).update(status='done', finished_at=long_ago)
+        Task.objects.filter(pk=failed.pk).update(status='failed', finished_at=long_ago)
+        self.assertEqual(taskqueue.purge_finished(), 1)
+        self.assertEqual(list(Task.objects.values_list('pk', flat=True)), [failed.pk])
+
+    @override_settings(TASKS={**settings.TASKS, 'EAGER': True})
+    def test_eager_mode_runs_inline(self):
+        with self.assertRaisesMessage(RuntimeError, 'boom'):
+            explode.delay()
+        self.assertFalse(Task.objects.exists())
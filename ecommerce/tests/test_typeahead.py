@@ -0,0 +1,47 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .. import typeahead
+from .utils import SnapshotMixin
+
+
+class TypeaheadTests(SnapshotMixin, SimpleTestCase):
+    def test_normalize_and_trigrams(self):
+        self.assertEqual(typeahead.normalize("  Levi's  Café-Noir "), 'levis cafe noir')
+        self.assertEqual(typeahead.trigrams('nike'), {'$$n', '$ni', 'nik', 'ike', 'ke$'})
+        self.assertEqual(typeahead.transpositions('abc'), {'bac', 'acb'})
+
+    def test_complete_matches_word_starts_best_first(self):
+        index = self.write_index([
+            ('product', 1, 'air-max', 'Nike Air Max', 5.0),
+            ('brand', 2, 'nike', 'Nike', 9.0),
+            ('product', 3, 'air-force', 'Nike Air Force', 7.0),
+            ('category', 4, 'airbags', 'Airbags', 1.0),
+        ])
+        self.assertEqual([entry[1] for entry in index.complete('nik')], [2, 3, 1])
+        self.assertEqual([entry[1] for entry in index.complete('AIR')], [3, 1, 4])
+        self.assertEqual([entry[1] for entry in index.complete('air m')], [1])
+        self.assertEqual(index.complete('  '), [])
+        self.assertEqual(index.complete('zzz'), [])
+        self.assertEqual(index.complete('nik', limit=1), [('brand', 2, 'nike', 'Nike')])
+
+    def test_precomputed_tops_agree_with_a_scan(self):
+        entries = [
+            ('product', pk, f'p{pk}', f'{word} shoe {pk}', (pk * 37) % 101)
+            for pk, word in enumerate(['runner', 'running', 'rugby', 'trail'] * 30)
+        ]
+        with mock.patch.object(typeahead, 'SCAN_LIMIT', 4):
+            index = self.write_index(entries)
+            for prefix in ('r', 'run', 'shoe', 's', 'trail shoe 1'):
+                with self.subTest(prefix=prefix):
+                    expected = sorted(
+                        (entry for entry in entries
+                         if any(key.startswith(prefix) for key in typeahead.suffixes(entry[3]))),
+                        key=lambda entry: (-entry[4], entry[3], entry[1]),
+                    )[:typeahead.TOP_K]
+                    self.assertEqual([entry[1] for entry in index.complete(prefix)], [entry[1] for entry in expected])
+
+    def test_reopened_entries_round_trip(self):
+        entries = [('brand', 1, 'nike', 'Nike', 2.0), ('category', 2, 'shoes', 'Shoes', 1.5)]
+        self.assertEqual(list(self.write_index(entries).entries()), entries)
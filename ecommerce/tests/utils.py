@@ -0,0 +1,64 @@
+"""Fixtures shared by the ecommerce test modules"""
+import os
+import tempfile
+from decimal import Decimal
+
+from .. import typeahead
+from ..models import Brand, Category, Color, Order, OrderItem, Product, ProductVariant, Size
+
+
+# Every test gets its own process-local caches, never the shared file cache
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-shared'},
+}
+
+
+def make_catalog():
+    """A category, two brands and a variant per brand at 40.00 and 25.00"""
+    category = Category.objects.create(name='Shoes')
+    nike = Brand.objects.create(name='Nike')
+    adidas = Brand.objects.create(name='Adidas')
+    color = Color.objects.create(name='Black')
+    size = Size.objects.create(name='42', size_type='shoe')
+    variants = []
+    for brand, price in ((nike, '40.00'), (adidas, '25.00')):
+        product = Product.objects.create(
+            name=f'{brand.name} Runner', description='Running shoe', category=category,
+            brand=brand, sku=f'{brand.slug}-runner', base_price=Decimal(price), gender='unisex',
+        )
+        variants.append(ProductVariant.objects.create(
+            product=product, color=color, size=size, sku=f'{brand.slug}-runner-42', stock_quantity=10,
+        ))
+    # Reloaded, so prices are Decimals and effective_price is set
+    variants = [
+        ProductVariant.objects.select_related('product', 'color', 'size').get(pk=variant.pk) for variant in variants
+    ]
+    return category, nike, adidas, variants
+
+
+def make_order(customer, lines, status='pending'):
+    """An order of ``[(variant, quantity)]`` at the variants' current prices"""
+    subtotal = sum((variant.final_price * quantity for variant, quantity in lines), Decimal('0'))
+    order = Order.objects.create(
+        customer=customer, status=status, billing_address={}, shipping_address={},
+        subtotal=subtotal, total_amount=subtotal,
+    )
+    for variant, quantity in lines:
+        OrderItem.objects.create(
+            order=order, product_variant=variant, product_name=variant.product.name, product_sku=variant.sku,
+            color_name=variant.color.name, size_name=variant.size.name, quantity=quantity,
+            unit_price=variant.final_price,
+        )
+    return order
+
+
+class SnapshotMixin:
+    """Writes typeahead snapshots to a temporary directory"""
+
+    def write_index(self, entries):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'typeahead.idx')
+        typeahead.Writer(entries).write(path)
+        return typeahead.Index(path)
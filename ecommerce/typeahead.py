@@ -0,0 +1,479 @@
+"""
+Search-box autocomplete from a prefix index of product, brand and category
+names, ranked by popularity.
+
+The index is a snapshot file that every worker memory-maps read-only, so
+the operating system keeps one copy in the page cache however many
+processes use it. It holds:
+
+- entries: (kind, id, slug, label, score) in rank order, most popular
+  first, so a lower rank is a better suggestion
+- keys: every word-start suffix of each normalized label ("nike air max",
+  "air max", "max") as UTF-8, sorted, each with the rank of its entry
+- tops: the best TOP_K distinct ranks of every key range, longer than
+  SCAN_LIMIT, that some prefix selects
+- words: the distinct words the keys start with, and a trigram index over
+  them for typo-tolerant search (see ecommerce.search)
+
+complete() binary-searches the keys for the range that starts with the
+typed prefix. A small range is scanned for its best ranks and a large one
+is answered from its precomputed top list, so a lookup costs about
+2 * log2(keys) comparisons plus at most SCAN_LIMIT integer reads.
+
+Product scores are trend_score. A brand or category scores the sum of its
+active products, which puts "Nike" above any single Nike product.
+
+Saving or deleting a Product, Brand or Category queues a refresh_typeahead
+job, unique and delayed by TYPEAHEAD['DEBOUNCE_SECONDS'] so a burst of admin
+edits costs one rebuild. refresh() reads only products updated since the
+snapshot was built plus the active id list, merges them into the previous
+entries and writes a new file that replaces the old one atomically. Workers
+notice the swap within TYPEAHEAD['CHECK_SECONDS']. Scores of unchanged
+products drift until ``manage.py rebuild_typeahead`` re-reads everything,
+which is also how the first snapshot is made.
+"""
+import bisect
+import heapq
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.urls import reverse
+
+from .models import Brand, Category, Product
+
+
+MAGIC = b'TYPEAHD2'
+# magic, built_at, top_k, then (offset, length) of each section
+HEADER = struct.Struct('<8sdI4x' + 'QQ' * 13)
+SECTIONS = (
+    'entry_offsets', 'entry_blob', 'scores',
+    'key_offsets', 'key_blob', 'key_ranks',
+    'top_ranges', 'top_ranks',
+    'word_offsets', 'word_blob', 'gram_blob', 'gram_offsets', 'gram_postings',
+)
+SEPARATOR = '\x1f'
+NO_RANK = 0xFFFFFFFF
+TOP_K = 10
+SCAN_LIMIT = 2048
+MAX_WORDS = 6
+# Similarity of a word reached only by swapping two adjacent letters is scaled by this
+TRANSPOSED = 0.9
+# Categories, then brands, then products when scores tie
+KIND_ORDER = {'category': 0, 'brand': 1, 'product': 2}
+
+
+def normalize(text):
+    """Lowercase ASCII-folded words separated by single spaces; "Levi's" is "levis" """
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
+    return ' '.join(re.findall(r'[a-z0-9]+', text.lower().replace("'", '')))
+
+
+def suffixes(label):
+    """Word-start suffixes of a label, the keys it can be found under"""
+    words = normalize(label).split(' ')
+    return {' '.join(words[start:]) for start in range(min(len(words), MAX_WORDS)) if words[start]}
+
+
+def trigrams(word):
+    """Padded trigrams, as pg_trgm makes them: "$$n", "$ni", "nik", "ike", "ke$" """
+    padded = f'$${word}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def transpositions(word):
+    """``word`` with each pair of adjacent letters swapped, catching "nkie" for "nike" """
+    return {word[:i] + word[i + 1] + word[i] + word[i + 2:] for i in range(len(word) - 1)} - {word}
+
+
+def uint32s(values):
+    return array('I', values)
+
+
+class Writer:
+    """Builds a snapshot from (kind, id, slug, label, score) entries"""
+
+    def __init__(self, entries, built_at=None):
+        self.built_at = time.time() if built_at is None else built_at
+        self.entries = sorted(entries, key=lambda e: (-e[4], KIND_ORDER[e[0]], e[3], e[1]))
+
+    def keys(self):
+        keys = []
+        for rank, (kind, pk, slug, label, score) in enumerate(self.entries):
+            for key in suffixes(label):
+                keys.append((key.encode(), rank))
+        keys.sort()
+        return keys
+
+    def tops(self, keys):
+        """
+        {(lo, hi): best ranks} for the large key ranges a prefix can select.
+        A prefix either selects a whole byte-prefix group or narrows into
+        one of its subgroups, so splitting groups on the byte after their
+        common prefix, down to SCAN_LIMIT keys, visits every such range.
+        """
+        tops = {}
+        ranks = [rank for key, rank in keys]
+        pending = [(0, len(keys))]
+        while pending:
+            lo, hi = pending.pop()
+            tops[lo, hi] = heapq.nsmallest(TOP_K, set(ranks[lo:hi]))
+            first, last = keys[lo][0], keys[hi - 1][0]
+            if first == last:
+                continue
+            depth = 0
+            while depth < len(first) and first[depth] == last[depth]:
+                depth += 1
+            start = lo
+            while start < hi:
+                group = keys[start][0][:depth + 1]
+                if len(group) == depth:
+                    # Keys equal to the common prefix; no longer prefix selects them alone
+                    start = bisect.bisect_left(keys, (group + b'\x00',), start, hi)
+                    continue
+                end = bisect.bisect_left(keys, (group + b'\xff',), start, hi)
+                if end - start > SCAN_LIMIT:
+                    pending.append((start, end))
+                start = end
+        return tops
+
+    def sections(self):
+        entry_blob = bytearray()
+        entry_offsets = uint32s([0])
+        for kind, pk, slug, label, score in self.entries:
+            entry_blob += SEPARATOR.join((kind, str(pk), slug, label)).encode()
+            entry_offsets.append(len(entry_blob))
+        scores = array('d', (entry[4] for entry in self.entries))
+
+        keys = self.keys()
+        key_blob = bytearray()
+        key_offsets = uint32s([0])
+        for key, rank in keys:
+            key_blob += key
+            key_offsets.append(len(key_blob))
+        key_ranks = uint32s(rank for key, rank in keys)
+
+        top_ranges = array('Q')
+        top_ranks = uint32s([])
+        tops = self.tops(keys) if len(keys) > SCAN_LIMIT else {}
+        for lo, hi in sorted(tops):
+            top_ranges.append(lo << 32 | hi)
+            top_ranks.extend(tops[lo, hi] + [NO_RANK] * (TOP_K - len(tops[lo, hi])))
+
+        words = sorted({key.split(b' ', 1)[0].decode() for key, rank in keys})
+        word_blob = ''.join(words).encode()
+        word_offsets = uint32s([0])
+        postings = {}
+        for word_id, word in enumerate(words):
+            word_offsets.append(word_offsets[-1] + len(word))
+            for gram in trigrams(word):
+                postings.setdefault(gram, []).append(word_id)
+        # Trigrams are 3 ASCII bytes each, so the sorted blob is searchable without offsets
+        grams = sorted(postings)
+        gram_offsets = uint32s([0])
+        gram_postings = uint32s([])
+        for gram in grams:
+            gram_postings.extend(postings[gram])
+            gram_offsets.append(len(gram_postings))
+
+        return (
+            entry_offsets.tobytes(), bytes(entry_blob), scores.tobytes(),
+            key_offsets.tobytes(), bytes(key_blob), key_ranks.tobytes(),
+            top_ranges.tobytes(), top_ranks.tobytes(),
+            word_offsets.tobytes(), word_blob, ''.join(grams).encode(),
+            gram_offsets.tobytes(), gram_postings.tobytes(),
+        )
+
+    def write(self, path):
+        """Write the snapshot next to ``path`` and move it into place"""
+        sections = self.sections()
+        layout = []
+        offset = HEADER.size
+        for data in sections:
+            offset += -offset % 8
+            layout += [offset, len(data)]
+            offset += len(data)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.typeahead-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(HEADER.pack(MAGIC, self.built_at, TOP_K, *layout))
+                for (start, length), data in zip(zip(layout[::2], layout[1::2]), sections):
+                    file.write(b'\0' * (start - file.tell()))
+                    file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return len(self.entries)
+
+
+class Index:
+    """A memory-mapped snapshot; read-only and safe to share between threads"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.built_at, self.top_k, *layout = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a typeahead snapshot')
+        view = memoryview(self.map)
+        sections = {
+            name: view[start:start + length]
+            for name, start, length in zip(SECTIONS, layout[::2], layout[1::2])
+        }
+        self.entry_offsets = sections['entry_offsets'].cast('I')
+        self.entry_blob = sections['entry_blob']
+        self.scores = sections['scores'].cast('d')
+        self.key_offsets = sections['key_offsets'].cast('I')
+        self.key_blob = sections['key_blob']
+        self.key_ranks = sections['key_ranks'].cast('I')
+        self.top_ranges = sections['top_ranges'].cast('Q')
+        self.top_ranks = sections['top_ranks'].cast('I')
+        self.word_offsets = sections['word_offsets'].cast('I')
+        self.word_blob = sections['word_blob']
+        self.gram_blob = sections['gram_blob']
+        self.gram_offsets = sections['gram_offsets'].cast('I')
+        self.gram_postings = sections['gram_postings'].cast('I')
+        self.key_count = len(self.key_ranks)
+        self.gram_count = len(self.gram_offsets) - 1
+
+    def __len__(self):
+        return len(self.scores)
+
+    def key(self, position):
+        return bytes(self.key_blob[self.key_offsets[position]:self.key_offsets[position + 1]])
+
+    def entry(self, rank):
+        raw = bytes(self.entry_blob[self.entry_offsets[rank]:self.entry_offsets[rank + 1]])
+        kind, pk, slug, label = raw.decode().split(SEPARATOR, 3)
+        return kind, int(pk), slug, label
+
+    def entries(self):
+        """Every (kind, id, slug, label, score), for merging into the next snapshot"""
+        for rank in range(len(self)):
+            yield (*self.entry(rank), self.scores[rank])
+
+    def key_position(self, target):
+        """First key position not below ``target``"""
+        lo, hi = 0, self.key_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def top(self, lo, hi):
+        """Precomputed best ranks of keys [lo, hi), or None"""
+        position = bisect.bisect_left(self.top_ranges, lo << 32 | hi)
+        if position < len(self.top_ranges) and self.top_ranges[position] == lo << 32 | hi:
+            ranks = self.top_ranks[position * self.top_k:(position + 1) * self.top_k]
+            return [rank for rank in ranks if rank != NO_RANK]
+        return None
+
+    def ranks(self, prefix, limit):
+        """Best ``limit`` entry ranks with a key starting with ``prefix``"""
+        lo = self.key_position(prefix)
+        hi = self.key_position(prefix + b'\xff')
+        if hi - lo > SCAN_LIMIT:
+            top = self.top(lo, hi)
+            if top is not None:
+                return top[:limit]
+        return heapq.nsmallest(limit, set(self.key_ranks[lo:hi]))
+
+    def complete(self, query, limit=TOP_K):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        return [self.entry(rank) for rank in self.ranks(prefix.encode(), min(limit, self.top_k))]
+
+    def word(self, word_id):
+        return bytes(self.word_blob[self.word_offsets[word_id]:self.word_offsets[word_id + 1]]).decode()
+
+    def postings(self, gram):
+        """Ids of the words containing trigram ``gram``"""
+        target = gram.encode()
+        lo, hi = 0, self.gram_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(self.gram_blob[mid * 3:mid * 3 + 3]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.gram_count and bytes(self.gram_blob[lo * 3:lo * 3 + 3]) == target:
+            return self.gram_postings[self.gram_offsets[lo]:self.gram_offsets[lo + 1]]
+        return self.gram_postings[0:0]
+
+    def similar_words(self, word, threshold, max_postings, max_candidates):
+        """
+        [(similarity, word)] of indexed words at least ``threshold`` similar to
+        ``word``, best first. Similarity is the Jaccard index of the trigram
+        sets, also tried with adjacent letters swapped.
+
+        Candidates come from the trigram postings, rarest first, until
+        ``max_postings`` ids have been counted; the ``max_candidates`` words
+        sharing the most trigrams are then scored exactly.
+        """
+        variants = {variant: trigrams(variant) for variant in transpositions(word) | {word}}
+        lists = sorted(
+            (self.postings(gram) for gram in set().union(*variants.values())), key=len
+        )
+        shared = Counter()
+        read = 0
+        for ids in lists:
+            if read and read + len(ids) > max_postings:
+                break
+            # Counter.update over a memoryview counts in C, without a Python loop
+            shared.update(ids)
+            read += len(ids)
+
+        scored = []
+        for word_id, count in shared.most_common(max_candidates):
+            candidate = self.word(word_id)
+            grams = trigrams(candidate)
+            similarity = max(
+                len(grams & variant_grams) / len(grams | variant_grams) * (1 if variant == word else TRANSPOSED)
+                for variant, variant_grams in variants.items()
+            )
+            if similarity >= threshold:
+                scored.append((similarity, candidate))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return scored
+
+    def word_ranks(self, word):
+        """Ranks of the entries with ``word`` as a whole word"""
+        target = word.encode()
+        exact = self.key_ranks[self.key_position(target):self.key_position(target + b'\x00')]
+        followed = self.key_ranks[self.key_position(target + b' '):self.key_position(target + b' \xff')]
+        return set(exact).union(followed)
+
+
+_index = None
+_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def index_path():
+    return str(settings.TYPEAHEAD['PATH'])
+
+
+def index():
+    """This process's Index, reopened when the snapshot file is replaced; None if there is none"""
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < settings.TYPEAHEAD['CHECK_SECONDS']:
+        return _index
+    with _index_lock:
+        if now - _checked_at < settings.TYPEAHEAD['CHECK_SECONDS'] and _index is not None:
+            return _index
+        _checked_at = now
+        try:
+            stat = os.stat(index_path())
+        except FileNotFoundError:
+            _index = None
+            return None
+        if _index is None or _index.identity != (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            # The old map is released when the last request using it finishes
+            try:
+                _index = Index(index_path())
+            except ValueError:
+                # Written by an older release; the next rebuild replaces it
+                _index = None
+    return _index
+
+
+def suggestion(kind, pk, slug, label):
+    if kind == 'product':
+        url = reverse('product_detail', args=[slug])
+    elif kind == 'category':
+        url = reverse('category_products', args=[slug])
+    else:
+        url = f'{reverse("index")}?brand={slug}'
+    return {'kind': kind, 'label': label, 'url': url}
+
+
+def complete(query, limit=TOP_K):
+    """Suggestions for a partly typed query, best first"""
+    current = index()
+    if current is None:
+        return []
+    return [suggestion(*entry) for entry in current.complete(query, limit)]
+
+
+def product_entries(products):
+    for pk, slug, name, score in products.values_list('id', 'slug', 'name', 'trend_score').iterator(chunk_size=5000):
+        yield 'product', pk, slug, name, score
+
+
+def group_entries():
+    """Active brands and categories, scored by the sum of their active products"""
+    active = Q(products__is_active=True)
+    for kind, model in (('brand', Brand), ('category', Category)):
+        rows = model.objects.filter(is_active=True).annotate(score=Sum('products__trend_score', filter=active))
+        for pk, slug, name, score in rows.values_list('id', 'slug', 'name', 'score'):
+            yield kind, pk, slug, name, score or 0.0
+
+
+def rebuild(path=None):
+    """Write a snapshot of the whole catalog; returns the number of entries"""
+    built_at = time.time()
+    entries = list(product_entries(Product.objects.filter(is_active=True)))
+    entries.extend(group_entries())
+    return Writer(entries, built_at).write(path or index_path())
+
+
+def refresh(path=None):
+    """
+    Fold catalog changes since the last snapshot into a new one, reading only
+    the changed products; falls back to rebuild() when there is no snapshot.
+    """
+    path = path or index_path()
+    if not os.path.exists(path):
+        return rebuild(path)
+    try:
+        previous = Index(path)
+    except ValueError:
+        return rebuild(path)
+    built_at = time.time()
+    # Saves that committed while the previous build was reading are caught by the overlap
+    since = datetime.fromtimestamp(previous.built_at, dt_timezone.utc) - timedelta(seconds=60)
+    active_ids = set(Product.objects.filter(is_active=True).values_list('id', flat=True).iterator(chunk_size=20000))
+    changed = {
+        entry[1]: entry
+        for entry in product_entries(Product.objects.filter(is_active=True, updated_at__gte=since))
+    }
+    entries = []
+    for entry in previous.entries():
+        kind, pk = entry[:2]
+        # Brands and categories are re-read whole below
+        if kind == 'product' and pk in active_ids:
+            entries.append(changed.pop(pk, entry))
+    entries.extend(changed.values())
+    entries.extend(group_entries())
+    return Writer(entries, built_at).write(path)
+
+
+def catalog_changed(sender=None, **kwargs):
+    """post_save/post_delete receiver for Product, Brand and Category"""
+    from .tasks import refresh_typeahead
+    transaction.on_commit(
+        lambda: refresh_typeahead.enqueue(countdown=settings.TYPEAHEAD['DEBOUNCE_SECONDS'])
+    )
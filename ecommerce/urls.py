@@ -1,5 +1,10 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+
+# The ASGI profile serves the chatty JSON endpoints from async_views
+ajax_views = async_views if settings.ASYNC_AJAX_VIEWS else views
 
 
 urlpatterns = [
@@ -9,15 +14,30 @@ urlpatterns = [
     
     # Cart
     path('cart/', views.cart_view, name='cart'),
-    path('cart/add/', views.add_to_cart, name='add_to_cart'),
-    path('cart/update/', views.update_cart, name='update_cart'),
-    path('cart/remove/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/add/', ajax_views.add_to_cart, name='add_to_cart'),
+    path('cart/update/', ajax_views.update_cart, name='update_cart'),
+    path('cart/remove/', ajax_views.remove_from_cart, name='remove_from_cart'),
+    path('cart/bulk-add/', views.bulk_add_to_cart, name='bulk_add_to_cart'),
 
     # Checkout
     path('checkout/', views.checkout, name='checkout'),
     path('order/success/<str:order_number>/', views.order_success, name='order_success'),
+    path('order/<str:order_number>/reorder/', views.reorder, name='reorder'),
 
     # AJAX
-    path('ajax/apply-coupon/', views.apply_coupon, name='apply_coupon'),
-    path('ajax/variant-info/', views.get_variant_info, name='get_variant_info'),
+    path('ajax/apply-coupon/', ajax_views.apply_coupon, name='apply_coupon'),
+    path('ajax/variant-info/', ajax_views.get_variant_info, name='get_variant_info'),
+    path('ajax/autocomplete/', views.autocomplete, name='autocomplete'),
+    path('ajax/products/<int:product_id>/reviews/', views.product_reviews, name='product_reviews'),
+    path('ajax/reviews/<int:review_id>/helpful/', views.mark_review_helpful, name='mark_review_helpful'),
+    path('ajax/variants/<int:variant_id>/notify/', views.notify_back_in_stock, name='notify_back_in_stock'),
+    path('ajax/products/<int:product_id>/price-alert/', views.notify_price_drop, name='notify_price_drop'),
+
+    # Newsletter
+    path('newsletter/unsubscribe/<str:token>/', views.newsletter_unsubscribe, name='newsletter_unsubscribe'),
+
+    # Metrics
+    path('metrics/cache/', views.cache_metrics, name='cache_metrics'),
+    path('metrics/events/', views.event_metrics, name='event_metrics'),
+    path('metrics/tasks/', views.task_metrics, name='task_metrics'),
 ]
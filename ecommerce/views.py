@@ -15,18 +15,24 @@ from .models import (
 
 
 from django.shortcuts import render, get_object_or_404, redirect
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q, Avg, Count, Prefetch
+from django.core.cache import cache
+from django.core import signing
+from django.http import Http404, JsonResponse
+from django.db.models import Q, Avg, Count, Prefetch, F
 from django.core.paginator import Paginator
 from django.views.decorators.http import require_POST
+from collections import Counter
 from decimal import Decimal
 import json
 
+from . import alerts, analytics, availability, carts, database, events, newsletter, popularity, promotions, recommendations, refdata, reviews, search, taskqueue, tasks, typeahead
+from .ratelimit import rate_limit
 from .models import (
     Product, Category, Brand, ProductVariant, ProductImage,
-    Customer, Color, Size
+    Customer, Color, Size, Newsletter, Review
 )
 
 
@@ -37,82 +43,40 @@ def index(request):
     category_filter = request.GET.get('category', '')
     brand_filter = request.GET.get('brand', '')
     
-    # Base queryset for products with optimized queries
-    products = Product.objects.filter(is_active=True).select_related(
-        'brand', 'category'
-    ).prefetch_related(
-        Prefetch('images', queryset=ProductImage.objects.filter(is_primary=True))
-    )
-    
-    # Apply search filter
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(brand__name__icontains=search_query) |
-            Q(category__name__icontains=search_query)
-        )
-    
-    # Apply category filter
-    if category_filter:
-        products = products.filter(category__slug=category_filter)
-    
-    # Apply brand filter
-    if brand_filter:
-        products = products.filter(brand__slug=brand_filter)
-    
-    # Get featured products
-    featured_products = products.filter(is_featured=True)[:8]
-    
-    # Get latest products
-    latest_products = products.order_by('-created_at')[:12]
-    
-    # Add image and price properties to products for template compatibility
-    def add_template_properties(product_list):
-        for product in product_list:
-            # Get primary image or first image
-            primary_images = [img for img in product.images.all() if img.is_primary]
-            if primary_images:
-                product.image = primary_images[0]
-            elif product.images.all():
-                product.image = product.images.all()[0]
-            else:
-                product.image = None
-            
-            # Add price property for template compatibility
-            product.price = product.current_price
-        return product_list
-    
-    # Apply template properties
-    featured_products = add_template_properties(list(featured_products))
-    latest_products = add_template_properties(list(latest_products))
-    
-    # Get categories with product count
-    categories = Category.objects.filter(is_active=True).annotate(
-        product_count=Count('products', filter=Q(products__is_active=True))
-    )
-    
-    # Get brands with product count
-    brands = Brand.objects.filter(is_active=True).annotate(
-        product_count=Count('products', filter=Q(products__is_active=True))
-    )
-    
-    # Pagination for search results
-    if search_query or category_filter or brand_filter:
-        paginator = Paginator(products, 12)
-        page_number = request.GET.get('page')
-        page_products = paginator.get_page(page_number)
-        # Apply template properties to paginated products
-        page_products.object_list = add_template_properties(list(page_products.object_list))
-    else:
-        page_products = None
+    # Record the search even when the listing comes from the cache
+    if search_query and request.GET.get('page', '1') == '1':
+        events.record_search(search_query, user=request.user, session_key=request.session.session_key)
+    
+    # Featured, latest and paginated results, with typo-tolerant matches when
+    # exact ones are scarce; cached per query, filters, page and catalog version
+    listing = search.listing(search_query, category_filter, brand_filter, request.GET.get('page'))
+    featured_products = listing.featured
+    latest_products = listing.latest
+    corrected_query = listing.corrected_query
+    page_products = search.paginate(listing)
+    
+    # Personal picks from the customer's co-purchase neighbours
+    recommended_products = []
+    if request.user.is_authenticated:
+        recommended_products = search.add_template_properties(list(
+            recommendations.for_customer(request.user).prefetch_related(
+                Prefetch('images', queryset=ProductImage.objects.filter(is_primary=True))
+            )[:9]
+        ))
+    
+    # Categories and brands with product counts, from the reference snapshot
+    refs = refdata.snapshot()
+    categories = refs.active_categories
+    brands = refs.active_brands
     
     context = {
         'featured_products': featured_products,
         'latest_products': latest_products,
+        'recommended_products': recommended_products,
         'categories': categories,
         'brands': brands,
         'search_query': search_query,
+        'corrected_query': corrected_query,
         'category_filter': category_filter,
         'brand_filter': brand_filter,
         'page_products': page_products,
@@ -160,7 +124,7 @@ def product_detail(request, slug):
             related_product.image = related_product.images.all()[0]
         else:
             related_product.image = None
-        related_product.price = related_product.current_price
+        related_product.price = related_product.effective_price
     
     context = {
         'product': product,
@@ -175,9 +139,12 @@ def product_detail(request, slug):
 
 def category_products(request, category_slug=None):
     """Category products listing"""
+    refs = refdata.snapshot()
     category = None
     if category_slug:
-        category = get_object_or_404(Category, slug=category_slug, is_active=True)
+        category = refs.active_category(category_slug)
+        if category is None:
+            raise Http404('No Category matches the given query.')
     
     # Get products
     products = Product.objects.filter(is_active=True).select_related(
@@ -190,38 +157,55 @@ def category_products(request, category_slug=None):
         products = products.filter(category=category)
     
     # Get filter parameters
+    subcategory_filter = request.GET.get('subcategory', '')
     brand_filter = request.GET.get('brand', '')
+    size_filter = request.GET.get('size', '')
+    color_filter = request.GET.get('color', '')
+    in_stock_filter = request.GET.get('in_stock', '')
     min_price = request.GET.get('min_price', '')
     max_price = request.GET.get('max_price', '')
     sort_by = request.GET.get('sort', 'name')
     
     # Apply filters
+    if subcategory_filter:
+        products = products.filter(subcategory__slug=subcategory_filter)
+    
     if brand_filter:
         products = products.filter(brand__slug=brand_filter)
     
+    # In stock from the per-product summary; sizes and colors via the variant stock indexes
+    size_id = int(size_filter) if size_filter.isdigit() else None
+    color_id = int(color_filter) if color_filter.isdigit() else None
+    if in_stock_filter or size_id or color_id:
+        products = availability.filter_available(products, size_id, color_id)
+    
     if min_price:
         try:
             min_price = Decimal(min_price)
-            products = products.filter(base_price__gte=min_price)
+            products = products.filter(effective_price__gte=min_price)
         except:
             pass
     
     if max_price:
         try:
             max_price = Decimal(max_price)
-            products = products.filter(base_price__lte=max_price)
+            products = products.filter(effective_price__lte=max_price)
         except:
             pass
     
     # Apply sorting
     if sort_by == 'price_low':
-        products = products.order_by('base_price')
+        products = products.order_by('effective_price')
     elif sort_by == 'price_high':
-        products = products.order_by('-base_price')
+        products = products.order_by('-effective_price')
     elif sort_by == 'newest':
         products = products.order_by('-created_at')
     elif sort_by == 'name':
         products = products.order_by('name')
+    elif sort_by == 'best_selling':
+        products = products.order_by('-sales_score')
+    elif sort_by == 'trending':
+        products = products.order_by('-trend_score')
     
     # Pagination
     paginator = Paginator(products, 12)
@@ -237,20 +221,26 @@ def category_products(request, category_slug=None):
             product.image = product.images.all()[0]
         else:
             product.image = None
-        product.price = product.current_price
+        product.price = product.effective_price
+        product.sizes_left = [
+            refs.sizes[size_id] for size_id in availability.decode_ids(product.available_size_ids)
+            if size_id in refs.sizes
+        ]
     
     # Get available brands for filtering
-    available_brands = Brand.objects.filter(
-        products__category=category if category else None,
-        products__is_active=True,
-        is_active=True
-    ).distinct()
+    available_brands = refs.brands_by_category.get(category.id if category else None, ())
     
     context = {
         'category': category,
         'products': page_products,
         'available_brands': available_brands,
+        'sizes': refs.sizes.values(),
+        'colors': refs.colors.values(),
+        'current_subcategory': subcategory_filter,
         'current_brand': brand_filter,
+        'current_size': size_id,
+        'current_color': color_id,
+        'in_stock_only': bool(in_stock_filter),
         'current_sort': sort_by,
     }
     
@@ -260,14 +250,17 @@ def product_detail(request, slug):
     """Product detail page with variants and reviews"""
     product = get_object_or_404(
         Product.objects.select_related('brand', 'category')
-        .prefetch_related('variants__color', 'variants__size', 'images', 'reviews__customer__user'),
+        .prefetch_related('variants', 'images'),
         slug=slug,
         is_active=True
     )
     
-    # Get product variants grouped by color
+    # Get product variants grouped by color; colors and sizes from the snapshot
+    variants = refdata.snapshot().attach(
+        [variant for variant in product.variants.all() if variant.is_active]
+    )
     variants_by_color = {}
-    for variant in product.variants.filter(is_active=True):
+    for variant in variants:
         color_name = variant.color.name
         if color_name not in variants_by_color:
             variants_by_color[color_name] = {
@@ -280,27 +273,34 @@ def product_detail(request, slug):
             'in_stock': variant.is_in_stock
         })
     
+    events.record('view', product_id=product.id, user=request.user, session_key=request.session.session_key)
+    
     # Get product images
     images = product.images.all().order_by('order')
     
-    # Get reviews with ratings
-    reviews = product.reviews.filter(is_approved=True).select_related('customer__user')
-    avg_rating = reviews.aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0
-    rating_counts = {i: reviews.filter(rating=i).count() for i in range(1, 6)}
+    # First page of reviews; the rest load from product_reviews
+    review_sort = request.GET.get('review_sort', reviews.DEFAULT_SORT)
+    review_page, reviews_next = reviews.page(product.id, review_sort)
+    review_summary = reviews.summary(product.id)
     
-    # Get related products
-    related_products = Product.objects.filter(
-        category=product.category,
-        is_active=True
-    ).exclude(id=product.id)[:6]
+    # Get related products: co-purchase neighbours, else the same category
+    related_products = list(recommendations.related_products(product)[:6])
+    if not related_products:
+        related_products = Product.objects.filter(
+            category=product.category,
+            is_active=True
+        ).exclude(id=product.id)[:6]
     
     context = {
         'product': product,
         'variants_by_color': variants_by_color,
         'images': images,
-        'reviews': reviews,
-        'avg_rating': round(avg_rating, 1),
-        'rating_counts': rating_counts,
+        'reviews': review_page,
+        'reviews_next': reviews_next,
+        'review_sort': review_sort,
+        'review_count': review_summary['count'],
+        'avg_rating': review_summary['average'],
+        'rating_counts': review_summary['rating_counts'],
         'related_products': related_products,
     }
     
@@ -308,7 +308,6 @@ def product_detail(request, slug):
 
 
 
-@login_required
 @require_POST
 def add_to_cart(request):
     """Add product variant to cart"""
@@ -328,52 +327,116 @@ def add_to_cart(request):
                 'message': f'Only {variant.stock_quantity} items available'
             })
         
-        # Get or create customer
-        customer, created = Customer.objects.get_or_create(user=request.user)
-        
-        # Get or create cart
-        cart, created = Cart.objects.get_or_create(customer=customer)
-        
-        # Add or update cart item
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product_variant=variant,
-            defaults={'quantity': quantity}
-        )
+        # Database cart when signed in, cookie cart otherwise
+        cart = request.cart
+        if cart.quantity_of(variant.id) + quantity > variant.stock_quantity:
+            return JsonResponse({
+                'success': False,
+                'message': f'Cannot add more than {variant.stock_quantity} items'
+            })
+        cart.add(variant, quantity)
         
-        if not created:
-            cart_item.quantity += quantity
-            if cart_item.quantity > variant.stock_quantity:
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Cannot add more than {variant.stock_quantity} items'
-                })
-            cart_item.save()
+        events.record('add_to_cart', product_id=variant.product_id, user=request.user, session_key=request.session.session_key)
         
         return JsonResponse({
             'success': True,
             'message': 'Product added to cart successfully',
-            'cart_count': cart.total_items
+            'cart_count': cart.summary()['count']
         })
         
     except Exception as e:
         return JsonResponse({'success': False, 'message': 'An error occurred'})
 
 
+# Most lines accepted by one bulk add
+BULK_ADD_MAX_LINES = 50
+
+
+def parse_bulk_lines(request):
+    """
+    ``{variant_id: quantity}`` from a JSON body ``{"items": [{"variant_id": 1,
+    "quantity": 2}, ...]}`` or from repeated ``variant_id``/``quantity`` form
+    fields. Repeated variants are summed. Raises ValueError on bad input.
+    """
+    if request.content_type == 'application/json':
+        items = json.loads(request.body or b'{}').get('items', [])
+        pairs = [(item['variant_id'], item.get('quantity', 1)) for item in items]
+    else:
+        pairs = zip(request.POST.getlist('variant_id'), request.POST.getlist('quantity'))
+    lines = Counter()
+    for variant_id, quantity in pairs:
+        quantity = int(quantity)
+        if quantity <= 0:
+            raise ValueError('Quantities must be positive')
+        lines[int(variant_id)] += quantity
+    if not lines:
+        raise ValueError('No items given')
+    if len(lines) > BULK_ADD_MAX_LINES:
+        raise ValueError(f'At most {BULK_ADD_MAX_LINES} different items at once')
+    return lines
+
+
+def record_additions(request, added):
+    product_ids = ProductVariant.objects.filter(id__in=added).values_list('product_id', flat=True)
+    for product_id in product_ids:
+        events.record('add_to_cart', product_id=product_id, user=request.user, session_key=request.session.session_key)
+
+
+@require_POST
+def bulk_add_to_cart(request):
+    """Add several variants at once; nothing is added unless every line fits"""
+    try:
+        lines = parse_bulk_lines(request)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'message': 'Invalid items'}, status=400)
+    
+    cart = request.cart
+    addable, problems = carts.check_additions(cart, lines)
+    if problems:
+        return JsonResponse({
+            'success': False,
+            'message': 'Some items could not be added',
+            'errors': {str(pk): message for pk, message in problems.items()},
+        })
+    
+    cart.add_many(addable)
+    record_additions(request, addable)
+    
+    return JsonResponse({
+        'success': True,
+        'message': 'Products added to cart successfully',
+        'summary': cart.summary(),
+    })
+
+
 @login_required
+@require_POST
+def reorder(request, order_number):
+    """Put the items of a past order back in the cart, as far as stock allows"""
+    order = get_object_or_404(Order, order_number=order_number, customer__user=request.user)
+    lines = Counter()
+    for variant_id, quantity in order.items.values_list('product_variant_id', 'quantity'):
+        lines[variant_id] += quantity
+    
+    cart = request.cart
+    addable, problems = carts.check_additions(cart, lines)
+    if addable:
+        cart.add_many(addable)
+        record_additions(request, addable)
+    
+    return JsonResponse({
+        'success': bool(addable),
+        'message': 'Order items added to cart' if addable else 'None of these items are available',
+        'added': {str(pk): quantity for pk, quantity in addable.items()},
+        'errors': {str(pk): message for pk, message in problems.items()},
+        'summary': cart.summary(),
+    })
+
+
 def cart_view(request):
     """Shopping cart page"""
-    try:
-        customer = Customer.objects.get(user=request.user)
-        cart = Cart.objects.get(customer=customer)
-        cart_items = cart.items.select_related(
-            'product_variant__product',
-            'product_variant__color',
-            'product_variant__size'
-        )
-    except (Customer.DoesNotExist, Cart.DoesNotExist):
-        cart_items = []
-        cart = None
+    cart = request.cart
+    cart_items = cart.items()
     
     # Calculate totals
     subtotal = sum(item.total_price for item in cart_items)
@@ -391,7 +454,6 @@ def cart_view(request):
     return render(request, 'cart.html', context)
 
 
-@login_required
 @require_POST
 def update_cart(request):
     """Update cart item quantity"""
@@ -399,10 +461,11 @@ def update_cart(request):
         item_id = request.POST.get('item_id')
         quantity = int(request.POST.get('quantity', 1))
         
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__customer__user=request.user)
+        cart = request.cart
+        cart_item = cart.get_item(item_id)
         
         if quantity <= 0:
-            cart_item.delete()
+            cart.remove(cart_item)
             return JsonResponse({'success': True, 'message': 'Item removed from cart'})
         
         if quantity > cart_item.product_variant.stock_quantity:
@@ -411,12 +474,11 @@ def update_cart(request):
                 'message': f'Only {cart_item.product_variant.stock_quantity} items available'
             })
         
-        cart_item.quantity = quantity
-        cart_item.save()
+        cart.set_quantity(cart_item, quantity)
         
         # Recalculate totals
-        cart = cart_item.cart
-        subtotal = sum(item.total_price for item in cart.items.all())
+        summary = cart.summary()
+        subtotal = summary['subtotal']
         shipping_cost = Decimal('5.00') if subtotal < 50 else Decimal('0.00')
         total = subtotal + shipping_cost
         
@@ -427,21 +489,20 @@ def update_cart(request):
             'subtotal': subtotal,
             'shipping_cost': shipping_cost,
             'total': total,
-            'cart_count': cart.total_items
+            'cart_count': summary['count']
         })
         
     except Exception as e:
         return JsonResponse({'success': False, 'message': 'An error occurred'})
 
 
-@login_required
 @require_POST
 def remove_from_cart(request):
     """Remove item from cart"""
     try:
         item_id = request.POST.get('item_id')
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__customer__user=request.user)
-        cart_item.delete()
+        cart = request.cart
+        cart.remove(cart.get_item(item_id))
         
         return JsonResponse({'success': True, 'message': 'Item removed from cart'})
         
@@ -452,20 +513,11 @@ def remove_from_cart(request):
 @login_required
 def checkout(request):
     """Checkout page"""
-    try:
-        customer = Customer.objects.get(user=request.user)
-        cart = Cart.objects.get(customer=customer)
-        cart_items = cart.items.select_related(
-            'product_variant__product',
-            'product_variant__color',
-            'product_variant__size'
-        )
-        
-        if not cart_items:
-            messages.error(request, 'Your cart is empty')
-            return redirect('ecommerce:cart')
-            
-    except (Customer.DoesNotExist, Cart.DoesNotExist):
+    # Customer and cart come from one joined query (CartMiddleware)
+    customer = request.customer
+    cart_items = request.cart.items()
+    
+    if not customer or not cart_items:
         messages.error(request, 'Your cart is empty')
         return redirect('ecommerce:cart')
     
@@ -477,7 +529,9 @@ def checkout(request):
     tax_rate = Decimal('0.08')  # 8% tax
     tax_amount = subtotal * tax_rate
     shipping_cost = Decimal('5.00') if subtotal < 50 else Decimal('0.00')
-    total = subtotal + tax_amount + shipping_cost
+    promotion_lines = promotions.cart_lines(cart_items)
+    automatic = promotions.evaluate(promotion_lines)
+    total = subtotal + tax_amount + shipping_cost - automatic.discount
     
     if request.method == 'POST':
         # Process checkout
@@ -492,80 +546,77 @@ def checkout(request):
                 billing_address = customer.addresses.get(id=billing_address_id)
                 shipping_address = customer.addresses.get(id=shipping_address_id)
                 
-                # Apply coupon if provided
-                discount_amount = Decimal('0.00')
-                if coupon_code:
-                    try:
-                        coupon = Coupon.objects.get(code=coupon_code)
-                        if coupon.is_valid() and subtotal >= coupon.minimum_order_amount:
-                            if coupon.discount_type == 'percentage':
-                                discount_amount = subtotal * (coupon.discount_value / 100)
-                                if coupon.maximum_discount_amount:
-                                    discount_amount = min(discount_amount, coupon.maximum_discount_amount)
-                            else:
-                                discount_amount = coupon.discount_value
-                            
-                            # Update coupon usage
-                            coupon.used_count += 1
-                            coupon.save()
-                        else:
-                            messages.error(request, 'Invalid or expired coupon code')
-                    except Coupon.DoesNotExist:
-                        messages.error(request, 'Invalid coupon code')
+                # IMMEDIATE lock: the whole order is written under one write lock
+                with database.atomic('checkout'):
+                    # Best automatic promotion or entered code, one use claimed
+                    evaluation = promotions.redeem(promotion_lines, coupon_code)
+                    if evaluation.error:
+                        messages.error(request, evaluation.error)
+                    discount_amount = evaluation.discount
                 
-                # Recalculate total with discount
-                final_total = subtotal + tax_amount + shipping_cost - discount_amount
+                    # Recalculate total with discount
+                    final_total = subtotal + tax_amount + shipping_cost - discount_amount
                 
-                # Create order
-                order = Order.objects.create(
-                    customer=customer,
-                    billing_address={
-                        'first_name': billing_address.first_name,
-                        'last_name': billing_address.last_name,
-                        'address_line_1': billing_address.address_line_1,
-                        'address_line_2': billing_address.address_line_2,
-                        'city': billing_address.city,
-                        'state': billing_address.state,
-                        'postal_code': billing_address.postal_code,
-                        'country': billing_address.country,
-                    },
-                    shipping_address={
-                        'first_name': shipping_address.first_name,
-                        'last_name': shipping_address.last_name,
-                        'address_line_1': shipping_address.address_line_1,
-                        'address_line_2': shipping_address.address_line_2,
-                        'city': shipping_address.city,
-                        'state': shipping_address.state,
-                        'postal_code': shipping_address.postal_code,
-                        'country': shipping_address.country,
-                    },
-                    subtotal=subtotal,
-                    tax_amount=tax_amount,
-                    shipping_cost=shipping_cost,
-                    discount_amount=discount_amount,
-                    total_amount=final_total
-                )
-                
-                # Create order items
-                for cart_item in cart_items:
-                    OrderItem.objects.create(
-                        order=order,
-                        product_variant=cart_item.product_variant,
-                        product_name=cart_item.product_variant.product.name,
-                        product_sku=cart_item.product_variant.sku,
-                        color_name=cart_item.product_variant.color.name,
-                        size_name=cart_item.product_variant.size.name,
-                        quantity=cart_item.quantity,
-                        unit_price=cart_item.product_variant.final_price
+                    # Create order
+                    order = Order.objects.create(
+                        customer=customer,
+                        billing_address={
+                            'first_name': billing_address.first_name,
+                            'last_name': billing_address.last_name,
+                            'address_line_1': billing_address.address_line_1,
+                            'address_line_2': billing_address.address_line_2,
+                            'city': billing_address.city,
+                            'state': billing_address.state,
+                            'postal_code': billing_address.postal_code,
+                            'country': billing_address.country,
+                        },
+                        shipping_address={
+                            'first_name': shipping_address.first_name,
+                            'last_name': shipping_address.last_name,
+                            'address_line_1': shipping_address.address_line_1,
+                            'address_line_2': shipping_address.address_line_2,
+                            'city': shipping_address.city,
+                            'state': shipping_address.state,
+                            'postal_code': shipping_address.postal_code,
+                            'country': shipping_address.country,
+                        },
+                        subtotal=subtotal,
+                        tax_amount=tax_amount,
+                        shipping_cost=shipping_cost,
+                        discount_amount=discount_amount,
+                        total_amount=final_total
                     )
+                
+                    # Create order items
+                    units_sold = Counter()
+                    for cart_item in cart_items:
+                        OrderItem.objects.create(
+                            order=order,
+                            product_variant=cart_item.product_variant,
+                            product_name=cart_item.product_variant.product.name,
+                            product_sku=cart_item.product_variant.sku,
+                            color_name=cart_item.product_variant.color.name,
+                            size_name=cart_item.product_variant.size.name,
+                            quantity=cart_item.quantity,
+                            unit_price=cart_item.product_variant.final_price
+                        )
+                    
+                        # Update stock; F() so a concurrent checkout can't be overwritten
+                        ProductVariant.objects.filter(pk=cart_item.product_variant_id).update(
+                            stock_quantity=F('stock_quantity') - cart_item.quantity
+                        )
+                        units_sold[cart_item.product_variant.product_id] += cart_item.quantity
                     
-                    # Update stock
-                    variant = cart_item.product_variant
-                    variant.stock_quantity -= cart_item.quantity
-                    variant.save()
+                    popularity.record_sales(units_sold)
+                    availability.refresh(units_sold)
+                    analytics.record_order(order)
+                    
+                    # Enqueued in the same transaction; run by the run_tasks worker
+                    tasks.send_order_confirmation.delay(order.id)
+                    tasks.update_recommendations.delay()
                 
-                # Clear cart
-                cart_items.delete()
+                    # Clear cart
+                    request.cart.clear()
                 
                 messages.success(request, f'Order {order.order_number} placed successfully!')
                 return redirect('ecommerce:order_success', order_number=order.order_number)
@@ -579,6 +630,8 @@ def checkout(request):
         'subtotal': subtotal,
         'tax_amount': tax_amount,
         'shipping_cost': shipping_cost,
+        'discount_amount': automatic.discount,
+        'promotion': automatic.promotion,
         'total': total,
     }
     
@@ -598,6 +651,7 @@ def order_success(request, order_number):
 
 
 @login_required
+@rate_limit('apply_coupon')
 def apply_coupon(request):
     """Apply coupon code via AJAX"""
     if request.method == 'POST':
@@ -606,39 +660,32 @@ def apply_coupon(request):
         if not coupon_code:
             return JsonResponse({'success': False, 'message': 'Please enter a coupon code'})
         
-        try:
-            coupon = Coupon.objects.get(code=coupon_code)
-            customer = Customer.objects.get(user=request.user)
-            cart = Cart.objects.get(customer=customer)
-            
-            subtotal = sum(item.total_price for item in cart.items.all())
-            
-            if not coupon.is_valid():
-                return JsonResponse({'success': False, 'message': 'Invalid or expired coupon code'})
-            
-            if subtotal < coupon.minimum_order_amount:
-                return JsonResponse({
-                    'success': False, 
-                    'message': f'Minimum order amount is ${coupon.minimum_order_amount}'
-                })
-            
-            # Calculate discount
-            if coupon.discount_type == 'percentage':
-                discount_amount = subtotal * (coupon.discount_value / 100)
-                if coupon.maximum_discount_amount:
-                    discount_amount = min(discount_amount, coupon.maximum_discount_amount)
-            else:
-                discount_amount = coupon.discount_value
-            
+        # Unknown and expired codes are turned away before any cart work
+        error = promotions.check_code(coupon_code)
+        if error:
+            return JsonResponse({'success': False, 'message': error})
+        
+        items = request.cart.items()
+        if not items:
+            return JsonResponse({'success': False, 'message': 'Invalid coupon code'})
+        
+        evaluation = promotions.evaluate(promotions.cart_lines(items), coupon_code)
+        if evaluation.error:
+            return JsonResponse({'success': False, 'message': evaluation.error})
+        
+        # Discounts don't stack; an automatic promotion may beat the code
+        if evaluation.promotion is None or evaluation.promotion.code != coupon_code:
             return JsonResponse({
-                'success': True,
-                'message': 'Coupon applied successfully',
-                'discount_amount': discount_amount,
-                'coupon_description': coupon.description
+                'success': False,
+                'message': 'Your cart already has a better automatic offer, so this code was not applied',
             })
-            
-        except (Coupon.DoesNotExist, Customer.DoesNotExist, Cart.DoesNotExist):
-            return JsonResponse({'success': False, 'message': 'Invalid coupon code'})
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Coupon applied successfully',
+            'discount_amount': evaluation.discount,
+            'coupon_description': evaluation.promotion.description
+        })
     
     return JsonResponse({'success': False, 'message': 'Invalid request'})
 
@@ -670,4 +717,95 @@ def get_variant_info(request):
         })
         
     except ProductVariant.DoesNotExist:
-        return JsonResponse({'success': False, 'message': 'Variant not available'})
\ No newline at end of file
+        return JsonResponse({'success': False, 'message': 'Variant not available'})
+
+
+def product_reviews(request, product_id):
+    """Keyset-paginated approved reviews as JSON"""
+    sort = request.GET.get('sort', reviews.DEFAULT_SORT)
+    try:
+        review_page, next_cursor = reviews.page(product_id, sort, request.GET.get('cursor'))
+    except (signing.BadSignature, ValueError, TypeError):
+        return JsonResponse({'success': False, 'message': 'Invalid cursor'}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'reviews': [reviews.as_json(review) for review in review_page],
+        'next': next_cursor,
+    })
+
+
+@require_POST
+def mark_review_helpful(request, review_id):
+    """Count a helpful vote, once per visitor session"""
+    voted = request.session.get('helpful_reviews', [])
+    if review_id in voted:
+        return JsonResponse({'success': False, 'message': 'You already marked this review as helpful'})
+    
+    if not Review.objects.filter(id=review_id, is_approved=True).update(helpful_count=F('helpful_count') + 1):
+        return JsonResponse({'success': False, 'message': 'Review not found'}, status=404)
+    # Bounded so the session stays small
+    request.session['helpful_reviews'] = (voted + [review_id])[-500:]
+    
+    return JsonResponse({'success': True, 'message': 'Thanks for your feedback'})
+
+
+@login_required
+@require_POST
+def notify_back_in_stock(request, variant_id):
+    """Email the customer when a sold-out variant is restocked"""
+    variant = get_object_or_404(ProductVariant, id=variant_id, is_active=True, product__is_active=True)
+    if variant.stock_quantity > 0:
+        return JsonResponse({'success': False, 'message': 'This item is in stock'})
+    
+    alerts.subscribe(request.user, variant=variant)
+    return JsonResponse({'success': True, 'message': "We'll email you when it's back in stock"})
+
+
+@login_required
+@require_POST
+def notify_price_drop(request, product_id):
+    """Email the customer when the product's price goes down"""
+    product = get_object_or_404(Product, id=product_id, is_active=True)
+    alerts.subscribe(request.user, product=product)
+    return JsonResponse({'success': True, 'message': "We'll email you if the price drops"})
+
+
+def autocomplete(request):
+    """Search-box suggestions for a partly typed query"""
+    query = request.GET.get('q', '')[:100]
+    return JsonResponse({'query': query, 'suggestions': typeahead.complete(query)})
+
+
+def newsletter_unsubscribe(request, token):
+    """One-click unsubscribe link from newsletter emails"""
+    try:
+        email = newsletter.unsubscribe_email(token)
+    except signing.BadSignature:
+        email = None
+    
+    if email:
+        Newsletter.objects.update_or_create(email=email, defaults={'is_active': False})
+        Customer.objects.filter(user__email=email).update(newsletter_subscription=False)
+    
+    return render(request, 'newsletter_unsubscribed.html', {'email': email})
+
+
+@staff_member_required
+def cache_metrics(request):
+    """Cache hit/miss/eviction/latency counters for this worker process"""
+    if not hasattr(cache, 'stats'):
+        return JsonResponse({'success': False, 'message': 'Cache backend keeps no statistics'})
+    return JsonResponse(cache.stats())
+
+
+@staff_member_required
+def task_metrics(request):
+    """Per-queue depth, lag, throughput and failures of the background task queue"""
+    return JsonResponse(taskqueue.queue_stats())
+
+
+@staff_member_required
+def event_metrics(request):
+    """Event buffer depth and write/drop counters for this worker process"""
+    return JsonResponse(events.buffer.stats())
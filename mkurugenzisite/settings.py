@@ -26,15 +26,18 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.humanize',
     'ecommerce',
 ]
 
 MIDDLEWARE = [
+    'ecommerce.routers.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ecommerce.carts.CartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -58,6 +61,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'mkurugenzisite.wsgi.application'
 
+# Serve the AJAX endpoints from ecommerce.async_views (see settings_asgi)
+ASYNC_AJAX_VIEWS = False
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -66,7 +72,167 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Local read replica, kept in sync by `manage.py sync_replicas`
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db-replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['ecommerce.routers.PrimaryReplicaRouter']
+
+# Aliases that catalog and report reads are spread over; add 'replica'
+# once sync_replicas has run. Empty sends every read to default.
+DATABASE_REPLICAS = []
+
+# How long a browser keeps reading from the primary after it writes
+REPLICA_PIN_SECONDS = 10
+
+# Applied by ecommerce.database on every new SQLite connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64 * 1024,  # negative means KiB, so 64 MiB
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Lock mode for the outermost BEGIN of ecommerce.database.atomic(purpose)
+SQLITE_TRANSACTION_MODES = {
+    'checkout': 'IMMEDIATE',
+    'recommendations': 'IMMEDIATE',
+    'popularity': 'IMMEDIATE',
+}
+
+
+# Cache
+# 'default' is a per-process LRU (L1) in front of 'shared' (L2), which every
+# worker on the host sees. Namespaces are the first ':' part of the key.
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'ecommerce.cache.TwoTierCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'POLL_INTERVAL': 1.0,
+            'NAMESPACES': {
+                'catalog': {'timeout': 600, 'l1_timeout': 60, 'max_bytes': 16 * 1024 * 1024},
+                'cart': {'timeout': 120, 'l1_timeout': 5, 'max_bytes': 4 * 1024 * 1024},
+            },
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+
+# Per-cart summary (count, subtotal) cache in the 'cart' namespace; 0 disables
+CART_SUMMARY_CACHE_SECONDS = 60
+
+
+# Best-selling and trending sorts (ecommerce.popularity)
+POPULARITY = {
+    'SALES_HALF_LIFE_DAYS': 30,
+    'TREND_HALF_LIFE_DAYS': 3,
+    # A unit sold counts as much as this many product views
+    'TREND_SALE_WEIGHT': 10,
+    'TREND_VIEW_WEIGHT': 1,
+}
+
+# Buffered storefront event ingestion (ecommerce.events)
+EVENTS = {
+    'BATCH_SIZE': 500,
+    'FLUSH_SECONDS': 5,
+    # Per worker; the oldest events are dropped beyond this
+    'MAX_BUFFERED': 20000,
+    # Raw rows older than this are removed by prune_events; hourly rollups stay
+    'RAW_RETENTION_DAYS': 30,
+}
+
+
+# Background task queue (ecommerce.taskqueue); workers: manage.py run_tasks
+TASKS = {
+    # Run tasks inline at delay() instead of queueing them
+    'EAGER': False,
+    'BACKOFF_SECONDS': 10,
+    'BACKOFF_MAX_SECONDS': 3600,
+    # Running tasks older than this are assumed orphaned and requeued
+    'LOCK_TIMEOUT_SECONDS': 900,
+    'KEEP_DONE_DAYS': 7,
+}
+
+
+# Newsletter delivery (ecommerce.newsletter); manage.py send_newsletter
+NEWSLETTER = {
+    'FROM_EMAIL': 'newsletter@mkurugenzi.com',
+    # Prefix for the absolute unsubscribe links in emails
+    'SITE_URL': 'http://localhost:8000',
+    'WORKERS': 4,
+    'BATCH_SIZE': 500,
+    # Across all workers; 0 disables the limit
+    'RATE_PER_SECOND': 20,
+}
+
+
+# Back-in-stock and price-drop emails (ecommerce.alerts)
+ALERTS = {
+    'FROM_EMAIL': 'alerts@mkurugenzi.com',
+    # Subscribers per deliver_alerts job
+    'BATCH_SIZE': 500,
+}
+
+
+# Search-box autocomplete (ecommerce.typeahead); manage.py rebuild_typeahead
+TYPEAHEAD = {
+    # Memory-mapped by every worker; replaced atomically on refresh
+    'PATH': BASE_DIR / 'cache' / 'typeahead.idx',
+    # How often a worker checks whether the file was replaced
+    'CHECK_SECONDS': 5,
+    # Catalog edits within this window share one refresh
+    'DEBOUNCE_SECONDS': 30,
+}
+
+
+# Storefront search (ecommerce.search); manage.py warm_search_cache
+SEARCH = {
+    # Cached listings live in the shared alias, not the two-tier default
+    'CACHE': 'shared',
+    'CACHE_SECONDS': 600,
+    # Local hours at which the most searched queries are precomputed
+    'WARM_HOURS': [6, 16],
+    'WARM_TOP': 300,
+    'WARM_DAYS': 7,
+    # Below this many exact matches, typo-tolerant matches are added
+    'FUZZY_MIN_RESULTS': 3,
+    # Trigram similarity (0-1) a catalog word needs to stand in for a query word
+    'FUZZY_THRESHOLD': 0.4,
+    'FUZZY_MAX_WORDS': 5,
+    # Catalog words tried per query word
+    'FUZZY_MAX_CORRECTIONS': 3,
+    # Bounds on candidate generation per query word
+    'FUZZY_MAX_POSTINGS': 20000,
+    'FUZZY_MAX_CANDIDATES': 200,
+    # Most popular products, brands and categories kept from a fuzzy match
+    'FUZZY_MAX_MATCHES': 1000,
+}
+
+
+# Token buckets for brute-forceable endpoints (ecommerce.ratelimit)
+RATE_LIMITS = {
+    # Must be a cache every worker shares
+    'CACHE': 'shared',
+    'BUCKETS': {
+        # Bursts of 10 coupon attempts, then one every 5 seconds
+        'apply_coupon': {'capacity': 10, 'refill_per_second': 0.2},
+    },
 }
 
 
@@ -110,6 +276,19 @@ STATICFILES_DIRS = [
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL ='/media/'
 
+# File serving (ecommerce.serving) when DEBUG is off
+# 'python' streams from Django (zero-copy via wsgi.file_wrapper where the
+# server supports it); 'x-accel-redirect' (nginx) and 'x-sendfile'
+# (Apache/lighttpd) hand the file to the front proxy instead.
+FILE_SERVE_BACKEND = 'python'
+FILE_SERVE_ACCEL_PREFIXES = {
+    'media': '/protected/media/',
+    'static': '/protected/static/',
+}
+# Cache lifetime for files without a content hash in their name
+FILE_SERVE_MAX_AGE = 60 * 60
+FILE_SERVE_BLOCK_SIZE = 64 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,15 @@
+"""
+ASGI deployment profile for mkurugenzisite.
+
+Run with an ASGI server, e.g.::
+
+    uvicorn mkurugenzisite.asgi:application --workers 4
+
+Every middleware in MIDDLEWARE is async-capable, so the async AJAX views
+run on the event loop and only ORM calls hop onto a thread.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+
+ASYNC_AJAX_VIEWS = True
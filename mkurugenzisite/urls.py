@@ -1,9 +1,10 @@
-# Only for development
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path , include
 
+from ecommerce.serving import file_patterns
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -14,4 +15,12 @@ urlpatterns = [
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-
+else:
+    urlpatterns += file_patterns(
+        settings.MEDIA_URL, settings.MEDIA_ROOT,
+        accel_prefix=settings.FILE_SERVE_ACCEL_PREFIXES['media'],
+    )
+    urlpatterns += file_patterns(
+        settings.STATIC_URL, settings.STATIC_ROOT,
+        accel_prefix=settings.FILE_SERVE_ACCEL_PREFIXES['static'],
+    )